@@ -0,0 +1,48 @@
+import asyncio, threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Optional
+
+# One long-lived event loop on a daemon thread. Async clients (LLM, HTTP)
+# are bound to it so their connection pools survive across jobs, while the
+# synchronous build code on worker threads can still drive them.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+def loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            t = threading.Thread(target=_loop.run_forever, name="aio-loop", daemon=True)
+            t.start()
+        return _loop
+
+def spawn(coro: Awaitable[Any]) -> Future:
+    """Schedule a coroutine on the shared loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coro, loop())
+
+def run(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared loop and block the calling thread for its result."""
+    lp = loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is lp:
+        raise RuntimeError("aio.run() called from the shared loop; await the coroutine instead")
+    fut = asyncio.run_coroutine_threadsafe(coro, lp)
+    try:
+        return fut.result(timeout)
+    except BaseException:
+        fut.cancel()
+        raise
+
+async def gather_or_cancel(*aws: Awaitable[Any]) -> list:
+    """Like asyncio.gather, but cancels the siblings as soon as one fails."""
+    tasks = [asyncio.ensure_future(a) for a in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
@@ -0,0 +1,222 @@
+"""
+Bulk task submission: a JSONL stream of TaskRequest records (one per line) is
+authenticated once for the whole batch, validated line by line as it is read,
+and fanned out to the job scheduler with at most `parallel` records in flight.
+Per-record results are yielded as they finish (served as NDJSON by
+POST /tasks/batch), followed by one summary line.
+
+CLI:
+    python -m api.batch tasks.jsonl --url http://localhost:7860 --secret ...   # via /tasks/batch
+    python -m api.batch tasks.jsonl --local --parallel 4                       # in-process
+"""
+import asyncio, json, sys
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Tuple
+from pydantic import ValidationError
+from .models import TaskRequest
+from .pipeline import submit_task, release_attachments, durable, job_info
+from .scheduler import scheduler, QueueFull
+from .settings import settings
+
+class BatchError(Exception):
+    pass
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line: int) -> AsyncIterator[Tuple[int, bytes]]:
+    """(line number, raw line) for every non-blank line; lines are never buffered beyond max_line."""
+    buf = bytearray()
+    n = 0
+    async for chunk in chunks:
+        scan = len(buf)
+        buf += chunk
+        i = buf.find(b"\n", scan)
+        while i >= 0:
+            line = bytes(buf[:i])
+            del buf[:i + 1]
+            n += 1
+            if line.strip():
+                yield n, line
+            i = buf.find(b"\n")
+        if len(buf) > max_line:
+            raise BatchError(f"line {n + 1} exceeds {max_line} bytes")
+    if buf.strip():
+        yield n + 1, bytes(buf)
+
+def parse_record(raw: bytes, secret: str) -> TaskRequest:
+    """The batch was authenticated once; records inherit its secret instead of carrying one."""
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("record must be a JSON object")
+    data["secret"] = secret
+    return TaskRequest.model_validate(data)
+
+async def _execute(n: int, raw: bytes, secret: str) -> Dict[str, Any]:
+    rec: Dict[str, Any] = {"line": n}
+    try:
+        req = parse_record(raw, secret)
+    except ValidationError as e:
+        rec.update(status="invalid", error=e.errors(include_url=False, include_context=False, include_input=False))
+        return rec
+    except ValueError as e:
+        rec.update(status="invalid", error=str(e))
+        return rec
+    rec.update(task=req.task, round=req.round, nonce=req.nonce)
+
+    while True:
+        try:
+            outcome, job_id, result = await asyncio.to_thread(submit_task, req)
+            break
+        except QueueFull:
+            await asyncio.sleep(0.5)  # backpressure: wait for a slot rather than rejecting
+    rec["job_id"] = job_id
+    if outcome != "new":
+        release_attachments(req)
+        rec["duplicate"] = outcome
+    if outcome == "completed":
+        rec.update(status="done", result=result)
+        return rec
+
+    info = await _wait(job_id)
+    if info is None:
+        rec.update(status="unknown", error="job no longer tracked")
+        return rec
+    rec["status"] = info["status"]
+    for k in ("error", "result"):
+        if info.get(k):
+            rec[k] = info[k]
+    return rec
+
+async def _wait(job_id: str) -> Optional[Dict[str, Any]]:
+    if not durable():
+        job = scheduler.get(job_id)
+        if job is not None:
+            # woken from the job's worker thread; no executor thread parked per record
+            loop = asyncio.get_running_loop()
+            finished = loop.create_future()
+            job.add_done_callback(lambda _: loop.call_soon_threadsafe(
+                lambda: finished.done() or finished.set_result(None)))
+            await finished
+        return job_info(job_id)
+    while True:  # run by another process: poll the queue
+        info = job_info(job_id)
+        if info is None or info["status"] not in ("queued", "running"):
+            return info
+        await asyncio.sleep(settings.TASK_POLL_S)
+
+async def run_batch(chunks: AsyncIterator[bytes], secret: str,
+                    parallel: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield one result dict per record as it finishes, then {"summary": {...}}."""
+    parallel = max(1, min(parallel or settings.BATCH_PARALLEL, settings.BATCH_MAX_PARALLEL))
+    out: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(parallel)
+    summary: Dict[str, Any] = {"records": 0}
+
+    async def one(n: int, raw: bytes):
+        try:
+            rec = await _execute(n, raw, secret)
+        except Exception as e:
+            rec = {"line": n, "status": "error", "error": str(e)}
+        finally:
+            slots.release()
+        await out.put(rec)
+
+    async def feed():
+        running = set()
+        try:
+            async for n, raw in iter_lines(chunks, settings.MAX_TASK_BODY_BYTES):
+                await slots.acquire()  # don't read further ahead than we can run
+                t = asyncio.create_task(one(n, raw))
+                running.add(t)
+                t.add_done_callback(running.discard)
+        except BatchError as e:
+            summary["error"] = str(e)
+        finally:
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            await out.put(None)
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            rec = await out.get()
+            if rec is None:
+                break
+            summary["records"] += 1
+            summary[rec["status"]] = summary.get(rec["status"], 0) + 1
+            yield rec
+        yield {"summary": summary}
+    finally:
+        feeder.cancel()
+
+async def ndjson(records: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for rec in records:
+        yield (json.dumps(rec) + "\n").encode("utf-8")
+
+# ---------- CLI ----------
+def _file_chunks(path: str, size: int = 1 << 16) -> Iterable[bytes]:
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+async def _local(path: str, parallel: Optional[int]) -> int:
+    from . import notifier
+
+    async def chunks():
+        for c in _file_chunks(path):
+            yield c
+
+    if not durable():
+        scheduler.start()
+        notifier.service.start()
+    failed = 0
+    try:
+        async for rec in run_batch(chunks(), settings.EXPECTED_SECRET, parallel):
+            print(json.dumps(rec), flush=True)
+            if rec.get("status") not in (None, "done"):
+                failed += 1
+    finally:
+        scheduler.stop()
+    return failed
+
+def _remote(path: str, url: str, secret: str, parallel: Optional[int]) -> int:
+    import httpx
+    params = {"parallel": parallel} if parallel else {}
+    failed = 0
+    with httpx.Client(timeout=httpx.Timeout(30, read=None)) as client:
+        with client.stream("POST", url.rstrip("/") + "/tasks/batch", params=params,
+                           content=_file_chunks(path),
+                           headers={"X-Batch-Secret": secret, "Content-Type": "application/x-ndjson"}) as r:
+            if r.status_code != 200:
+                r.read()
+                print(f"HTTP {r.status_code}: {r.text}", file=sys.stderr)
+                return 1
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                print(line, flush=True)
+                if json.loads(line).get("status") not in (None, "done"):
+                    failed += 1
+    return failed
+
+def main(argv=None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Submit a JSONL file of TaskRequests as one batch.")
+    ap.add_argument("file", help="JSONL of TaskRequest records ('-' for stdin)")
+    ap.add_argument("--url", default="http://localhost:7860", help="API base URL")
+    ap.add_argument("--secret", default=settings.EXPECTED_SECRET, help="batch secret (X-Batch-Secret)")
+    ap.add_argument("--parallel", type=int, default=None, help="records in flight")
+    ap.add_argument("--local", action="store_true", help="run in this process instead of calling the API")
+    args = ap.parse_args(argv)
+    if args.local:
+        failed = asyncio.run(_local(args.file, args.parallel))
+    else:
+        failed = _remote(args.file, args.url, args.secret, args.parallel)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
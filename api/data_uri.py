@@ -1,14 +1,105 @@
-import base64, re
-from typing import Tuple
-
-DATA_URI_RE = re.compile(r"^data:([^;]+);base64,(.+)$", re.IGNORECASE)
+import base64, binascii, shutil, tempfile
+from typing import IO, Optional, Tuple
+from .settings import settings
 
 class DataUriError(Exception):
     pass
 
+class AttachmentTooLarge(DataUriError):
+    pass
+
+def _header_mime(head: str) -> str:
+    """MIME type from a `data:<mime>;base64` header (the part before the comma)."""
+    if head[:5].lower() != "data:" or head[-7:].lower() != ";base64":
+        raise DataUriError("Unsupported data URI")
+    mime = head[5:-7]
+    if not mime or ";" in mime or "," in mime:
+        raise DataUriError("Unsupported data URI")
+    return mime
+
 def decode_data_uri(uri: str) -> Tuple[str, bytes]:
-    m = DATA_URI_RE.match(uri)
-    if not m:
+    # partition, not a regex: the payload can be megabytes and is only sliced once
+    head, sep, b64 = uri.partition(",")
+    if not sep or not b64:
         raise DataUriError("Unsupported data URI")
-    mime, b64 = m.groups()
-    return mime, base64.b64decode(b64)
+    return _header_mime(head), base64.b64decode(b64)
+
+def new_spool() -> IO[bytes]:
+    return tempfile.SpooledTemporaryFile(max_size=settings.SPOOL_MEM_BYTES, prefix="attach-")
+
+class DataUriDecoder:
+    """
+    Incremental data-URI decoder: feed the URI text in pieces, get the decoded bytes
+    in a spooled temp file. Memory stays bounded by SPOOL_MEM_BYTES plus one chunk.
+    `budget` is called with the number of new decoded bytes and may raise to stop.
+    """
+    _HEADER_MAX = 256
+
+    def __init__(self, limit: int = 0, budget=None):
+        self.limit = limit
+        self.budget = budget
+        self.mime = ""
+        self.size = 0
+        self.file = new_spool()
+        self._header: Optional[str] = ""
+        self._pending = ""
+
+    def write(self, text: str) -> None:
+        if self._header is not None:
+            self._header += text
+            head, sep, rest = self._header.partition(",")
+            if not sep:
+                if len(self._header) > self._HEADER_MAX:
+                    raise DataUriError("Unsupported data URI")
+                return
+            self.mime = _header_mime(head)
+            self._header = None
+            text = rest
+        data = self._pending + text
+        if any(c in data for c in " \t\r\n"):
+            data = "".join(data.split())
+        cut = len(data) - len(data) % 4
+        self._pending = data[cut:]
+        if cut:
+            self._emit(data[:cut])
+
+    def close(self) -> IO[bytes]:
+        if self._header is not None:
+            raise DataUriError("Unsupported data URI")
+        if self._pending:
+            self._emit(self._pending + "=" * (-len(self._pending) % 4))
+            self._pending = ""
+        if self.size == 0:
+            raise DataUriError("Unsupported data URI")
+        self.file.seek(0)
+        return self.file
+
+    def discard(self) -> None:
+        self.file.close()
+
+    def _emit(self, b64: str) -> None:
+        try:
+            chunk = base64.b64decode(b64)
+        except (binascii.Error, ValueError):
+            raise DataUriError("Invalid base64 in data URI")
+        self.size += len(chunk)
+        if self.limit and self.size > self.limit:
+            raise AttachmentTooLarge(f"attachment exceeds {self.limit} bytes")
+        if self.budget:
+            self.budget(len(chunk))
+        self.file.write(chunk)
+
+def decode_data_uri_to_file(uri: str, limit: int = 0, chunk_chars: int = 1 << 20) -> Tuple[str, IO[bytes]]:
+    """Chunked decode of an in-memory data URI into a spooled file (no second full copy)."""
+    dec = DataUriDecoder(limit)
+    try:
+        for i in range(0, len(uri), chunk_chars):
+            dec.write(uri[i:i + chunk_chars])
+        return dec.mime, dec.close()
+    except Exception:
+        dec.discard()
+        raise
+
+def copy_to(src: IO[bytes], dst: IO[bytes]) -> None:
+    src.seek(0)
+    shutil.copyfileobj(src, dst, 1 << 16)
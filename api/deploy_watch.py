@@ -0,0 +1,184 @@
+import asyncio, random, time
+from typing import Callable, Dict, List, Optional, Tuple
+from .settings import settings
+from .metrics import observe, gauge
+from . import aio
+
+# Deployment readiness for evaluator notifications. A pages_url handed out
+# right after the push 404s until the Pages workflow has built it, so gated
+# notifications wait here until the latest Pages build is "built" for the
+# pushed commit (or has errored, or the deadline passed) and only then go out.
+#   - one poller on the shared aio loop for every in-flight repo, over one
+#     pooled AsyncClient; each tick polls all due repos together, at most
+#     PAGES_POLL_BATCH requests at a time
+#   - a repo's interval grows from PAGES_POLL_MIN_S to PAGES_POLL_MAX_S, and
+#     its first poll is put off until about when recent builds finished
+#   - a rate-limit answer (429, or 403 with the limit used up) pauses the whole
+#     poller until it resets; any other 403 (no access, Pages disabled) stops
+#     waiting for that repo
+
+Outcome = str  # "live", "errored" or "timeout"
+
+class Deployment:
+    def __init__(self, owner: str, repo: str, sha: str, deadline: float, first_poll: float):
+        self.owner = owner
+        self.repo = repo
+        self.sha = sha
+        self.deadline = deadline
+        self.registered = time.time()
+        self.next_at = self.registered + first_poll
+        self.interval = settings.PAGES_POLL_MIN_S
+        self.polls = 0
+        self.last_status = ""
+        self.waiters: List[Callable[[Outcome], None]] = []
+
+def _owner_repo(repo_url: str) -> Optional[Tuple[str, str]]:
+    parts = repo_url.rstrip("/").removesuffix(".git").split("/")
+    return (parts[-2], parts[-1]) if len(parts) >= 2 and parts[-2] and parts[-1] else None
+
+class DeployWatcher:
+    def __init__(self):
+        # only touched on the aio loop
+        self._pending: Dict[Tuple[str, str, str], Deployment] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+        self._paused_until = 0.0
+        self._build_s: Optional[float] = None  # moving average of push -> live
+        self.counters = {"live": 0, "errored": 0, "timeout": 0, "polls": 0, "rate_limited": 0}
+
+    def enabled(self) -> bool:
+        return settings.PAGES_WAIT_ENABLED and bool(settings.GITHUB_TOKEN)
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=settings.GITHUB_API_URL.rstrip("/"),
+                headers={
+                    "Authorization": f"Bearer {settings.GITHUB_TOKEN}",
+                    "Accept": "application/vnd.github+json",
+                    "X-GitHub-Api-Version": "2022-11-28",
+                },
+                timeout=15,
+                limits=httpx.Limits(max_connections=settings.PAGES_POLL_BATCH,
+                                    max_keepalive_connections=settings.PAGES_POLL_BATCH),
+            )
+        return self._client
+
+    def watch(self, repo_url: str, commit_sha: str, deadline: float, on_ready: Callable[[Outcome], None]) -> None:
+        """
+        Call `on_ready(outcome)` on the aio loop once the Pages site of `repo_url`
+        serves `commit_sha`, its build errored, or `deadline` passed. Thread-safe.
+        """
+        aio.loop().call_soon_threadsafe(self._add, repo_url, commit_sha, deadline, on_ready)
+
+    def _add(self, repo_url: str, commit_sha: str, deadline: float, on_ready: Callable[[Outcome], None]) -> None:
+        target = _owner_repo(repo_url)
+        if target is None:
+            print(f"[deploy] can't tell the repo from {repo_url!r}; not waiting for Pages")
+            on_ready("timeout")
+            return
+        key = (*target, commit_sha)
+        d = self._pending.get(key)
+        if d is None:
+            first = max(settings.PAGES_POLL_MIN_S, 0.8 * (self._build_s or 0.0))
+            d = self._pending[key] = Deployment(*target, commit_sha, deadline, first)
+        d.deadline = max(d.deadline, deadline)
+        d.waiters.append(on_ready)
+        gauge("pages_pending", len(self._pending), "Deployments waited on before notifying")
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while self._pending:
+            now = time.time()
+            for d in [d for d in self._pending.values() if now >= d.deadline]:
+                self._finish(d, "timeout")
+            if now >= self._paused_until:
+                due = [d for d in self._pending.values() if d.next_at <= now]
+                if due:
+                    sem = asyncio.Semaphore(settings.PAGES_POLL_BATCH)
+                    for err in await asyncio.gather(*(self._poll(d, sem) for d in due), return_exceptions=True):
+                        if isinstance(err, Exception):
+                            print("[deploy] poll failed:", err)
+                    continue
+            if not self._pending:
+                break
+            wake_at = min(min(d.next_at, d.deadline) for d in self._pending.values())
+            wake_at = max(wake_at, self._paused_until)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, wake_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, d: Deployment, sem: asyncio.Semaphore) -> None:
+        async with sem:
+            if time.time() < self._paused_until:
+                return
+            d.polls += 1
+            self.counters["polls"] += 1
+            try:
+                r = await self._http().get(f"/repos/{d.owner}/{d.repo}/pages/builds/latest")
+            except Exception as e:
+                print(f"[deploy] polling {d.owner}/{d.repo} failed: {e}")
+                r = None
+        now = time.time()
+        limited = r is not None and (r.status_code == 429 or r.status_code == 403 and (
+            r.headers.get("x-ratelimit-remaining") == "0" or "retry-after" in r.headers))
+        if r is not None and r.status_code == 403 and not limited:
+            d.last_status = "HTTP 403"
+            self._finish(d, "errored")  # won't get better by waiting
+            return
+        if limited:
+            self.counters["rate_limited"] += 1
+            retry = r.headers.get("retry-after")
+            reset = r.headers.get("x-ratelimit-reset")
+            wait = float(retry) if retry else (float(reset) - now if reset else settings.PAGES_POLL_MAX_S)
+            self._paused_until = max(self._paused_until, now + min(max(wait, 1.0), 300.0))
+            print(f"[deploy] GitHub rate limit; pausing Pages polls for {self._paused_until - now:.0f}s")
+            d.next_at = self._paused_until
+            return
+        if r is not None and r.status_code == 200:
+            build = r.json()
+            commit = build.get("commit") or ""
+            d.last_status = build.get("status") or ""
+            if not d.sha or not commit or commit.startswith(d.sha) or d.sha.startswith(commit):
+                if d.last_status == "built":
+                    self._finish(d, "live")
+                    return
+                if d.last_status == "errored":
+                    self._finish(d, "errored")
+                    return
+        elif r is not None and r.status_code != 404:  # 404: Pages not set up / no build yet
+            d.last_status = f"HTTP {r.status_code}"
+        d.next_at = now + d.interval * random.uniform(0.9, 1.1)
+        d.interval = min(settings.PAGES_POLL_MAX_S, d.interval * 1.5)
+
+    def _finish(self, d: Deployment, outcome: Outcome) -> None:
+        if self._pending.pop((d.owner, d.repo, d.sha), None) is None:
+            return
+        waited = time.time() - d.registered
+        self.counters[outcome] += 1
+        if outcome == "live":
+            self._build_s = waited if self._build_s is None else 0.7 * self._build_s + 0.3 * waited
+        else:
+            print(f"[deploy] {d.owner}/{d.repo}@{d.sha[:7]} {outcome} after {waited:.0f}s "
+                  f"({d.polls} polls, last status {d.last_status or 'none'}); notifying anyway")
+        observe("pages_wait_seconds", waited, "Push -> Pages live wait before notifying",
+                buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600), outcome=outcome)
+        gauge("pages_pending", len(self._pending), "Deployments waited on before notifying")
+        for cb in d.waiters:
+            try:
+                cb(outcome)
+            except Exception as e:
+                print("[deploy] release callback failed:", e)
+
+    def stats(self) -> Dict[str, object]:
+        return dict(self.counters, pending=len(self._pending), paused_s=max(0.0, round(self._paused_until - time.time(), 1)),
+                    typical_build_s=round(self._build_s, 2) if self._build_s is not None else None)
+
+watcher = DeployWatcher()
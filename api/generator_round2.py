@@ -1,24 +1,24 @@
 import os
-import tempfile
 import subprocess
-import pathlib
-import base64
 import textwrap
 import stat
+import time
 from typing import Dict
 from .models import TaskRequest, BuildResult
 from .settings import settings
-from .llm import generate_readme_via_llm, synthesize_app
-from .notifier import notify_with_backoff
-from .guardrails import (
-    require_highlight_if_checked,
-    require_title_if_checked,
-    require_selector_if_mentioned,
-)
+from .mirror import mirror_cache
+from .llm import update_app_and_readme
+from .guardrails import enforce_all, enforce_html
+from .metrics import span, observe
 
 def _run(cmd: list, cwd=None, env=None):
     print("RUN:", " ".join(cmd))
-    subprocess.check_call(cmd, cwd=cwd, env=env)
+    start = time.perf_counter()
+    try:
+        subprocess.check_call(cmd, cwd=cwd, env=env)
+    finally:
+        observe("subprocess_seconds", time.perf_counter() - start, "git/gh subprocess wall time",
+                cmd=" ".join(cmd[:2]))
 
 def push_with_token(repo_path: str, repo_name: str):
     """
@@ -64,6 +64,38 @@ def push_with_token(repo_path: str, repo_name: str):
         except Exception:
             pass
 
+_ROUND1_FILES = ["index.html", "app.js"]
+
+def _read_current_files(repo_name: str, repo_url: str) -> Dict[str, str]:
+    """Current index.html/app.js without cloning: ETag reads (api) or the local mirror (gh)."""
+    if settings.PREFERRED_DRIVER.lower() == "api":
+        from .gh_rest import read_files
+        return read_files(repo_name, _ROUND1_FILES)
+    with mirror_cache.lock(repo_name):
+        mirror_cache.ensure(repo_name, repo_url, settings.DEFAULT_BRANCH)
+        return mirror_cache.read_files(repo_name, _ROUND1_FILES, settings.DEFAULT_BRANCH)
+
+def _commit_and_push(repo_name: str, repo_url: str, files: Dict[str, str], message: str) -> str:
+    if settings.PREFERRED_DRIVER.lower() == "api":
+        from .gh_rest import update_files
+        return update_files(repo_name, files, message)
+    branch = settings.DEFAULT_BRANCH
+    with mirror_cache.lock(repo_name):
+        mirror_cache.ensure(repo_name, repo_url, branch)
+        parent = mirror_cache.head(repo_name, branch)
+        sha = mirror_cache.commit_files(repo_name, files, message, branch)
+        try:
+            # Push with token helper to avoid interactive prompts in container
+            push_with_token(repo_path=str(mirror_cache.path(repo_name)), repo_name=repo_name)
+        except subprocess.CalledProcessError:
+            # remote moved on (e.g. edited outside this service): refetch once and retry
+            mirror_cache.rollback(repo_name, branch, parent)
+            mirror_cache.invalidate(repo_name)
+            mirror_cache.ensure(repo_name, repo_url, branch)
+            sha = mirror_cache.commit_files(repo_name, files, message, branch)
+            push_with_token(repo_path=str(mirror_cache.path(repo_name)), repo_name=repo_name)
+        return sha
+
 def update_existing_repo_with_llm(req: TaskRequest) -> BuildResult:
     assert req.round == 2, "This function only supports round 2"
 
@@ -71,80 +103,39 @@ def update_existing_repo_with_llm(req: TaskRequest) -> BuildResult:
     repo_name = req.task.replace(" ", "-")
     username = settings.GITHUB_USERNAME
     repo_url = f"https://github.com/{username}/{repo_name}.git"
-
-    tmp = tempfile.mkdtemp()
-    repo_path = pathlib.Path(tmp) / repo_name
-
-    # Clone the repo
-    _run(["git", "clone", repo_url, str(repo_path)])
-    _run(["git", "checkout", settings.DEFAULT_BRANCH], cwd=repo_path)
-    # Ensure local identity for commits (safe, local repo-level config)
-    _run(["git", "config", "user.email", "bot@llm-deploy.local"], cwd=repo_path)
-    _run(["git", "config", "user.name", settings.GITHUB_USERNAME or "llm-deploy-bot"], cwd=repo_path)
+    pages_url = f"https://{username}.github.io/{repo_name}/"
 
     # Read current files
-    index_path = repo_path / "index.html"
-    app_path = repo_path / "app.js"
-
-    if not index_path.exists() or not app_path.exists():
+    with span("read_files"):
+        old_files = _read_current_files(repo_name, repo_url)
+    if any(name not in old_files for name in _ROUND1_FILES):
         raise RuntimeError("Existing repo does not contain index.html or app.js")
 
-    old_files = {
-        "index.html": index_path.read_text(encoding="utf-8"),
-        "app.js": app_path.read_text(encoding="utf-8"),
-    }
-
     seed = req.nonce[:8]
-    attachments = {}  # Round 2 usually doesn't include new attachments
     extra_vars = {"seed": seed, "round": 2}
 
-    # Ask LLM to modify the existing app
-    updated_files = synthesize_app(
-        brief=req.brief,
-        checks=req.checks,
-        seed=seed,
-        attachments=attachments,
-        extra_vars=extra_vars,
-    )
-
-    # Overwrite files
-    for name, content in updated_files.items():
-        fpath = repo_path / name
-        fpath.write_text(content, encoding="utf-8")
-
-    # Rebuild README
-    readme = generate_readme_via_llm(req.brief, req.checks, repo_url=repo_url, pages_url=f"https://{username}.github.io/{repo_name}/")
-    (repo_path / "README.md").write_text(readme, encoding="utf-8")
-
-    # Guardrails
-    require_highlight_if_checked(updated_files, req.checks)
-    require_title_if_checked(updated_files, req.checks)
-    require_selector_if_mentioned(updated_files, req.checks, seed)
-
-    # Commit and push (use token-safe push helper)
-    _run(["git", "add", "."], cwd=repo_path)
-    _run(["git", "commit", "-m", "update: round 2 requirements"], cwd=repo_path)
-
-    # Push with token helper to avoid interactive prompts in container
-    push_with_token(repo_path=str(repo_path), repo_name=repo_name)
-
-    # Notify
-    if req.evaluation_url:
-        notify_with_backoff(
-            evaluation_url=req.evaluation_url,
-            payload={
-                "email": req.email,
-                "task": req.task,
-                "round": req.round,
-                "nonce": req.nonce,
-                "repo_url": f"https://github.com/{username}/{repo_name}",
-                "commit_sha": os.popen(f"git -C {repo_path} rev-parse HEAD").read().strip(),
-                "pages_url": f"https://{username}.github.io/{repo_name}/"
-            }
+    # Ask LLM for edits to the existing app (README is rebuilt concurrently)
+    with span("llm_synthesis"):
+        updated_files, readme = update_app_and_readme(
+            brief=req.brief,
+            checks=req.checks,
+            seed=seed,
+            current={name: old_files[name] for name in _ROUND1_FILES},
+            extra_vars=extra_vars,
+            repo_url=repo_url,
+            pages_url=pages_url,
+            validate=lambda f: enforce_all(f, req.checks, seed),
+            validate_html=lambda html: enforce_html(html, req.checks, seed),
         )
 
+    # Overwrite files and rebuild README, then commit and push
+    files = dict(updated_files)
+    files["README.md"] = readme
+    with span("commit_push"):
+        commit_sha = _commit_and_push(repo_name, repo_url, files, "update: round 2 requirements")
+
     return BuildResult(
         repo_url=f"https://github.com/{username}/{repo_name}",
-        pages_url=f"https://{username}.github.io/{repo_name}/",
-        commit_sha=os.popen(f"git -C {repo_path} rev-parse HEAD").read().strip()
+        pages_url=pages_url,
+        commit_sha=commit_sha
     )
@@ -1,5 +1,10 @@
-import os, subprocess, tempfile, pathlib, time
+import os, subprocess, pathlib, time
+from functools import lru_cache
+from typing import Tuple
 from .settings import settings
+from .data_uri import copy_to
+from .metrics import observe, span
+from .workspace import workspace_pool
 
 PAGES_WORKFLOW = """name: GitHub Pages
 on:
@@ -63,49 +68,76 @@ class RepoResult:
 
 def _run(cmd: list, cwd=None):
     print("RUN:", " ".join(cmd))
-    subprocess.check_call(cmd, cwd=cwd)
-
-def create_and_push_with_gh(repo_name: str, files: dict) -> RepoResult:
-    username = settings.GITHUB_USERNAME
-    assert username, "GITHUB_USERNAME required"
+    start = time.perf_counter()
+    try:
+        subprocess.check_call(cmd, cwd=cwd)
+    finally:
+        observe("subprocess_seconds", time.perf_counter() - start, "git/gh subprocess wall time",
+                cmd=" ".join(cmd[:2]))
+
+@lru_cache(maxsize=32)
+def _render_scaffold(year: str, username: str, branch: str) -> Tuple[Tuple[str, str], ...]:
+    return (
+        ("LICENSE", MIT_LICENSE.replace("%YEAR%", year).replace("%AUTHOR%", username)),
+        (".github/workflows/pages.yml", PAGES_WORKFLOW.replace("%BRANCH%", branch)),
+    )
 
-    tmp = tempfile.mkdtemp()
-    root = pathlib.Path(tmp) / repo_name
-    root.mkdir(parents=True)
+def scaffold_files(username: str) -> dict:
+    """LICENSE and the Pages workflow added to every generated repo (rendered once per year/user/branch)."""
+    return dict(_render_scaffold(time.strftime("%Y"), username, settings.DEFAULT_BRANCH))
 
+def _write_files(root: pathlib.Path, files: dict) -> None:
     for path, content in files.items():
         p = root / path
         p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_text(content, encoding="utf-8")
+        if isinstance(content, bytes):
+            p.write_bytes(content)
+        elif hasattr(content, "read"):
+            with open(p, "wb") as f:
+                copy_to(content, f)
+        else:
+            p.write_text(content, encoding="utf-8")
+
+def publish_repo(repo_name: str, files: dict) -> RepoResult:
+    """Create the repo, push `files` and enable Pages with the driver chosen by PREFERRED_DRIVER."""
+    driver = settings.PREFERRED_DRIVER.lower()
+    if driver == "api":
+        from .gh_rest import create_and_push_with_api
+        return create_and_push_with_api(repo_name, files)
+    if driver == "gh":
+        return create_and_push_with_gh(repo_name, files)
+    raise ValueError(f"Unknown PREFERRED_DRIVER {settings.PREFERRED_DRIVER!r} (expected 'gh' or 'api')")
 
-    (root / "LICENSE").write_text(
-        MIT_LICENSE.replace("%YEAR%", time.strftime("%Y")).replace("%AUTHOR%", username),
-        encoding="utf-8",
-    )
-
-    workflow = PAGES_WORKFLOW.replace("%BRANCH%", settings.DEFAULT_BRANCH)
-    workflow_path = root / ".github" / "workflows" / "pages.yml"
-    workflow_path.parent.mkdir(parents=True, exist_ok=True)
-    workflow_path.write_text(workflow, encoding="utf-8")
-
-    _run(["git", "init", "-b", settings.DEFAULT_BRANCH], cwd=root)
-    _run(["git", "config", "user.email", "bot@llm-deploy.local"], cwd=root)
-    _run(["git", "config", "user.name", username], cwd=root)
-    _run(["git", "add", "."], cwd=root)
-    _run(["git", "commit", "-m", "init: task scaffold"], cwd=root)
+def create_and_push_with_gh(repo_name: str, files: dict) -> RepoResult:
+    username = settings.GITHUB_USERNAME
+    assert username, "GITHUB_USERNAME required"
 
-    _run([
-        "gh", "repo", "create", f"{username}/{repo_name}",
-        "--public", "--source", str(root), "--remote", "origin", "--push"
-    ])
+    # LICENSE and the Pages workflow are already committed in the workspace skeleton
+    with workspace_pool.checkout(scaffold_files(username)) as root:
+        _write_files(root, files)
+        _run(["git", "add", "."], cwd=root)
+        _run(["git", "commit", "-m", "init: task scaffold"], cwd=root)
+
+        _run([
+            "gh", "repo", "create", f"{username}/{repo_name}",
+            "--public", "--source", str(root), "--remote", "origin", "--push"
+        ])
+        commit_sha = os.popen(f"git -C {root} rev-parse HEAD").read().strip()
+
+        # Keep a bare mirror so round 2 can skip the clone (best-effort)
+        try:
+            from .mirror import mirror_cache
+            mirror_cache.seed_from_worktree(root, repo_name, f"https://github.com/{username}/{repo_name}.git")
+        except Exception as e:
+            print("WARN: seeding round-2 mirror failed:", e)
 
     # Auto-enable Pages via REST (safe; ignore failure)
-    try:
-        _run(["gh","api",f"/repos/{username}/{repo_name}/pages","-X","POST","-F","build_type=workflow"])
-    except subprocess.CalledProcessError as e:
-        print("WARN: Auto-enable Pages failed; Actions may enable on first deploy:", e)
+    with span("pages_enable"):
+        try:
+            _run(["gh","api",f"/repos/{username}/{repo_name}/pages","-X","POST","-F","build_type=workflow"])
+        except subprocess.CalledProcessError as e:
+            print("WARN: Auto-enable Pages failed; Actions may enable on first deploy:", e)
 
     repo_url = f"https://github.com/{username}/{repo_name}"
     pages_url = f"https://{username}.github.io/{repo_name}/"
-    commit_sha = os.popen(f"git -C {root} rev-parse HEAD").read().strip()
     return RepoResult(repo_url, pages_url, commit_sha)
@@ -0,0 +1,190 @@
+import base64, threading, time
+from collections import OrderedDict
+from typing import IO, Dict, Iterator, List, Optional, Union
+from .settings import settings
+from .metrics import observe, span
+
+# In-process GitHub publisher (PREFERRED_DRIVER=api). Builds the commit with the
+# Git Data API over one pooled HTTP client: no temp dirs, no git/gh processes.
+
+FileContent = Union[str, bytes, IO[bytes]]
+
+class GitHubAPIError(RuntimeError):
+    def __init__(self, method: str, path: str, status: int, body: str):
+        super().__init__(f"GitHub API {method} {path} -> {status}: {body[:300]}")
+        self.status = status
+
+_client_obj = None
+_client_lock = threading.Lock()
+
+def _client():
+    global _client_obj
+    token = settings.GITHUB_TOKEN
+    if not token:
+        raise RuntimeError("GITHUB_TOKEN not set - cannot use the api driver")
+    with _client_lock:
+        if _client_obj is None:
+            import httpx
+            _client_obj = httpx.Client(
+                base_url=settings.GITHUB_API_URL.rstrip("/"),
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Accept": "application/vnd.github+json",
+                    "X-GitHub-Api-Version": "2022-11-28",
+                },
+                timeout=30,
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+            )
+        return _client_obj
+
+def _call(method: str, path: str, ok=(200, 201), **kw):
+    start = time.perf_counter()
+    r = _client().request(method, path, **kw)
+    observe("github_api_seconds", time.perf_counter() - start, "GitHub REST call latency",
+            method=method, status=r.status_code)
+    if r.status_code not in ok:
+        raise GitHubAPIError(method, path, r.status_code, r.text)
+    return r
+
+def warm() -> None:
+    """Open a pooled connection to the API (start-up warm-up); /rate_limit is free."""
+    _client().get("/rate_limit")  # any HTTP answer will do
+
+_REPO_PATH = "/repos/{owner}/{repo}"
+
+def _commit_files(owner: str, repo: str, files: Dict[str, FileContent], message: str,
+                  parent: Optional[str], base_tree: Optional[str]) -> str:
+    base = _REPO_PATH.format(owner=owner, repo=repo)
+    entries = []
+    for path, content in files.items():
+        if isinstance(content, str):
+            entries.append({"path": path, "mode": "100644", "type": "blob", "content": content})
+        else:
+            blob = _call("POST", f"{base}/git/blobs", content=_blob_body(content),
+                         headers={"Content-Type": "application/json"}).json()
+            entries.append({"path": path, "mode": "100644", "type": "blob", "sha": blob["sha"]})
+    tree_req = {"tree": entries}
+    if base_tree:
+        tree_req["base_tree"] = base_tree
+    tree = _call("POST", f"{base}/git/trees", json=tree_req).json()
+    commit = _call("POST", f"{base}/git/commits", json={
+        "message": message,
+        "tree": tree["sha"],
+        "parents": [parent] if parent else [],
+        "author": {"name": settings.GITHUB_USERNAME or "llm-deploy-bot", "email": "bot@llm-deploy.local"},
+    }).json()
+    return commit["sha"]
+
+def _blob_body(content) -> Iterator[bytes]:
+    """JSON body for a base64 blob, streamed so large attachments are never fully in memory."""
+    yield b'{"encoding":"base64","content":"'
+    if isinstance(content, bytes):
+        yield base64.b64encode(content)
+    else:
+        content.seek(0)
+        while True:
+            chunk = content.read(3 * (1 << 16))  # multiple of 3: no padding mid-stream
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+    yield b'"}'
+
+def _set_branch(owner: str, repo: str, branch: str, sha: str, exists: bool) -> None:
+    base = _REPO_PATH.format(owner=owner, repo=repo)
+    if exists:
+        _call("PATCH", f"{base}/git/refs/heads/{branch}", json={"sha": sha, "force": True})
+    else:
+        _call("POST", f"{base}/git/refs", json={"ref": f"refs/heads/{branch}", "sha": sha})
+
+def _branch_head(owner: str, repo: str, branch: str) -> Optional[str]:
+    base = _REPO_PATH.format(owner=owner, repo=repo)
+    r = _client().get(f"{base}/git/ref/heads/{branch}")
+    if r.status_code == 404:
+        return None
+    if r.status_code != 200:
+        raise GitHubAPIError("GET", f"{base}/git/ref/heads/{branch}", r.status_code, r.text)
+    return r.json()["object"]["sha"]
+
+def enable_pages(owner: str, repo: str) -> None:
+    try:
+        _call("POST", f"/repos/{owner}/{repo}/pages", ok=(201, 409), json={"build_type": "workflow"})
+    except GitHubAPIError as e:
+        print("WARN: Auto-enable Pages failed; Actions may enable on first deploy:", e)
+
+def create_and_push_with_api(repo_name: str, files: Dict[str, FileContent]):
+    from .gh_api import RepoResult, scaffold_files
+    username = settings.GITHUB_USERNAME
+    assert username, "GITHUB_USERNAME required"
+    branch = settings.DEFAULT_BRANCH
+
+    # auto_init gives the repo a first commit; the Git Data API rejects empty repos
+    print(f"API: create repo {username}/{repo_name}")
+    _call("POST", "/user/repos", json={"name": repo_name, "private": False, "auto_init": True})
+
+    head, on_branch = None, False
+    for _ in range(5):
+        # a freshly created repo's ref can take a moment to appear
+        head = _branch_head(username, repo_name, branch)
+        if head:
+            on_branch = True
+            break
+        default = _call("GET", f"/repos/{username}/{repo_name}").json().get("default_branch")
+        if default and default != branch:
+            head = _branch_head(username, repo_name, default)
+            if head:
+                break
+        time.sleep(0.5)
+
+    all_files = dict(files)
+    all_files.update(scaffold_files(username))
+    commit_sha = _commit_files(username, repo_name, all_files, "init: task scaffold",
+                               parent=head, base_tree=None)
+    _set_branch(username, repo_name, branch, commit_sha, exists=on_branch)
+    with span("pages_enable"):
+        enable_pages(username, repo_name)
+
+    repo_url = f"https://github.com/{username}/{repo_name}"
+    pages_url = f"https://{username}.github.io/{repo_name}/"
+    return RepoResult(repo_url, pages_url, commit_sha)
+
+# ---------- round 2: conditional reads + commit on top of the branch ----------
+# (owner, repo, ref, path) -> (etag, text); a 304 costs no rate limit and no body.
+_etag_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_ETAG_CACHE_MAX = 512
+_etag_lock = threading.Lock()
+
+def read_files(repo_name: str, paths: List[str]) -> Dict[str, str]:
+    owner, ref = settings.GITHUB_USERNAME, settings.DEFAULT_BRANCH
+    out = {}
+    for path in paths:
+        key = (owner, repo_name, ref, path)
+        with _etag_lock:
+            cached = _etag_cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        r = _client().get(f"/repos/{owner}/{repo_name}/contents/{path}", params={"ref": ref}, headers=headers)
+        if r.status_code == 304 and cached:
+            out[path] = cached[1]
+            continue
+        if r.status_code == 404:
+            continue
+        if r.status_code != 200:
+            raise GitHubAPIError("GET", f"/repos/{owner}/{repo_name}/contents/{path}", r.status_code, r.text)
+        text = base64.b64decode(r.json()["content"]).decode("utf-8")
+        out[path] = text
+        if r.headers.get("ETag"):
+            with _etag_lock:
+                _etag_cache[key] = (r.headers["ETag"], text)
+                while len(_etag_cache) > _ETAG_CACHE_MAX:
+                    _etag_cache.popitem(last=False)
+    return out
+
+def update_files(repo_name: str, files: Dict[str, FileContent], message: str) -> str:
+    """Commit `files` on top of the default branch (other paths are kept); returns the commit sha."""
+    owner, branch = settings.GITHUB_USERNAME, settings.DEFAULT_BRANCH
+    head = _branch_head(owner, repo_name, branch)
+    if not head:
+        raise RuntimeError(f"{owner}/{repo_name} has no branch {branch}")
+    base_tree = _call("GET", f"/repos/{owner}/{repo_name}/git/commits/{head}").json()["tree"]["sha"]
+    sha = _commit_files(owner, repo_name, files, message, parent=head, base_tree=base_tree)
+    _call("PATCH", f"/repos/{owner}/{repo_name}/git/refs/heads/{branch}", json={"sha": sha, "force": False})
+    return sha
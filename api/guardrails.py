@@ -1,37 +1,178 @@
 # api/guardrails.py
 import re
-from typing import Dict, List
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+from .metrics import span
 
-def _has_bootstrap_link(html: str) -> bool:
-    return bool(re.search(r'<link[^>]+href=["\'][^"\']*bootstrap[^"\']*["\']', html, re.I))
+# ---------- pre-parsed indexes ----------
+_REQUIRED_FILES = ("index.html", "app.js")
+_CHECK_ID_RE = re.compile(r"#[-\w]+")
 
-def _has_selector(html: str, selector_id: str) -> bool:
-    sid = selector_id.lstrip("#")
-    return bool(re.search(rf'id=["\']{re.escape(sid)}["\']', html, re.I))
+class _IndexParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.ids: Set[str] = set()
+        self.title: Optional[str] = None
+        self.link_hrefs: List[str] = []
+        self.script_srcs: List[str] = []
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        for k, v in attrs:
+            if k == "id" and v:
+                self.ids.add(v.lower())
+        if tag == "title":
+            self._in_title = True
+            self.title = self.title or ""
+        elif tag == "link":
+            href = dict(attrs).get("href")
+            if href:
+                self.link_hrefs.append(href)
+        elif tag == "script":
+            src = dict(attrs).get("src")
+            if src:
+                self.script_srcs.append(src)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+class ArtifactIndex:
+    """index.html and the JS (app.js plus any other modules) parsed once; every rule reads from here."""
+    def __init__(self, files: Dict[str, str]):
+        self.present: FrozenSet[str] = frozenset(k for k in _REQUIRED_FILES if k in files)
+        self.html = files.get("index.html", "")
+        self.js = "\n".join([files.get("app.js", "")] + [
+            v for k, v in sorted(files.items())
+            if k != "app.js" and k.endswith((".js", ".mjs")) and isinstance(v, str)])
+        p = _IndexParser()
+        try:
+            p.feed(self.html)
+            p.close()
+        except Exception:
+            pass  # malformed HTML: keep whatever was indexed so far
+        self.ids = p.ids
+        self.title = p.title
+        self.link_hrefs = p.link_hrefs
+        self.script_srcs = p.script_srcs
+
+    def loads(self, needle: str) -> bool:
+        """Whether a <script src> or <link href> in index.html contains `needle`."""
+        return any(needle in u.lower() for u in self.script_srcs + self.link_hrefs)
+
+class ChecksIndex:
+    """Checks normalised once per (checks, seed)."""
+    def __init__(self, checks: Tuple[str, ...], seed: str):
+        self.checks = checks
+        self.lower = " \n".join(c.lower() for c in checks)
+        realized = " ".join(c.replace("${seed}", seed) for c in checks)
+        self.ids = sorted(s for s in set(_CHECK_ID_RE.findall(realized)) if s != "#")
+
+@lru_cache(maxsize=256)
+def _checks_index(checks: Tuple[str, ...], seed: str) -> ChecksIndex:
+    return ChecksIndex(checks, seed)
+
+# ---------- rules ----------
+class Violation(NamedTuple):
+    rule: str
+    message: str
+
+class GuardrailError(RuntimeError):
+    def __init__(self, violations: List[Violation]):
+        super().__init__("; ".join(v.message for v in violations))
+        self.violations = violations
+
+Rule = Callable[[ArtifactIndex, ChecksIndex], Iterable[str]]
+_RULES: List[Tuple[str, FrozenSet[str], Rule]] = []
+
+def rule(name: str, needs: Iterable[str] = ("index.html", "app.js")):
+    """Register a guardrail. `needs` lists the files it must see to reach a verdict."""
+    def deco(fn: Rule) -> Rule:
+        _RULES.append((name, frozenset(needs), fn))
+        return fn
+    return deco
+
+@rule("highlight")
+def _rule_highlight(idx: ArtifactIndex, chk: ChecksIndex):
+    # loaded from a CDN tag, or pulled in by the JS itself (dynamic import / injected script)
+    if "highlight.js" in chk.lower and not (idx.loads("highlight") or "highlight.js" in idx.js):
+        yield "highlight.js required by checks but not included"
+
+@rule("bootstrap", needs=("index.html",))
+def _rule_bootstrap(idx: ArtifactIndex, chk: ChecksIndex):
+    if "bootstrap" in chk.lower and not idx.loads("bootstrap"):
+        yield "Bootstrap required by checks but no <link> loads it"
+
+@rule("title")
+def _rule_title(idx: ArtifactIndex, chk: ChecksIndex):
+    needs_title = any("document.title" in c for c in chk.checks)
+    if needs_title and idx.title is None and "document.title" not in idx.js:
+        yield "title missing but referenced in checks"
+
+@rule("selector", needs=("index.html",))
+def _rule_selector(idx: ArtifactIndex, chk: ChecksIndex):
+    """ids mentioned in checks (after ${seed} expansion) must exist in index.html."""
+    for sel in chk.ids:
+        if sel[1:].lower() not in idx.ids:
+            yield f"selector {sel} missing"
+
+def check_all(files: Dict[str, str], checks: List[str], seed: str,
+              only: Optional[Iterable[str]] = None, partial: bool = False) -> List[Violation]:
+    """
+    Evaluate every registered rule in one pass; returns all violations. A missing
+    index.html or app.js is itself a violation, unless `partial` (an incomplete
+    artifact, e.g. mid-stream), where only the rules whose files are present run.
+    """
+    idx = ArtifactIndex(files)
+    chk = _checks_index(tuple(checks), seed)
+    wanted = set(only) if only is not None else None
+    out: List[Violation] = []
+    if not partial:
+        out.extend(Violation("files", f"{name} missing") for name in _REQUIRED_FILES if name not in idx.present)
+    for name, needs, fn in _RULES:
+        if wanted is not None and name not in wanted:
+            continue
+        if not needs <= idx.present:
+            continue
+        out.extend(Violation(name, msg) for msg in fn(idx, chk))
+    return out
+
+def enforce_all(files: Dict[str, str], checks: List[str], seed: str) -> None:
+    with span("guardrails"):
+        violations = check_all(files, checks, seed)
+    if violations:
+        raise GuardrailError(violations)
+
+def enforce_html(html: str, checks: List[str], seed: str) -> None:
+    """The rules decidable from index.html alone (used while streaming)."""
+    with span("guardrails"):
+        violations = check_all({"index.html": html}, checks, seed, partial=True)
+    if violations:
+        raise GuardrailError(violations)
+
+# ---------- single-rule entry points (kept for existing callers) ----------
+def _require(name: str, files: Dict[str, str], checks: List[str], seed: str = "") -> None:
+    files = {"index.html": files.get("index.html", ""), "app.js": files.get("app.js", "")}
+    violations = check_all(files, checks, seed, only=[name])
+    if violations:
+        raise GuardrailError(violations[:1])
 
 def require_highlight_if_checked(files: Dict[str, str], checks: List[str]) -> None:
-    html = files.get("index.html", "")
-    js = files.get("app.js", "")
-    need = any("highlight.js" in c.lower() for c in checks)
-    if need and ("highlight.js" not in html and "highlight.js" not in js):
-        raise RuntimeError("highlight.js required by checks but not included")
+    _require("highlight", files, checks)
 
 def require_title_if_checked(files: Dict[str, str], checks: List[str]) -> None:
-    html = files.get("index.html", "")
-    js = files.get("app.js", "")
-    needs_title = any("document.title" in c for c in checks)
-    if needs_title and ("<title>" not in html and "document.title" not in js):
-        raise RuntimeError("title missing but referenced in checks")
+    _require("title", files, checks)
 
 def require_selector_if_mentioned(files: Dict[str, str], checks: List[str], seed: str) -> None:
     """
     Expand ${seed} in checks, extract any #ids mentioned, and ensure those ids exist in index.html.
     """
-    html = files.get("index.html", "")
-    realized_checks = [c.replace("${seed}", seed) for c in checks]
-    ids = set(re.findall(r"#[-\w]+", " ".join(realized_checks)))
-    for sel in ids:
-        if sel == "#":
-            continue
-        if not _has_selector(html, sel):
-            raise RuntimeError(f"selector {sel} missing")
+    _require("selector", files, checks, seed)
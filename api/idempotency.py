@@ -0,0 +1,64 @@
+import hashlib, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from .models import TaskRequest
+from .settings import settings
+
+def task_key(req: TaskRequest) -> str:
+    raw = "\x1f".join([req.email, req.task, str(req.round), req.nonce])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class IdempotencyStore:
+    """
+    Coalesces repeated submissions of the same (email, task, round, nonce):
+    while a job runs, duplicates attach to it; after it succeeds, its result is
+    served from a bounded TTL store. Failed or expired jobs are forgotten so a
+    retry starts fresh.
+    """
+    def __init__(self, max_results: int, ttl_s: float):
+        self.max_results = max_results
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, str] = {}
+        self._done: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self.counters = {"new": 0, "attached": 0, "completed": 0}
+
+    def admit(self, key: str, start: Callable[[], Any]) -> Tuple[str, str, Optional[Any]]:
+        """
+        Returns (outcome, job_id, result): outcome is "new" (start() was called and
+        its job's id returned), "attached" (same job already running) or "completed".
+        """
+        with self._lock:
+            job_id = self._inflight.get(key)
+            if job_id is not None:
+                self.counters["attached"] += 1
+                return "attached", job_id, None
+            hit = self._done.get(key)
+            if hit is not None:
+                ts, job_id, result = hit
+                if time.time() - ts <= self.ttl_s:
+                    self._done.move_to_end(key)
+                    self.counters["completed"] += 1
+                    return "completed", job_id, result
+                self._done.pop(key)
+            job = start()
+            self._inflight[key] = job.id
+            self.counters["new"] += 1
+            return "new", job.id, None
+
+    def finish(self, key: str, job_id: str, ok: bool, result: Any = None) -> None:
+        with self._lock:
+            if self._inflight.get(key) == job_id:
+                self._inflight.pop(key)
+            if not ok:
+                return
+            self._done[key] = (time.time(), job_id, result)
+            self._done.move_to_end(key)
+            while len(self._done) > self.max_results:
+                self._done.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, inflight=len(self._inflight), results=len(self._done))
+
+idempotency = IdempotencyStore(settings.IDEMPOTENCY_MAX_RESULTS, settings.IDEMPOTENCY_TTL_S)
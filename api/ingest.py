@@ -0,0 +1,371 @@
+import asyncio, codecs, json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from fastapi import HTTPException
+from pydantic import ValidationError
+from .data_uri import DataUriDecoder, DataUriError, AttachmentTooLarge
+from .models import TaskRequest
+from .security import verify_secret
+from .settings import settings
+
+# Streaming /task ingestion. The JSON body is parsed incrementally as it arrives:
+# `secret` is verified the moment its value is complete (before the rest of the
+# body is read), and each attachments[i].url is base64-decoded chunk by chunk into
+# a spooled temp file instead of being held as one big string. Until the secret
+# has been verified only INGEST_UNVERIFIED_BYTES of attachment data is decoded,
+# so an unauthenticated body can't make us spool megabytes before the 401.
+# Parsing and spooling run on a worker thread, in slices of INGEST_SLICE_BYTES.
+
+class IngestError(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+_WS = " \t\r\n"
+_LITERAL_END = ",}] \t\r\n"
+
+class _Frame:
+    __slots__ = ("kind", "value", "key", "state")
+
+    def __init__(self, kind: str, value):
+        self.kind = kind          # "obj" | "arr"
+        self.value = value
+        self.key: Optional[str] = None
+        self.state = "key_or_end" if kind == "obj" else "value_or_end"
+
+class StreamingJsonParser:
+    """
+    Minimal incremental JSON parser. Feed decoded text; completed top-level fields
+    are reported to `on_field(key, value)`. `open_sink(path)` may return an object
+    with write(str)/close() to receive a string value in pieces instead of buffering
+    it (path is a tuple like ("attachments", 0, "url")); close()'s return value
+    becomes the parsed value. Other strings are capped at `max_string` chars.
+    """
+    def __init__(self, on_field: Callable[[str, Any], None],
+                 open_sink: Callable[[tuple], Any], max_string: int):
+        self.on_field = on_field
+        self.open_sink = open_sink
+        self.max_string = max_string
+        self.root: Optional[dict] = None
+        self.done = False
+        self._stack: List[_Frame] = []
+        # string state
+        self._in_str = False
+        self._str_is_key = False
+        self._str_parts: List[str] = []
+        self._str_len = 0
+        self._sink = None
+        self._esc: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        # number/literal state
+        self._scalar: Optional[str] = None
+
+    # ---------- public ----------
+    def feed(self, text: str) -> None:
+        i, n = 0, len(text)
+        while i < n:
+            if self._in_str:
+                i = self._string(text, i)
+                continue
+            if self._scalar is not None:
+                c = text[i]
+                if c in _LITERAL_END:
+                    self._finish_scalar()
+                    continue
+                self._scalar += c
+                if len(self._scalar) > 64:
+                    raise IngestError(422, "malformed JSON literal")
+                i += 1
+                continue
+            c = text[i]
+            i += 1
+            if c in _WS:
+                continue
+            self._structural(c)
+
+    def close(self) -> dict:
+        if self._scalar is not None:
+            self._finish_scalar()
+        if not self.done or self._in_str:
+            raise IngestError(422, "truncated JSON body")
+        return self.root
+
+    # ---------- structure ----------
+    def _path(self) -> tuple:
+        out = []
+        for f in self._stack:
+            out.append(f.key if f.kind == "obj" else len(f.value))
+        return tuple(out)
+
+    def _structural(self, c: str) -> None:
+        if self.done:
+            raise IngestError(422, "unexpected data after JSON body")
+        frame = self._stack[-1] if self._stack else None
+        if frame is None:
+            if c != "{":
+                raise IngestError(422, "request body must be a JSON object")
+            self._push("obj")
+            return
+        st = frame.state
+        if frame.kind == "obj":
+            if st == "key_or_end" or st == "key":
+                if c == "}" and st == "key_or_end":
+                    self._pop()
+                elif c == '"':
+                    self._start_string(is_key=True)
+                else:
+                    raise IngestError(422, "malformed JSON object")
+            elif st == "colon":
+                if c != ":":
+                    raise IngestError(422, "malformed JSON object")
+                frame.state = "value"
+            elif st == "value":
+                self._start_value(c)
+            elif st == "comma_or_end":
+                if c == ",":
+                    frame.state = "key"
+                elif c == "}":
+                    self._pop()
+                else:
+                    raise IngestError(422, "malformed JSON object")
+        else:
+            if st == "value_or_end" and c == "]":
+                self._pop()
+            elif st in ("value_or_end", "value"):
+                self._start_value(c)
+            elif st == "comma_or_end":
+                if c == ",":
+                    frame.state = "value"
+                elif c == "]":
+                    self._pop()
+                else:
+                    raise IngestError(422, "malformed JSON array")
+
+    def _start_value(self, c: str) -> None:
+        if c == "{":
+            self._push("obj")
+        elif c == "[":
+            self._push("arr")
+        elif c == '"':
+            self._start_string(is_key=False)
+        elif c in "-0123456789tfn":
+            self._scalar = c
+        else:
+            raise IngestError(422, "malformed JSON value")
+
+    def _push(self, kind: str) -> None:
+        if len(self._stack) > 16:
+            raise IngestError(422, "JSON nested too deeply")
+        self._stack.append(_Frame(kind, {} if kind == "obj" else []))
+
+    def _pop(self) -> None:
+        frame = self._stack.pop()
+        self._value_done(frame.value)
+
+    def _value_done(self, value: Any) -> None:
+        if not self._stack:
+            self.root = value
+            self.done = True
+            return
+        frame = self._stack[-1]
+        if frame.kind == "obj":
+            frame.value[frame.key] = value
+            if len(self._stack) == 1:
+                self.on_field(frame.key, value)
+        else:
+            frame.value.append(value)
+        frame.state = "comma_or_end"
+
+    def _finish_scalar(self) -> None:
+        token, self._scalar = self._scalar, None
+        try:
+            value = json.loads(token)
+        except ValueError:
+            raise IngestError(422, f"malformed JSON literal {token[:20]!r}")
+        self._value_done(value)
+
+    # ---------- strings ----------
+    def _start_string(self, is_key: bool) -> None:
+        self._in_str = True
+        self._str_is_key = is_key
+        self._str_parts = []
+        self._str_len = 0
+        self._sink = None if is_key else self.open_sink(self._path())
+
+    def _emit(self, s: str) -> None:
+        if not s:
+            return
+        if self._sink is not None:
+            self._sink.write(s)
+            return
+        self._str_len += len(s)
+        if self._str_len > self.max_string:
+            raise IngestError(413, "JSON string field too large")
+        self._str_parts.append(s)
+
+    def _string(self, text: str, i: int) -> int:
+        n = len(text)
+        if self._esc is not None:
+            return self._escape(text, i)
+        # bulk-copy up to the next quote or backslash
+        q = text.find('"', i)
+        b = text.find("\\", i)
+        stop = min(x for x in (q, b, n) if x != -1)
+        if stop > i:
+            self._emit(text[i:stop])
+        if stop == n:
+            return n
+        if text[stop] == "\\":
+            self._esc = ""
+            return stop + 1
+        self._end_string()
+        return stop + 1
+
+    def _escape(self, text: str, i: int) -> int:
+        self._esc += text[i]
+        i += 1
+        esc = self._esc
+        if esc[0] == "u":
+            if len(esc) < 5:
+                return i
+            digits = esc[1:5]
+            # int() alone would also take signs, underscores and spaces
+            if not (digits.isascii() and digits.isalnum()):
+                raise IngestError(422, "invalid JSON string escape")
+            try:
+                code = int(digits, 16)
+            except ValueError:
+                raise IngestError(422, "invalid JSON string escape")
+            self._esc = None
+            if 0xD800 <= code < 0xDC00:
+                self._high_surrogate = code
+                return i
+            if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+            self._emit(chr(code))
+            return i
+        simple = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+        if esc not in simple:
+            raise IngestError(422, "invalid JSON string escape")
+        self._esc = None
+        self._emit(simple[esc])
+        return i
+
+    def _end_string(self) -> None:
+        self._in_str = False
+        if self._str_is_key:
+            frame = self._stack[-1]
+            frame.key = "".join(self._str_parts)
+            frame.state = "colon"
+            return
+        if self._sink is not None:
+            sink, self._sink = self._sink, None
+            self._value_done(sink.close())
+        else:
+            self._value_done("".join(self._str_parts))
+
+async def ingest_task(chunks: AsyncIterator[bytes], content_length: Optional[int] = None) -> TaskRequest:
+    """
+    Parse a /task body from a byte stream. Raises IngestError(401) as soon as the
+    secret is seen and wrong, 413 on size limits, 422 on malformed input.
+    """
+    if content_length and content_length > settings.MAX_TASK_BODY_BYTES:
+        raise IngestError(413, f"request body exceeds {settings.MAX_TASK_BODY_BYTES} bytes")
+
+    decoders: Dict[int, DataUriDecoder] = {}
+    total = {"decoded": 0, "raw": 0}
+    state = {"secret_ok": False}
+
+    def budget(n: int) -> None:
+        total["decoded"] += n
+        if not state["secret_ok"] and total["decoded"] > settings.INGEST_UNVERIFIED_BYTES:
+            raise IngestError(422, f"send `secret` before attachments larger than {settings.INGEST_UNVERIFIED_BYTES} bytes")
+        if total["decoded"] > settings.MAX_ATTACHMENTS_TOTAL_BYTES:
+            raise AttachmentTooLarge(f"attachments exceed {settings.MAX_ATTACHMENTS_TOTAL_BYTES} bytes in total")
+
+    def on_field(key: str, value: Any) -> None:
+        if key == "secret":
+            if not isinstance(value, str) or not verify_secret(value):
+                raise IngestError(401, "Invalid secret")
+            state["secret_ok"] = True
+
+    def open_sink(path: tuple):
+        if len(path) == 3 and path[0] == "attachments" and path[2] == "url" and isinstance(path[1], int):
+            if path[1] in decoders:
+                decoders[path[1]].discard()
+            dec = DataUriDecoder(settings.MAX_ATTACHMENT_BYTES, budget)
+            decoders[path[1]] = dec
+            return _DecoderSink(dec)
+        return None
+
+    parser = StreamingJsonParser(on_field, open_sink, max_string=settings.MAX_TASK_FIELD_CHARS)
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(data: bytes, final: bool = False) -> None:
+        try:
+            parser.feed(utf8.decode(data, final=final))
+        except UnicodeDecodeError:
+            raise IngestError(422, "request body is not valid UTF-8")
+
+    def finish(data: bytes) -> TaskRequest:
+        feed(data, final=True)
+        body = parser.close()
+        if not state["secret_ok"]:
+            raise IngestError(422, "secret is required")
+        try:
+            return TaskRequest.model_validate(body)
+        except ValidationError as e:
+            raise IngestError(422, e.errors(include_url=False, include_context=False, include_input=False))
+
+    pending = bytearray()
+    try:
+        # decoding and spooling happen off the event loop, a slice at a time
+        async for chunk in chunks:
+            total["raw"] += len(chunk)
+            if total["raw"] > settings.MAX_TASK_BODY_BYTES:
+                raise IngestError(413, f"request body exceeds {settings.MAX_TASK_BODY_BYTES} bytes")
+            pending += chunk
+            if len(pending) >= settings.INGEST_SLICE_BYTES:
+                data, pending = bytes(pending), bytearray()
+                await asyncio.to_thread(feed, data)
+        req = await asyncio.to_thread(finish, bytes(pending))
+    except AttachmentTooLarge as e:
+        _discard(decoders)
+        raise IngestError(413, str(e))
+    except DataUriError as e:
+        _discard(decoders)
+        raise IngestError(422, str(e))
+    except BaseException:
+        _discard(decoders)
+        raise
+
+    for i, att in enumerate(req.attachments):
+        dec = decoders.get(i)
+        if dec is not None:
+            att._blob = dec.file
+    return req
+
+class _DecoderSink:
+    def __init__(self, dec: DataUriDecoder):
+        self.dec = dec
+
+    def write(self, s: str) -> None:
+        self.dec.write(s)
+
+    def close(self) -> str:
+        self.dec.close()
+        # keep only the header; the bytes live in the spooled file
+        return f"data:{self.dec.mime};base64,"
+
+def _discard(decoders: Dict[int, DataUriDecoder]) -> None:
+    for dec in decoders.values():
+        dec.discard()
+
+async def ingest_http(request) -> TaskRequest:
+    """FastAPI adapter: maps IngestError to HTTPException."""
+    cl = request.headers.get("content-length")
+    try:
+        return await ingest_task(request.stream(), int(cl) if cl and cl.isdigit() else None)
+    except IngestError as e:
+        raise HTTPException(status_code=e.status, detail=e.detail)
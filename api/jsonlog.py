@@ -0,0 +1,202 @@
+import atexit, fcntl, json, os, threading, time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Append-only JSON-lines log with an in-memory write buffer and size-based
+# rotation (path, path.1 ... path.N), plus readers that page through it with
+# seek() instead of loading whole files:
+#   tail()  walks backwards from the end (or from a cursor) in fixed-size blocks
+#   read()  walks forwards from a byte offset of the live file (for "follow")
+# A cursor is "<generation>:<byte offset>", generation 0 being the live file;
+# a rotation in between requests shifts older cursors by one generation.
+# Several processes may share one path (the API and each api.worker): flushes
+# and rotation happen under an flock on path.lock, the size is taken from the
+# file itself, and a writer whose file was rotated away reopens the new one.
+
+_BLOCK = 64 * 1024
+
+class JsonLineLog:
+    def __init__(self, path: str, max_bytes: int, backups: int = 3,
+                 buffer_bytes: int = 64 * 1024, flush_interval: float = 0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.buffer_bytes = buffer_bytes
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buf: List[bytes] = []
+        self._buffered = 0
+        self._f = None
+        self._lockf = None
+        self._flusher: Optional[threading.Thread] = None
+
+    # ---------- writing ----------
+    def write(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, default=str, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._buf.append(line)
+            self._buffered += len(line)
+            if self._buffered >= self.buffer_bytes:
+                self._flush_locked()
+            elif self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="jsonlog-flush", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print("[jsonlog] flush failed:", e)
+
+    def _flush_locked(self) -> None:
+        if not self._buf:
+            return
+        data = b"".join(self._buf)
+        self._buf, self._buffered = [], 0
+        if self._lockf is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._lockf = open(self.path + ".lock", "ab")
+        fcntl.flock(self._lockf, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            size = os.fstat(self._f.fileno()).st_size
+            if size and size + len(data) > self.max_bytes:
+                self._rotate_locked()
+            self._f.write(data)
+            self._f.flush()
+        finally:
+            fcntl.flock(self._lockf, fcntl.LOCK_UN)
+
+    def _reopen_if_rotated(self) -> None:
+        """Another process may have rotated (renamed) the file this one still has open."""
+        if self._f is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._f.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            self._f.close()
+        self._f = open(self.path, "ab")
+
+    def _rotate_locked(self) -> None:
+        self._f.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._f = open(self.path, "ab")
+
+    # ---------- reading ----------
+    def _file(self, generation: int) -> str:
+        return self.path if generation == 0 else f"{self.path}.{generation}"
+
+    def tail(self, n: int, before: Optional[str] = None,
+             match: Optional[Dict[str, str]] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Up to `n` matching records ending just before cursor `before` (default: the
+        newest), oldest first, plus the cursor for the page before them (None at the start).
+        """
+        self.flush()
+        gen, end = _parse_cursor(before) if before else (0, None)
+        out: List[dict] = []
+        cursor = None
+        while gen <= self.backups and len(out) < n:
+            path = self._file(gen)
+            if not os.path.exists(path):
+                break
+            with open(path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                for start, line in _reverse_lines(f, size if end is None else min(end, size)):
+                    rec = _match(line, match)
+                    if rec is not None:
+                        out.append(rec)
+                        if len(out) >= n:
+                            cursor = f"{gen}:{start}" if start > 0 else _older(gen, self.backups, self._file)
+                            break
+            gen, end = gen + 1, None
+        out.reverse()
+        return out, cursor
+
+    def read(self, offset: int = 0, limit: int = 100,
+             match: Optional[Dict[str, str]] = None) -> Tuple[List[dict], int]:
+        """Up to `limit` matching records of the live file from byte `offset`, and the offset to resume at."""
+        self.flush()
+        out: List[dict] = []
+        if not os.path.exists(self.path):
+            return out, 0
+        with open(self.path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            if offset > size:
+                offset = 0  # the file was rotated since that offset was handed out
+            f.seek(offset)
+            pos = offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line; pick it up next time
+                pos += len(line)
+                rec = _match(line, match)
+                if rec is not None:
+                    out.append(rec)
+                    if len(out) >= limit:
+                        break
+        return out, pos
+
+def _older(gen: int, backups: int, file_for) -> Optional[str]:
+    nxt = gen + 1
+    if nxt <= backups and os.path.exists(file_for(nxt)):
+        return f"{nxt}:{os.path.getsize(file_for(nxt))}"
+    return None
+
+def _parse_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        gen, off = cursor.split(":", 1)
+        return int(gen), int(off)
+    except ValueError:
+        raise ValueError(f"bad cursor {cursor!r}")
+
+def _reverse_lines(f, end: int) -> Iterator[Tuple[int, bytes]]:
+    """(start offset, line) for each line of f[:end], last line first."""
+    pos = end
+    head = b""
+    while pos > 0:
+        n = min(_BLOCK, pos)
+        pos -= n
+        f.seek(pos)
+        chunk = f.read(n) + head
+        parts = chunk.split(b"\n")
+        head = parts[0]  # may continue in the previous block
+        off = pos + len(chunk)
+        for part in reversed(parts[1:]):
+            off -= len(part) + 1
+            if part:
+                yield off + 1, part
+    if head:
+        yield 0, head
+
+def _match(line: bytes, match: Optional[Dict[str, str]]) -> Optional[dict]:
+    if match:
+        # cheap byte test before paying for json.loads
+        for v in match.values():
+            if json.dumps(v, ensure_ascii=False)[1:-1].encode("utf-8") not in line:
+                return None
+    try:
+        rec = json.loads(line)
+    except ValueError:
+        return None
+    if match:
+        for k, v in match.items():
+            if str(rec.get(k)) != v:
+                return None
+    return rec
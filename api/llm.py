@@ -1,24 +1,206 @@
-from typing import List, Dict, Tuple
-import re
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Tuple
+import asyncio, json, re, threading, time
 from .settings import settings
-
-try:
-    # modern OpenAI client (works with AI Pipe base_url)
-    from openai import OpenAI
-except ImportError:
-    OpenAI = None
+from .llm_cache import cache_key, response_cache
+from .llm_stream import BlockStreamParser, StreamAbort
+from .llm_limits import admission, estimate_tokens
+from .scheduler import current_job
+from .guardrails import GuardrailError
+from .patching import PatchError, apply_edits, parse_edits
+from . import aio, metrics
 
 # ---------- client ----------
-def _client():
-    if OpenAI is None:
+_aclient_obj = None
+_aclient_lock = threading.Lock()
+
+def _aclient():
+    """
+    One long-lived AsyncOpenAI client (and so one httpx connection pool) shared by
+    every call. It lives on the aio loop; use it only from coroutines run there.
+    """
+    global _aclient_obj
+    try:
+        # modern OpenAI client (works with AI Pipe base_url); imported here because
+        # it takes ~0.3s, which the server shouldn't pay before it can accept requests
+        from openai import AsyncOpenAI
+    except ImportError:
         raise RuntimeError("openai package is not installed")
     if not settings.OPENAI_API_KEY or not settings.OPENAI_BASE_URL:
         raise RuntimeError("OPENAI_API_KEY/OPENAI_BASE_URL not set")
-    return OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+    with _aclient_lock:
+        if _aclient_obj is None:
+            import httpx
+            _aclient_obj = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=settings.LLM_TIMEOUT_S,
+                max_retries=0,  # retries are paced by the admission controller
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=settings.LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+                    ),
+                    timeout=settings.LLM_TIMEOUT_S,
+                ),
+            )
+        return _aclient_obj
+
+async def awarm() -> None:
+    """Create the client and open a pooled connection to the provider (start-up warm-up)."""
+    try:
+        await _aclient().models.list()
+    except Exception as e:
+        if getattr(e, "status_code", None) is None:
+            raise  # no HTTP answer at all; an error status still means the connection is up
+
+async def _achat(model: str, system: str, user: str, temperature: float,
+                 on_text: Optional[Callable[[str], None]] = None, kind: str = "chat",
+                 max_tokens: Optional[int] = None) -> str:
+    """
+    With `on_text`, the completion is streamed and each delta is passed to it;
+    if it raises, the stream is closed (cancelling generation) and the error propagates.
+    Calls go through the admission controller (api/llm_limits.py), which also
+    retries provider throttling within the running job's deadline.
+    """
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+    streamed = []
+    extra = {"max_tokens": max_tokens} if max_tokens else {}
+
+    async def attempt() -> Tuple[str, Optional[int]]:
+        if on_text is None:
+            resp = await _aclient().chat.completions.create(
+                model=model, messages=messages, temperature=temperature, **extra,
+            )
+            metrics.record_llm_usage(kind, model, resp.usage)
+            return resp.choices[0].message.content, getattr(resp.usage, "total_tokens", None)
+
+        stream = await _aclient().chat.completions.create(
+            model=model, messages=messages, temperature=temperature, stream=True,
+            stream_options={"include_usage": True}, **extra,
+        )
+        used = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    metrics.record_llm_usage(kind, model, chunk.usage)
+                    used = chunk.usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    streamed.append(delta)
+                    on_text(delta)
+        finally:
+            await stream.close()
+        return "".join(streamed), used
+
+    job = current_job.get()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        content = await admission.run(
+            attempt, estimate_tokens(system, user), deadline=job.deadline if job else None, kind=kind,
+            can_retry=lambda: not streamed,  # deltas already reached on_text can't be replayed
+        )
+        outcome = "ok"
+        return content
+    finally:
+        metrics.observe("llm_seconds", time.perf_counter() - start, "LLM completion latency in seconds",
+                        kind=kind, model=model, outcome=outcome)
+
+Repairer = Callable[[str, GuardrailError], Awaitable[str]]
+
+# The seed differs per nonce, so a resent task would never hit the cache if it
+# were part of the key: prompts are keyed, and completions stored, with the
+# seed swapped for a marker, and a hit gets the current seed put back.
+_SEED_MARK = "<<SEED>>"
+
+def _unseed(text: str, seed: str) -> str:
+    return text.replace(seed, _SEED_MARK) if seed else text
+
+def _reseed(text: str, seed: str) -> str:
+    return text.replace(_SEED_MARK, seed) if seed else text
+
+async def _achat_cached(model: str, system: str, user: str, temperature: float,
+                        parse: Callable[[str], Any],
+                        on_text: Optional[Callable[[str], None]] = None, kind: str = "chat",
+                        repair: Optional[Repairer] = None, max_tokens: Optional[int] = None,
+                        seed: str = "") -> Any:
+    """
+    Cached completion. `parse` turns the raw text into the caller's result and must
+    raise if it is unusable; only responses that parse (and validate) are stored.
+    When parse fails a guardrail, `repair(content, error)` gets up to
+    LLM_REPAIR_ATTEMPTS tries to return fixed content; the fixed version is cached.
+    `seed` is left out of the key (see _SEED_MARK).
+    """
+    key = cache_key(model, temperature, system, _unseed(user, seed)) if settings.LLM_CACHE_ENABLED else None
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            try:
+                result = parse(_reseed(cached, seed))
+                metrics.inc("llm_cache_total", help="LLM response cache lookups", kind=kind, result="hit")
+                return result
+            except Exception:
+                pass  # stale under current rules; regenerate
+        metrics.inc("llm_cache_total", help="LLM response cache lookups", kind=kind, result="miss")
+    content = await _achat(model, system, user, temperature, on_text, kind, max_tokens)
+    attempts = settings.LLM_REPAIR_ATTEMPTS if repair else 0
+    while True:
+        try:
+            result = parse(content)
+            break
+        except GuardrailError as e:
+            if attempts <= 0:
+                raise
+            attempts -= 1
+            content = await repair(content, e)
+    if key:
+        response_cache.put(key, _unseed(content, seed))
+    return result
+
+# ---------- model tiers ----------
+class OutputRejected(RuntimeError):
+    """The completion arrived but is unusable (e.g. the code blocks are missing)."""
+
+# output problems a stronger model may not have; transport/admission errors are not retried here
+_ESCALATE = (OutputRejected, GuardrailError, StreamAbort)
+
+def model_tiers() -> List[str]:
+    """LLM_MODEL_TIERS, cheapest first."""
+    return [m.strip() for m in settings.LLM_MODEL_TIERS.split(",") if m.strip()] or ["gpt-4o-mini"]
+
+def _tier_model(tier: int) -> str:
+    tiers = model_tiers()
+    return tiers[max(0, min(tier, len(tiers) - 1))]
+
+async def _aescalate(call: Callable[[str], Awaitable[Any]], kind: str,
+                     escalate: Tuple[type, ...] = _ESCALATE) -> Any:
+    """call(model) on each tier in turn until one is accepted; the last tier's error propagates."""
+    tiers = model_tiers()
+    for tier, model in enumerate(tiers):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await call(model)
+            outcome = "ok"
+            return result
+        except escalate as e:
+            outcome = "rejected"
+            if tier == len(tiers) - 1:
+                raise
+            print(f"[llm] {kind} from {model} rejected ({e}); escalating to {tiers[tier + 1]}")
+        finally:
+            metrics.inc("llm_tier_total", help="LLM tier attempts by outcome",
+                        kind=kind, tier=tier, model=model, outcome=outcome)
+            metrics.observe("llm_tier_seconds", time.perf_counter() - start, "LLM tier attempt latency in seconds",
+                            kind=kind, tier=tier, outcome=outcome)
 
 # ---------- LLM README ----------
-def generate_readme_via_llm(brief: str, checks: List[str], repo_url: str = "", pages_url: str = "") -> str:
-    client = _client()
+async def agenerate_readme_via_llm(brief: str, checks: List[str], repo_url: str = "", pages_url: str = "") -> str:
     req = (
         "Write a professional README.md for a static web app.\n"
         "Include these sections exactly and in this order:\n"
@@ -28,46 +210,222 @@ def generate_readme_via_llm(brief: str, checks: List[str], repo_url: str = "", p
         + (f"Live URL: {pages_url}\n" if pages_url else "")
         + "Keep it concise and actionable."
     )
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",  # or "openai/gpt-4.1-nano" if using OpenRouter naming
-        messages=[
-            {"role": "system", "content": "You write concise, high-quality GitHub READMEs."},
-            {"role": "user", "content": req},
-        ],
+    def parse(content: str) -> str:
+        if not content or not content.strip():
+            raise RuntimeError("LLM returned an empty README")
+        return content.strip()
+
+    return await _achat_cached(
+        _tier_model(settings.LLM_README_TIER),
+        "You write concise, high-quality GitHub READMEs.",
+        req,
         temperature=0.2,
+        parse=parse,
+        kind="readme",
     )
-    return resp.choices[0].message.content.strip()
+
+def generate_readme_via_llm(brief: str, checks: List[str], repo_url: str = "", pages_url: str = "") -> str:
+    return aio.run(agenerate_readme_via_llm(brief, checks, repo_url, pages_url))
 
 # ---------- synthesis ----------
+# Prompts are a constant prefix (rules, output format) followed by the per-task
+# part: the prefix is built once at import, and providers that cache prompt
+# prefixes only bill and process the task-specific suffix in full.
+_SYNTH_SYSTEM = "Generate only the two code blocks requested; no extra prose."
+_SYNTH_PREFIX = """
+You are generating a minimal static web app with exactly two files: index.html and app.js.
+
+Rules:
+- Satisfy the brief and all checks.
+- Required selectors (e.g. #total-sales, #github-created-at) must exist and be updated by JS.
+- If a title is required, set document.title.
+- If Bootstrap is required, include a <link> whose href contains 'bootstrap'.
+- If 'highlight.js' is required, include its script and call highlightElement on code blocks.
+- If attachments are referenced, use fetch('<filename>') with one of the attachment names listed below.
+- Use vanilla JS and CDN links (Bootstrap 5 via jsDelivr, marked, highlight.js).
+- Keep total output < 200 lines.
+
+Output FORMAT (strict):
+<<INDEX_HTML>>
+[the full HTML file here]
+<</INDEX_HTML>>
+
+<<APP_JS>>
+[the full JS file here]
+<</APP_JS>>
+"""
+
+def _task_prompt(prefix: str, seed: str, var_lines: str, brief: str, checks_text: str,
+                 head: str = "", tail: str = "") -> str:
+    """`prefix` plus the per-task part, formatted in one go (no intermediate copies)."""
+    return f"""{prefix}{head}
+Seed/context variables:
+- seed: {seed}
+{var_lines}
+
+Brief:
+{brief}
+
+Checks to satisfy:
+{checks_text}
+{tail}"""
+
+def _synth_prompt(seed: str, var_lines: str, brief: str, checks_text: str, attach_list: List[str]) -> str:
+    return _task_prompt(_SYNTH_PREFIX, seed, var_lines, brief, checks_text,
+                        head=f"\nAttachments: {attach_list or '[]'}\n")
+
 _FENCE_RE = re.compile(r"<<(INDEX_HTML|APP_JS)>>\s*([\s\S]*?)\s*<</\1>>", re.IGNORECASE)
 
+def _fence(text: str, tag: str) -> str:
+    """Body of the last complete <<TAG>>...<</TAG>> block in `text`, or ""."""
+    start, end = f"<<{tag}>>", f"<</{tag}>>"
+    a = b = 0
+    i = text.find(start)
+    while i >= 0:
+        j = text.find(end, i + len(start))
+        if j < 0:
+            break
+        a, b = i + len(start), j
+        i = text.find(start, j + len(end))
+    # trim before slicing so the body is copied once
+    while a < b and text[a].isspace():
+        a += 1
+    while b > a and text[b - 1].isspace():
+        b -= 1
+    return text[a:b]
+
 def _extract_blocks(text: str) -> Tuple[str, str]:
-    html, js = "", ""
+    html, js = _fence(text, "INDEX_HTML"), _fence(text, "APP_JS")
+    if html and js:
+        return html, js
+    # tags in another case; rare enough for the regex
     for kind, body in _FENCE_RE.findall(text):
         if kind.upper() == "INDEX_HTML": html = body.strip()
         elif kind.upper() == "APP_JS":   js = body.strip()
     return html, js
 
-def synthesize_app(brief: str, checks: List[str], seed: str, attachments: Dict[str, bytes], extra_vars: Dict[str, str]) -> Dict[str, str]:
-    client = _client()
+Validator = Callable[[Dict[str, str]], None]
+HtmlValidator = Callable[[str], None]
+
+async def asynthesize_app(brief: str, checks: List[str], seed: str, attachments: Dict[str, bytes], extra_vars: Dict[str, str],
+                          validate: Optional[Validator] = None,
+                          validate_html: Optional[HtmlValidator] = None) -> Dict[str, str]:
+    """
+    `validate` (e.g. the guardrails) runs on the extracted files and should raise on
+    failure; a response is cached only once it has passed. In streaming mode
+    `validate_html` runs as soon as index.html is complete, before app.js arrives.
+    """
     attach_list = list(attachments.keys())
     checks_text = "\n".join(f"- {c}" for c in checks)
     var_lines = "\n".join(f"- {k}: {v}" for k, v in (extra_vars or {}).items()) or "- (no extra vars)"
 
-    prompt = f"""
-You are generating a minimal static web app with exactly two files: index.html and app.js.
+    prompt = _synth_prompt(seed, var_lines, brief, checks_text, attach_list)
+    def parse(content: str) -> Dict[str, str]:
+        html, js = _extract_blocks(content)
+        if not html or not js:
+            raise OutputRejected("LLM did not return required code blocks")
+        files = {"index.html": html, "app.js": js}
+        if validate:
+            validate(files)
+        return files
 
-Rules:
-- Satisfy the brief and all checks.
-- Required selectors (e.g. #total-sales, #github-created-at) must exist and be updated by JS.
-- If a title is required, set document.title.
-- If Bootstrap is required, include a <link> whose href contains 'bootstrap'.
-- If 'highlight.js' is required, include its script and call highlightElement on code blocks.
-- If attachments are referenced, use fetch('<filename>') where filename is one of: {attach_list or "[]"}.
-- Use vanilla JS and CDN links (Bootstrap 5 via jsDelivr, marked, highlight.js).
-- Keep total output < 200 lines.
+    def on_block(kind: str, body: str):
+        # LLM_STREAM_EARLY_CHECK=False trades the early abort for a repair pass afterwards
+        if kind == "INDEX_HTML" and validate_html and settings.LLM_STREAM_EARLY_CHECK:
+            validate_html(body)
 
-Seed/context variables:
+    system = _SYNTH_SYSTEM
+
+    async def candidate(model: str, temperature: float, on_delta: Optional[Callable[[str], None]] = None,
+                        max_tokens: Optional[int] = None) -> Dict[str, str]:
+        on_text = None
+        if settings.LLM_STREAM:
+            feed = BlockStreamParser(
+                max_tokens=settings.LLM_STREAM_MAX_TOKENS,
+                max_lines=settings.LLM_STREAM_MAX_LINES,
+                max_prose=settings.LLM_STREAM_MAX_PROSE,
+                on_block=on_block,
+            ).feed
+            on_text = feed
+            if on_delta is not None:
+                def on_text(delta: str):
+                    on_delta(delta)
+                    feed(delta)
+        return await _achat_cached(
+            model,
+            system,
+            prompt,
+            temperature=temperature,
+            parse=parse,
+            on_text=on_text,
+            kind="synthesis",
+            repair=lambda content, err: _arepair_app(content, err, len(prompt), model),
+            max_tokens=max_tokens,
+            seed=seed,
+        )
+
+    async def call(model: str) -> Dict[str, str]:
+        if settings.SYNTHESIS_MODE.lower() == "manifest":
+            return await _amanifest_app(model, brief, checks_text, var_lines, seed, attach_list,
+                                        validate, len(prompt))
+        if settings.LLM_SPECULATIVE_K > 1:
+            return await _aspeculate(lambda t, on_delta, cap: candidate(model, t, on_delta, cap),
+                                     (len(system) + len(prompt)) // 4, model)
+        return await candidate(model, 0.15)
+
+    return await _aescalate(call, "synthesis")
+
+# ---------- manifest mode ----------
+# Two phases instead of one long completion: a short planning call returns the
+# file list with each file's role and interface, then every file is generated
+# by its own call, concurrently, and the assembled set goes through the
+# guardrails. Wall-clock time follows the largest file, not the total output.
+_PLAN_SYSTEM = "You plan small static web apps. Reply with one JSON object and nothing else."
+_FILE_SYSTEM = "You write one file of a static web app. Output only that file, in the requested fence."
+_MANIFEST_EXTS = (".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt")
+_MANIFEST_RESERVED = ("README.md", "LICENSE", ".github/")
+
+def _parse_manifest(text: str, attachments: List[str]) -> List[Dict[str, str]]:
+    body = text.strip()
+    if body.startswith("```"):
+        body = body.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        files = json.loads(body)["files"]
+    except (ValueError, KeyError, TypeError):
+        raise OutputRejected("planning call did not return a {\"files\": [...]} manifest")
+    required: Dict[str, Dict[str, str]] = {}
+    extras: List[Dict[str, str]] = []
+    for f in files if isinstance(files, list) else []:
+        path = str(f.get("path", "")).strip().removeprefix("./") if isinstance(f, dict) else ""
+        parts = path.split("/")
+        # relative, inside the repo, no hidden files: anything else is dropped, not rewritten
+        if (not path or path.startswith((".", "/")) or "\\" in path or any(p in ("", ".", "..") for p in parts)
+                or path in attachments or not path.endswith(_MANIFEST_EXTS) or path.startswith(_MANIFEST_RESERVED)
+                or path in required or any(e["path"] == path for e in extras)):
+            continue
+        entry = {"path": path, "purpose": str(f.get("purpose", "")), "interface": str(f.get("interface", ""))}
+        if path in ("index.html", "app.js"):
+            required[path] = entry
+        else:
+            extras.append(entry)
+    missing = [p for p in ("index.html", "app.js") if p not in required]
+    if missing:
+        raise OutputRejected(f"manifest lacks {', '.join(missing)}")
+    # the cap only ever cuts the optional files
+    return [required["index.html"], required["app.js"]] + extras[:max(0, settings.MANIFEST_MAX_FILES - 2)]
+
+def _file_block(text: str, path: str) -> str:
+    start_tag, end_tag = f"<<FILE {path}>>", "<</FILE>>"
+    i = text.find(start_tag)
+    if i < 0:
+        return ""
+    i += len(start_tag)
+    j = text.find(end_tag, i)
+    return (text[i:] if j < 0 else text[i:j]).strip()
+
+async def _amanifest_app(model: str, brief: str, checks_text: str, var_lines: str, seed: str,
+                         attach_list: List[str], validate: Optional[Validator], prompt_chars: int) -> Dict[str, str]:
+    context = f"""Seed/context variables:
 - seed: {seed}
 {var_lines}
 
@@ -77,25 +435,304 @@ Brief:
 Checks to satisfy:
 {checks_text}
 
+Attachments already in the repo (fetch them, don't generate them): {attach_list or "[]"}
+"""
+    plan_prompt = f"""{context}
+Plan the files of this app. index.html and app.js are required (index.html loads
+app.js); add CSS, JSON data or extra JS modules only where they help. At most
+{settings.MANIFEST_MAX_FILES} files. For each file give its purpose and its interface to the other
+files (element ids, exported functions, globals, data shape).
+
+Output FORMAT (strict JSON):
+{{"files": [{{"path": "index.html", "purpose": "...", "interface": "..."}}, ...]}}
+"""
+    with metrics.span("llm_plan"):
+        manifest = await _achat_cached(model, _PLAN_SYSTEM, plan_prompt, temperature=0.1,
+                                       parse=lambda text: _parse_manifest(text, attach_list), kind="plan",
+                                       seed=seed)
+    listing = "\n".join(f"- {f['path']}: {f['purpose']} | interface: {f['interface']}" for f in manifest)
+
+    async def one(path: str) -> str:
+        user = f"""{context}
+App files (the others are written in parallel from this same plan; stick to the interfaces):
+{listing}
+
+Write {path} in full (under 150 lines).
+
 Output FORMAT (strict):
+<<FILE {path}>>
+[the file]
+<</FILE>>
+"""
+        # not cached on its own: only the assembled app is, once it has passed validation
+        body = _file_block(await _achat(model, _FILE_SYSTEM, user, 0.15, kind="file"), path)
+        if not body:
+            raise OutputRejected(f"LLM did not return {path}")
+        return body
+
+    def from_blocks(text: str) -> Dict[str, str]:
+        files = {f["path"]: _file_block(text, f["path"]) for f in manifest}
+        if not all(files.values()):
+            raise OutputRejected("cached manifest app is incomplete")
+        return files
+
+    key = cache_key(model, 0.15, _FILE_SYSTEM, _unseed(plan_prompt + listing, seed)) \
+        if settings.LLM_CACHE_ENABLED else None
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            try:
+                files = from_blocks(_reseed(cached, seed))
+                if validate:
+                    validate(files)
+                metrics.inc("llm_cache_total", help="LLM response cache lookups", kind="manifest", result="hit")
+                return files
+            except Exception:
+                pass  # stale under current rules; regenerate
+        metrics.inc("llm_cache_total", help="LLM response cache lookups", kind="manifest", result="miss")
+
+    with metrics.span("llm_files"):
+        bodies = await aio.gather_or_cancel(*(one(f["path"]) for f in manifest))
+    files = {f["path"]: body for f, body in zip(manifest, bodies)}
+    metrics.observe("llm_manifest_files", len(files), "Files per manifest-mode app", buckets=(2, 3, 4, 5, 6, 8, 12))
+
+    attempts = settings.LLM_REPAIR_ATTEMPTS
+    while validate:
+        try:
+            validate(files)
+            break
+        except GuardrailError as e:
+            # the rules read index.html and app.js, so those are the files a repair touches
+            if attempts <= 0:
+                raise
+            attempts -= 1
+            fixed = await _arepair_app(_compose_blocks(files["index.html"], files["app.js"]), e, prompt_chars, model)
+            files["index.html"], files["app.js"] = _extract_blocks(fixed)
+    if key:
+        response_cache.put(key, _unseed("\n".join(f"<<FILE {p}>>\n{body}\n<</FILE>>" for p, body in files.items()), seed))
+    return files
+
+# ---------- speculative candidates ----------
+Candidate = Callable[[float, Callable[[str], None], Optional[int]], Awaitable[Any]]
+
+def _speculative_temperatures(k: int) -> List[float]:
+    temps = [float(t) for t in settings.LLM_SPECULATIVE_TEMPERATURES.split(",") if t.strip()] or [0.15]
+    return [temps[i % len(temps)] for i in range(k)]
+
+async def _aspeculate(make: Candidate, prompt_tokens: int, model: str) -> Any:
+    """
+    Race up to LLM_SPECULATIVE_K candidates, candidate i at the i-th of
+    LLM_SPECULATIVE_TEMPERATURES; the first whose result parses and validates wins.
+    Candidate 0 starts at once, the rest after LLM_SPECULATIVE_DELAY_S without a
+    winner (0 = together) or as soon as a running candidate is rejected. Losers are
+    cancelled unless LLM_SPECULATIVE_CANCEL is off (then they run on and can fill
+    the cache). If every candidate fails, the first error is raised.
+    """
+    k = settings.LLM_SPECULATIVE_K
+    temps = _speculative_temperatures(k)
+    cap = settings.LLM_SPECULATIVE_MAX_TOKENS or None
+    streamed = [0] * k
+    running: Dict[asyncio.Future, int] = {}
+    waiting = list(range(k))
+    outcome: Dict[int, str] = {}
+    first_error: Optional[BaseException] = None
+
+    def launch() -> None:
+        i = waiting.pop(0)
+        def on_delta(delta: str):
+            streamed[i] += len(delta)
+        running[asyncio.ensure_future(make(temps[i], on_delta, cap))] = i
+
+    launch()
+    try:
+        while running or waiting:
+            delay = settings.LLM_SPECULATIVE_DELAY_S
+            while waiting and (delay <= 0 or not running):
+                launch()
+            done, _ = await asyncio.wait(running, timeout=delay if waiting else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()  # hedge: nobody has won within the delay
+                continue
+            for fut in done:
+                i = running.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    outcome[i] = "rejected"
+                    first_error = first_error or e
+                    if waiting:
+                        launch()
+                    continue
+                outcome[i] = "won"
+                return result
+        raise first_error
+    finally:
+        for fut, i in running.items():
+            if settings.LLM_SPECULATIVE_CANCEL:
+                fut.cancel()
+                outcome[i] = "cancelled"
+            else:
+                fut.add_done_callback(lambda f: f.cancelled() or f.exception())  # no "never retrieved" warnings
+                outcome[i] = "abandoned"
+        wasted = 0
+        for i, result in outcome.items():
+            metrics.inc("llm_speculative_total", help="Speculative synthesis candidates by outcome",
+                        model=model, candidate=i, outcome=result)
+            if result != "won":
+                # estimated: the prompt plus what had streamed back (non-streamed losers count the prompt only)
+                wasted += prompt_tokens + streamed[i] // 4
+        if wasted:
+            metrics.inc("llm_speculative_wasted_tokens_total", wasted,
+                        help="Estimated tokens spent on speculative candidates that did not win", model=model)
+
+_REPAIR_SYSTEM = (
+    "You fix small defects in an existing static web app. Change only what the listed "
+    "issues require and return only the code blocks you changed, each in full."
+)
+
+def _compose_blocks(html: str, js: str) -> str:
+    return f"<<INDEX_HTML>>\n{html}\n<</INDEX_HTML>>\n\n<<APP_JS>>\n{js}\n<</APP_JS>>"
+
+async def _arepair_app(content: str, err: GuardrailError, prompt_chars: int, model: str) -> str:
+    """
+    One targeted repair pass: the current files plus the guardrail violations go back
+    to the model, which answers with just the blocks it fixed. Returns merged content.
+    """
+    html, js = _extract_blocks(content)
+    issues = "\n".join(f"- [{v.rule}] {v.message}" for v in err.violations) or f"- {err}"
+    user = f"""Fix these issues and nothing else:
+{issues}
+
+Current files:
 <<INDEX_HTML>>
-[the full HTML file here]
+{html}
 <</INDEX_HTML>>
 
 <<APP_JS>>
-[the full JS file here]
+{js}
 <</APP_JS>>
+
+Reply with only the changed block(s), in the same <<INDEX_HTML>> / <<APP_JS>> format.
 """
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",  # or "openai/gpt-4.1-nano"
-        messages=[
-            {"role": "system", "content": "Generate only the two code blocks requested; no extra prose."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.15,
-    )
-    content = resp.choices[0].message.content
+    with metrics.span("llm_repair"):
+        fixed = await _achat(model, _REPAIR_SYSTEM, user, 0.0, kind="repair")
+    new_html, new_js = _extract_blocks(fixed)
+    if not new_html and not new_js:
+        metrics.inc("llm_repair_total", help="Guardrail repair passes", outcome="empty")
+        return content
+    metrics.inc("llm_repair_total", help="Guardrail repair passes", outcome="applied")
+    # versus regenerating: the full prompt plus a whole new answer, at ~4 chars per token
+    saved = (prompt_chars + len(content) - len(_REPAIR_SYSTEM) - len(user) - len(fixed)) // 4
+    if saved > 0:
+        metrics.inc("llm_repair_tokens_saved_total", saved, help="Estimated tokens saved by repairing instead of regenerating")
+    return _compose_blocks(new_html or html, new_js or js)
+
+# ---------- round-2 patches ----------
+_PATCH_SYSTEM = (
+    "You update an existing two-file static web app. Reply only with SEARCH/REPLACE "
+    "edit blocks for the lines that must change; no extra prose."
+)
+_PATCH_PREFIX = """
+Update this app so it satisfies the new brief and all checks. Keep working code as it is.
+
+Answer FORMAT (strict): one block per change, the file name on the line above it.
+SEARCH must copy existing lines exactly (enough of them to be unique); an empty
+SEARCH appends to the file.
+app.js
+<<<<<<< SEARCH
+[existing lines]
+=======
+[replacement lines]
+>>>>>>> REPLACE
+"""
+
+def _patched_files(content: str, current: Dict[str, str]) -> Dict[str, str]:
     html, js = _extract_blocks(content)
-    if not html or not js:
-        raise RuntimeError("LLM did not return required code blocks")
-    return {"index.html": html, "app.js": js}
+    if html or js:
+        # whole files: the model ignored the edit format, or this is a repaired answer
+        return {"index.html": html or current["index.html"], "app.js": js or current["app.js"]}
+    edits = parse_edits(content, list(current))
+    if not edits:
+        raise PatchError("LLM returned no edit blocks")
+    return apply_edits(current, edits)
+
+async def apatch_app(brief: str, checks: List[str], seed: str, current: Dict[str, str],
+                     extra_vars: Dict[str, str], validate: Optional[Validator] = None) -> Dict[str, str]:
+    """
+    Round 2 as edits to the current index.html/app.js, so output tokens scale with
+    the size of the change. Raises PatchError if an edit does not apply.
+    """
+    checks_text = "\n".join(f"- {c}" for c in checks)
+    var_lines = "\n".join(f"- {k}: {v}" for k, v in (extra_vars or {}).items()) or "- (no extra vars)"
+    prompt = _task_prompt(_PATCH_PREFIX, seed, var_lines, brief, checks_text, tail=f"""
+Current files:
+<<INDEX_HTML>>
+{current["index.html"]}
+<</INDEX_HTML>>
+
+<<APP_JS>>
+{current["app.js"]}
+<</APP_JS>>
+""")
+    def parse(content: str) -> Dict[str, str]:
+        files = _patched_files(content, current)
+        if validate:
+            validate(files)
+        return files
+
+    async def call(model: str) -> Dict[str, str]:
+        def repair(content: str, err: GuardrailError) -> Awaitable[str]:
+            files = _patched_files(content, current)
+            return _arepair_app(_compose_blocks(files["index.html"], files["app.js"]), err, len(prompt), model)
+
+        # not streamed: the stream parser and its early guardrail check expect whole files
+        return await _achat_cached(model, _PATCH_SYSTEM, prompt, temperature=0.15,
+                                   parse=parse, kind="patch", repair=repair, seed=seed)
+
+    return await _aescalate(call, "patch", _ESCALATE + (PatchError,))
+
+async def aupdate_app(brief: str, checks: List[str], seed: str, current: Dict[str, str],
+                      extra_vars: Dict[str, str], validate: Optional[Validator] = None,
+                      validate_html: Optional[HtmlValidator] = None) -> Dict[str, str]:
+    """Patch when ROUND2_MODE is "patch", regenerating from scratch if the patch fails."""
+    if settings.ROUND2_MODE.lower() == "patch":
+        try:
+            files = await apatch_app(brief, checks, seed, current, extra_vars, validate)
+            metrics.inc("llm_patch_total", help="Round-2 patch attempts", outcome="applied")
+            return files
+        except (PatchError,) + _ESCALATE as e:
+            metrics.inc("llm_patch_total", help="Round-2 patch attempts", outcome="fallback")
+            print(f"[llm] round-2 patch failed ({e}); regenerating")
+    return await asynthesize_app(brief, checks, seed, {}, extra_vars, validate, validate_html)
+
+def synthesize_app(brief: str, checks: List[str], seed: str, attachments: Dict[str, bytes], extra_vars: Dict[str, str],
+                   validate: Optional[Validator] = None,
+                   validate_html: Optional[HtmlValidator] = None) -> Dict[str, str]:
+    return aio.run(asynthesize_app(brief, checks, seed, attachments, extra_vars, validate, validate_html))
+
+# ---------- combined ----------
+def synthesize_app_and_readme(brief: str, checks: List[str], seed: str, attachments: Dict[str, bytes],
+                              extra_vars: Dict[str, str], repo_url: str = "", pages_url: str = "",
+                              validate: Optional[Validator] = None,
+                              validate_html: Optional[HtmlValidator] = None) -> Tuple[Dict[str, str], str]:
+    """
+    The README depends only on brief/checks, so run it alongside app synthesis
+    instead of after it. If either call fails the other is cancelled.
+    """
+    files, readme = aio.run(aio.gather_or_cancel(
+        asynthesize_app(brief, checks, seed, attachments, extra_vars, validate, validate_html),
+        agenerate_readme_via_llm(brief, checks, repo_url, pages_url),
+    ))
+    return files, readme
+
+def update_app_and_readme(brief: str, checks: List[str], seed: str, current: Dict[str, str],
+                          extra_vars: Dict[str, str], repo_url: str = "", pages_url: str = "",
+                          validate: Optional[Validator] = None,
+                          validate_html: Optional[HtmlValidator] = None) -> Tuple[Dict[str, str], str]:
+    """Round-2 counterpart of synthesize_app_and_readme: the app is patched from `current`."""
+    files, readme = aio.run(aio.gather_or_cancel(
+        aupdate_app(brief, checks, seed, current, extra_vars, validate, validate_html),
+        agenerate_readme_via_llm(brief, checks, repo_url, pages_url),
+    ))
+    return files, readme
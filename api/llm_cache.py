@@ -0,0 +1,163 @@
+import hashlib, json, os, pathlib, threading, time
+from collections import OrderedDict
+from typing import Dict, Optional
+from .settings import settings
+
+def cache_key(model: str, temperature: float, system: str, user: str) -> str:
+    raw = json.dumps([model, round(float(temperature), 4), system, user], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Content-addressed LLM response cache.
+    Tier 1: bounded in-memory LRU. Tier 2: size-capped directory of JSON files,
+    evicted oldest-first when over the cap. Both tiers honour the TTL.
+    """
+    def __init__(self, mem_items: int, disk_dir: str, disk_max_bytes: int, ttl_s: float):
+        self.mem_items = mem_items
+        self.disk_dir = pathlib.Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_s = ttl_s
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.counters: Dict[str, int] = {
+            "hits_mem": 0, "hits_disk": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0,
+        }
+
+    # ---------- public ----------
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                ts, value = item
+                if now - ts <= self.ttl_s:
+                    self._mem.move_to_end(key)
+                    self.counters["hits_mem"] += 1
+                    return value
+                self._mem.pop(key)
+                self.counters["expired"] += 1
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits_disk"] += 1
+        self._mem_put(key, value, now)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        self._mem_put(key, value, now)
+        self._disk_put(key, value, now)
+        with self._lock:
+            self.counters["stores"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self.counters)
+            out["mem_items"] = len(self._mem)
+            out["disk_bytes"] = self._disk_bytes or 0
+        return out
+
+    # ---------- memory tier ----------
+    def _mem_put(self, key: str, value: str, ts: float) -> None:
+        if self.mem_items <= 0:
+            return
+        with self._lock:
+            self._mem[key] = (ts, value)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.mem_items:
+                self._mem.popitem(last=False)
+
+    # ---------- disk tier ----------
+    def _path(self, key: str) -> pathlib.Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> Optional[str]:
+        if self.disk_dir is None:
+            return None
+        p = self._path(key)
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if now - data.get("ts", 0) > self.ttl_s:
+            self._disk_remove(p)
+            with self._lock:
+                self.counters["expired"] += 1
+            return None
+        return data.get("value")
+
+    def _disk_put(self, key: str, value: str, ts: float) -> None:
+        if self.disk_dir is None or self.disk_max_bytes <= 0:
+            return
+        p = self._path(key)
+        blob = json.dumps({"ts": ts, "value": value}, ensure_ascii=False).encode("utf-8")
+        if len(blob) > self.disk_max_bytes:
+            return
+        with self._lock:
+            self._disk_usage()  # first scan must not see the entry being written
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            old = p.stat().st_size if p.exists() else 0
+            tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(blob)
+            os.replace(tmp, p)
+        except OSError as e:
+            print("WARN: LLM cache disk write failed:", e)
+            return
+        with self._lock:
+            self._disk_bytes += len(blob) - old
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._disk_evict()
+
+    def _disk_usage(self) -> int:
+        # caller holds the lock; scan once, then track incrementally
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(f.stat().st_size for f in self.disk_dir.glob("*/*.json"))
+        return self._disk_bytes
+
+    def _disk_remove(self, p: pathlib.Path) -> None:
+        try:
+            size = p.stat().st_size
+            p.unlink()
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+
+    def _disk_evict(self) -> None:
+        files = []
+        for f in self.disk_dir.glob("*/*.json"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_max_bytes * 0.9)
+        evicted = 0
+        for _, size, f in files:
+            if total <= target:
+                break
+            try:
+                f.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["evictions"] += evicted
+
+response_cache = ResponseCache(
+    mem_items=settings.LLM_CACHE_MEM_ITEMS,
+    disk_dir=settings.LLM_CACHE_DIR,
+    disk_max_bytes=settings.LLM_CACHE_DISK_MB * 1024 * 1024,
+    ttl_s=settings.LLM_CACHE_TTL_S,
+)
@@ -0,0 +1,232 @@
+import asyncio, collections, email.utils, random, re, time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from . import metrics
+from .settings import settings
+
+# Admission control for LLM calls (all of which run on the shared aio loop, so
+# no locking is needed here). A call passes three gates before it is sent:
+#   1. a global pause while the provider has told us to back off (429 Retry-After)
+#   2. token buckets for requests/min and tokens/min (LLM_RPM / LLM_TPM; 0 = off)
+#   3. an AIMD concurrency limit: +1/limit per healthy response, halved on a 429
+#      or when short-term latency inflates well past its long-term average
+# Waiting is bounded by the running job's deadline (scheduler.current_job).
+
+class AdmissionTimeout(RuntimeError):
+    """The call could not be admitted (or retried) before the job's deadline."""
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def reserve(self, n: float) -> float:
+        """Take `n` now (the balance may go negative); returns seconds until it is covered."""
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.level -= min(n, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, n: float) -> None:
+        self.level = min(self.capacity, self.level + n)
+
+class AdaptiveLimit:
+    """FIFO concurrency limiter whose limit is adjusted AIMD-style."""
+    def __init__(self, initial: int, lo: int, hi: int, inflation: float):
+        self.lo, self.hi, self.inflation = lo, hi, inflation
+        self.limit = float(max(lo, min(hi, initial)))
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._ewma: Dict[str, Tuple[float, float]] = {}  # kind -> (recent, long-run) latency EWMAs
+        self._last_cut = 0.0
+
+    async def acquire(self, timeout: Optional[float]) -> None:
+        if not self._waiters and self.inflight < int(self.limit):
+            self.inflight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                self.release()  # the slot was handed over as we gave up
+            else:
+                fut.cancel()
+            raise
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.inflight += 1
+            fut.set_result(None)
+
+    def on_success(self, latency: float, kind: str = "") -> None:
+        # latencies are compared per kind: a README and a full app differ a lot in size
+        fast, slow = self._ewma.get(kind, (latency, latency))
+        fast, slow = 0.7 * fast + 0.3 * latency, 0.98 * slow + 0.02 * latency
+        self._ewma[kind] = (fast, slow)
+        if fast > self.inflation * slow:
+            self.decrease(fast)
+        else:
+            self.limit = min(self.hi, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def decrease(self, window: float = 1.0) -> None:
+        # at most one cut per round trip, so a burst of 429s from one window counts once
+        now = time.monotonic()
+        if now - self._last_cut < max(1.0, window):
+            return
+        self._last_cut = now
+        self.limit = max(float(self.lo), self.limit / 2)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for f in self._waiters if not f.done())
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Seconds the provider asked us to wait, 0.0 for a throttle without a hint,
+    or None if `exc` is not a throttle (429 / 503 / 529) at all.
+    """
+    if getattr(exc, "status_code", None) not in (429, 503, 529):
+        return None
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                when = email.utils.parsedate_to_datetime(value)
+                return max(0.0, when.timestamp() - time.time())
+        for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+            if headers.get(h):
+                return sum(float(n) * _UNITS[u] for n, u in _DURATION_RE.findall(headers[h]))
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(t) for t in texts) // 4 + settings.LLM_EST_COMPLETION_TOKENS
+
+class Admission:
+    def __init__(self):
+        self.rpm = TokenBucket(settings.LLM_RPM) if settings.LLM_RPM > 0 else None
+        self.tpm = TokenBucket(settings.LLM_TPM) if settings.LLM_TPM > 0 else None
+        self.limit = AdaptiveLimit(settings.LLM_CONCURRENCY_INITIAL, settings.LLM_CONCURRENCY_MIN,
+                                   settings.LLM_CONCURRENCY_MAX, settings.LLM_LATENCY_INFLATION)
+        self.paused_until = 0.0  # monotonic
+        self.counters = {"admitted": 0, "throttled": 0, "retries": 0, "timeouts": 0}
+
+    def _wait(self, reason: str, seconds: float, deadline: Optional[float]) -> float:
+        if deadline is not None and time.time() + seconds > deadline:
+            self.counters["timeouts"] += 1
+            raise AdmissionTimeout(f"LLM admission ({reason}) would wait {seconds:.1f}s past the job deadline")
+        return seconds
+
+    async def _admit(self, tokens: int, deadline: Optional[float], kind: str) -> None:
+        waited: Dict[str, float] = {}
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(self._wait("retry-after", pause, deadline))
+            waited["retry_after"] = pause
+        delays: Dict[str, float] = {}
+        try:
+            if self.rpm:
+                delays["rpm"] = self.rpm.reserve(1)
+            if self.tpm:
+                delays["tpm"] = self.tpm.reserve(tokens)
+            bucket = max(delays.values(), default=0.0)
+            if bucket > 0:
+                await asyncio.sleep(self._wait(max(delays, key=delays.get), bucket, deadline))
+                waited.update((k, v) for k, v in delays.items() if v > 0)
+            start = time.monotonic()
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                await self.limit.acquire(timeout)
+            except asyncio.TimeoutError:
+                self.counters["timeouts"] += 1
+                raise AdmissionTimeout("LLM admission (concurrency) timed out at the job deadline")
+            if time.monotonic() - start > 0.001:
+                waited["concurrency"] = time.monotonic() - start
+        except BaseException:
+            self._refund(delays, tokens)
+            raise
+        self.counters["admitted"] += 1
+        for reason, seconds in waited.items():
+            metrics.observe("llm_throttle_wait_seconds", seconds, "Time LLM calls wait for admission",
+                            reason=reason, kind=kind)
+        self._gauges()
+
+    def _refund(self, delays: Dict[str, float], tokens: int) -> None:
+        if "rpm" in delays:
+            self.rpm.refund(1)
+        if "tpm" in delays:
+            self.tpm.refund(tokens)
+
+    def _gauges(self) -> None:
+        metrics.gauge("llm_concurrency_limit", self.limit.limit, "Adaptive LLM concurrency limit")
+        metrics.gauge("llm_inflight", self.limit.inflight, "LLM calls in flight")
+
+    async def run(self, attempt: Callable[[], Awaitable[Tuple[Any, Optional[int]]]], est_tokens: int,
+                  deadline: Optional[float] = None, kind: str = "chat",
+                  can_retry: Callable[[], bool] = lambda: True) -> Any:
+        """
+        Admit, then await attempt() -> (result, tokens used or None). Throttled
+        attempts are retried after the provider's Retry-After (or jittered backoff)
+        while the deadline allows and `can_retry()` is true.
+        """
+        n = 0
+        while True:
+            await self._admit(est_tokens, deadline, kind)
+            start = time.monotonic()
+            try:
+                result, used = await attempt()
+            except asyncio.CancelledError:
+                self.limit.release()  # e.g. a losing speculative candidate or a cancelled sibling
+                self._gauges()
+                raise
+            except Exception as e:
+                self.limit.release()
+                wait = retry_after(e)
+                if wait is None:
+                    raise
+                self.counters["throttled"] += 1
+                metrics.inc("llm_throttled_total", help="Throttle responses from the LLM provider",
+                            status=getattr(e, "status_code", ""), kind=kind)
+                self.limit.decrease()
+                self._gauges()
+                if n == settings.LLM_MAX_RETRIES or not can_retry():
+                    raise
+                wait = wait or min(30.0, 2 ** n) * random.uniform(0.5, 1.5)
+                self.paused_until = max(self.paused_until, time.monotonic() + wait)
+                self.counters["retries"] += 1
+                n += 1
+                print(f"[llm] throttled ({getattr(e, 'status_code', '')}); retry {n} in {wait:.1f}s")
+                continue
+            self.limit.release()
+            self.limit.on_success(time.monotonic() - start, kind)
+            if used is not None and self.tpm:
+                self.tpm.refund(est_tokens - used)  # settle the estimate (negative = extra debit)
+            self._gauges()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, limit=round(self.limit.limit, 2), inflight=self.limit.inflight,
+                    queued=self.limit.queued, paused_s=round(max(0.0, self.paused_until - time.monotonic()), 2))
+
+admission = Admission()
@@ -0,0 +1,74 @@
+import re
+from typing import Callable, Dict, Optional
+
+_OPEN_RE = re.compile(r"<<(INDEX_HTML|APP_JS)>>", re.IGNORECASE)
+_CLOSE_RE = {
+    "INDEX_HTML": re.compile(r"<</INDEX_HTML>>", re.IGNORECASE),
+    "APP_JS": re.compile(r"<</APP_JS>>", re.IGNORECASE),
+}
+# Longest prefix of an opening fence we may be holding at the end of the buffer.
+_MAX_TAG = max(len(k) for k in _CLOSE_RE) + 4
+
+class StreamAbort(RuntimeError):
+    pass
+
+class BlockStreamParser:
+    """
+    Incremental version of llm._extract_blocks for streamed completions.
+    Feed text deltas as they arrive; each block is reported to `on_block` as soon
+    as its closing fence is seen. Raises StreamAbort (so the caller can cancel the
+    stream) when the output breaks the format or exceeds the budgets.
+    """
+    def __init__(self, max_tokens: int, max_lines: int, max_prose: int,
+                 on_block: Optional[Callable[[str, str], None]] = None):
+        self.max_tokens = max_tokens
+        self.max_lines = max_lines
+        self.max_prose = max_prose
+        self.on_block = on_block
+        self.blocks: Dict[str, str] = {}
+        self.tokens = 0
+        self.lines = 0
+        self._buf = ""
+        self._pos = 0
+        self._kind: Optional[str] = None
+        self._prose = 0
+
+    def feed(self, delta: str) -> None:
+        # one streamed delta is ~one token
+        self.tokens += 1
+        if self.max_tokens and self.tokens > self.max_tokens:
+            raise StreamAbort(f"completion exceeded token budget ({self.max_tokens})")
+        self.lines += delta.count("\n")
+        if self.max_lines and self.lines > self.max_lines:
+            raise StreamAbort(f"completion exceeded line budget ({self.max_lines})")
+        self._buf += delta
+        self._scan()
+
+    def _scan(self) -> None:
+        while True:
+            if self._kind is None:
+                m = _OPEN_RE.search(self._buf, self._pos)
+                if m is None:
+                    # keep a possible partial fence at the tail unscanned
+                    end = max(self._pos, len(self._buf) - _MAX_TAG)
+                    self._count_prose(self._buf[self._pos:end])
+                    self._pos = end
+                    return
+                self._count_prose(self._buf[self._pos:m.start()])
+                self._kind = m.group(1).upper()
+                self._pos = m.end()
+            else:
+                m = _CLOSE_RE[self._kind].search(self._buf, self._pos)
+                if m is None:
+                    return
+                body = self._buf[self._pos:m.start()].strip()
+                kind, self._kind = self._kind, None
+                self._pos = m.end()
+                self.blocks[kind] = body
+                if self.on_block:
+                    self.on_block(kind, body)
+
+    def _count_prose(self, text: str) -> None:
+        self._prose += len(text.strip())
+        if self.max_prose and self._prose > self.max_prose:
+            raise StreamAbort("completion contains prose outside the code fences")
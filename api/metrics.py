@@ -0,0 +1,154 @@
+import bisect, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from .settings import settings
+
+# Minimal Prometheus-style registry (counters, gauges, histograms; text exposition) and
+# per-job tracing spans. Everything is a no-op when METRICS_ENABLED is false.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class _Histogram:
+    def __init__(self, name: str, help: str, buckets):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self.series: Dict[LabelKey, List] = {}
+
+    def observe(self, value: float, labels: LabelKey) -> None:
+        s = self.series.get(labels)
+        if s is None:
+            s = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            s[0][i] += 1
+        s[1] += value
+        s[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, n) in sorted(self.series.items()):
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt(labels + (('le', _num(b)),))} {acc}")
+            out.append(f"{self.name}_bucket{_fmt(labels + (('le', '+Inf'),))} {n}")
+            out.append(f"{self.name}_sum{_fmt(labels)} {total}")
+            out.append(f"{self.name}_count{_fmt(labels)} {n}")
+        return out
+
+class _Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.series: Dict[LabelKey, float] = {}
+
+    def inc(self, value: float, labels: LabelKey) -> None:
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, v in sorted(self.series.items()):
+            out.append(f"{self.name}{_fmt(labels)} {v}")
+        return out
+
+class _Gauge(_Counter):
+    def set(self, value: float, labels: LabelKey) -> None:
+        self.series[labels] = value
+
+    def render(self) -> List[str]:
+        out = super().render()
+        out[1] = f"# TYPE {self.name} gauge"
+        return out
+
+def _num(b) -> str:
+    return repr(float(b)) if isinstance(b, float) else str(b)
+
+def _fmt(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + body + "}"
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, object] = {}
+
+    def _get(self, name: str, factory):
+        m = self._metrics.get(name)
+        if m is None:
+            m = self._metrics.setdefault(name, factory())
+        return m
+
+    def observe(self, name: str, value: float, help: str = "", buckets=LATENCY_BUCKETS, **labels) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._get(name, lambda: _Histogram(name, help or name, buckets)).observe(value, key)
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._get(name, lambda: _Counter(name, help or name)).inc(value, key)
+
+    def set(self, name: str, value: float, help: str = "", **labels) -> None:
+        if not settings.METRICS_ENABLED:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._get(name, lambda: _Gauge(name, help or name)).set(value, key)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+            for name in sorted(self._metrics):
+                lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+observe = registry.observe
+inc = registry.inc
+gauge = registry.set
+
+# ---------- tracing spans ----------
+# The trace (list of finished spans) of the job running in this context, if any.
+current_trace: ContextVar[Optional[List[dict]]] = ContextVar("current_trace", default=None)
+
+@contextmanager
+def span(stage: str, **labels) -> Iterator[None]:
+    """Time a pipeline stage: feeds stage_seconds{stage=...} and the job's trace."""
+    if not settings.METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        dur = time.perf_counter() - start
+        observe("stage_seconds", dur, "Pipeline stage latency in seconds", stage=stage, status=status, **labels)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append({"stage": stage, "seconds": round(dur, 4), "status": status, **labels})
+
+def record_llm_usage(kind: str, model: str, usage) -> None:
+    """Token counts from an OpenAI `usage` object (absent for some streamed responses)."""
+    if usage is None:
+        return
+    for field in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, field, None)
+        if n is not None:
+            observe("llm_tokens", n, "LLM tokens per call", TOKEN_BUCKETS, kind=kind, model=model,
+                    direction=field.split("_")[0])
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if cached:
+        inc("llm_cached_prompt_tokens_total", cached, "Prompt tokens served from the provider's prefix cache",
+            kind=kind, model=model)
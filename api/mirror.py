@@ -0,0 +1,195 @@
+import fcntl, os, pathlib, shutil, subprocess, tempfile, threading, time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from .settings import settings
+from .metrics import observe
+
+# Local bare mirrors of the repos we published in round 1, keyed by repo name.
+# Round 2 reads and commits against the mirror with git plumbing (no working
+# tree, no full clone); a cache miss falls back to a shallow single-branch fetch.
+# Each mirror is guarded by a thread lock plus an flock on <repo>.lock, so
+# worker processes sharing MIRROR_DIR take turns too. Mirrors are evicted least
+# recently used first once MIRROR_MAX_MB or MIRROR_MAX_REPOS is exceeded.
+
+_IDENTITY = {
+    "GIT_AUTHOR_NAME": settings.GITHUB_USERNAME or "llm-deploy-bot",
+    "GIT_AUTHOR_EMAIL": "bot@llm-deploy.local",
+    "GIT_COMMITTER_NAME": settings.GITHUB_USERNAME or "llm-deploy-bot",
+    "GIT_COMMITTER_EMAIL": "bot@llm-deploy.local",
+}
+
+def _git(args: list, git_dir: Optional[pathlib.Path] = None, input: Optional[bytes] = None,
+         env: Optional[dict] = None) -> bytes:
+    cmd = ["git"] + (["--git-dir", str(git_dir)] if git_dir else []) + args
+    print("RUN:", " ".join(cmd))
+    full_env = None
+    if env:
+        full_env = os.environ.copy()
+        full_env.update(env)
+    start = time.perf_counter()
+    try:
+        return subprocess.run(cmd, input=input, env=full_env, check=True, stdout=subprocess.PIPE).stdout
+    finally:
+        observe("subprocess_seconds", time.perf_counter() - start, "git/gh subprocess wall time",
+                cmd=f"git {args[0]}")
+
+def _du(path: pathlib.Path) -> int:
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for n in names:
+            try:
+                total += os.lstat(os.path.join(dirpath, n)).st_size
+            except OSError:
+                pass
+    return total
+
+class MirrorCache:
+    def __init__(self, root: str, max_bytes: int = 0, max_repos: int = 0):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.max_repos = max_repos
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def path(self, repo_name: str) -> pathlib.Path:
+        return self.root / f"{repo_name}.git"
+
+    def _lock_path(self, repo_name: str) -> pathlib.Path:
+        return self.root / f"{repo_name}.lock"
+
+    @contextmanager
+    def lock(self, repo_name: str) -> Iterator[None]:
+        """Exclusive use of one mirror, across threads and processes; also marks it recently used."""
+        with self._guard:
+            tlock = self._locks.setdefault(repo_name, threading.Lock())
+        with tlock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self._lock_path(repo_name), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    if self.has(repo_name):
+                        os.utime(self.path(repo_name))
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def evict(self, keep: str = "") -> int:
+        """
+        Remove least recently used mirrors until under the size and count caps.
+        Mirrors locked by anyone (and `keep`, which the caller holds) are skipped.
+        """
+        if not (self.max_bytes or self.max_repos) or not self.root.exists():
+            return 0
+        entries = []
+        for p in self.root.glob("*.git"):
+            try:
+                entries.append((p.stat().st_mtime, p))
+            except OSError:
+                pass
+        entries.sort()
+        sizes = {p: _du(p) for _, p in entries} if self.max_bytes else {}
+        total, count, removed = sum(sizes.values()), len(entries), 0
+        for _, p in entries:
+            if (not self.max_bytes or total <= self.max_bytes) and (not self.max_repos or count <= self.max_repos):
+                break
+            name = p.name[:-len(".git")]
+            if name == keep:
+                continue
+            with open(self._lock_path(name), "a") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # in use
+                try:
+                    shutil.rmtree(p, ignore_errors=True)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            total -= sizes.get(p, 0)
+            count -= 1
+            removed += 1
+        if removed:
+            self.counters["evicted"] += removed
+            print(f"[mirror] evicted {removed} mirror(s); {count} left")
+        return removed
+
+    def has(self, repo_name: str) -> bool:
+        return (self.path(repo_name) / "HEAD").exists()
+
+    def seed_from_worktree(self, worktree: pathlib.Path, repo_name: str, remote_url: str) -> None:
+        """Called after a round-1 push: the local clone shares objects by hardlink."""
+        dest = self.path(repo_name)
+        with self.lock(repo_name):
+            if self.has(repo_name):
+                _git(["fetch", str(worktree), "+refs/heads/*:refs/heads/*"], git_dir=dest)
+            else:
+                self.root.mkdir(parents=True, exist_ok=True)
+                _git(["clone", "--bare", "--local", str(worktree), str(dest)])
+            _git(["remote", "set-url", "origin", remote_url], git_dir=dest)
+            self.evict(keep=repo_name)
+
+    def ensure(self, repo_name: str, remote_url: str, branch: str) -> pathlib.Path:
+        """Call with lock(repo_name) held."""
+        dest = self.path(repo_name)
+        if self.has(repo_name):
+            self.counters["hits"] += 1
+            return dest
+        self.counters["misses"] += 1
+        self.root.mkdir(parents=True, exist_ok=True)
+        _git(["clone", "--bare", "--depth", "1", "--single-branch", "--branch", branch, remote_url, str(dest)])
+        self.evict(keep=repo_name)
+        return dest
+
+    def invalidate(self, repo_name: str) -> None:
+        shutil.rmtree(self.path(repo_name), ignore_errors=True)
+
+    def head(self, repo_name: str, branch: str) -> str:
+        return _git(["rev-parse", f"refs/heads/{branch}"], git_dir=self.path(repo_name)).decode().strip()
+
+    def read_files(self, repo_name: str, paths: List[str], branch: str) -> Dict[str, str]:
+        """Read several files at `branch` with one `git cat-file --batch` process."""
+        spec = "".join(f"refs/heads/{branch}:{p}\n" for p in paths).encode()
+        out = _git(["cat-file", "--batch"], git_dir=self.path(repo_name), input=spec)
+        files, pos = {}, 0
+        for p in paths:
+            nl = out.index(b"\n", pos)
+            header = out[pos:nl].split()
+            pos = nl + 1
+            if len(header) < 3 or header[1] == b"missing":
+                continue
+            size = int(header[2])
+            files[p] = out[pos:pos + size].decode("utf-8")
+            pos += size + 1
+        return files
+
+    def commit_files(self, repo_name: str, files: Dict[str, object], message: str, branch: str) -> str:
+        """Commit `files` on top of `branch` using a throwaway index; returns the new sha."""
+        git_dir = self.path(repo_name)
+        parent = self.head(repo_name, branch)
+        fd, index_path = tempfile.mkstemp(prefix="mirror-index-")
+        os.close(fd)
+        os.unlink(index_path)
+        env = dict(_IDENTITY, GIT_INDEX_FILE=index_path)
+        try:
+            _git(["read-tree", parent], git_dir=git_dir, env=env)
+            for path, content in files.items():
+                if hasattr(content, "read"):
+                    content.seek(0)
+                    content = content.read()
+                data = content if isinstance(content, bytes) else str(content).encode("utf-8")
+                blob = _git(["hash-object", "-w", "--stdin"], git_dir=git_dir, input=data).decode().strip()
+                _git(["update-index", "--add", "--cacheinfo", f"100644,{blob},{path}"], git_dir=git_dir, env=env)
+            tree = _git(["write-tree"], git_dir=git_dir, env=env).decode().strip()
+            sha = _git(["commit-tree", tree, "-p", parent, "-m", message], git_dir=git_dir, env=env).decode().strip()
+            _git(["update-ref", f"refs/heads/{branch}", sha, parent], git_dir=git_dir)
+            return sha
+        finally:
+            try:
+                os.remove(index_path)
+            except OSError:
+                pass
+
+    def rollback(self, repo_name: str, branch: str, sha: str) -> None:
+        _git(["update-ref", f"refs/heads/{branch}", sha], git_dir=self.path(repo_name))
+
+mirror_cache = MirrorCache(settings.MIRROR_DIR, settings.MIRROR_MAX_MB * 1024 * 1024, settings.MIRROR_MAX_REPOS)
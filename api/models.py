@@ -1,9 +1,26 @@
-from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from pydantic import BaseModel, HttpUrl, PrivateAttr
+from typing import IO, List, Optional
 
 class Attachment(BaseModel):
     name: str
     url: str  # data: URIs supported
+    # Decoded content spooled by the streaming /task ingestion (api/ingest.py);
+    # when set, `url` holds only the data-URI header.
+    _blob: Optional[IO[bytes]] = PrivateAttr(default=None)
+
+    def open(self) -> IO[bytes]:
+        """Decoded attachment bytes as a rewound file object."""
+        if self._blob is None:
+            from .data_uri import decode_data_uri_to_file
+            from .settings import settings
+            _, self._blob = decode_data_uri_to_file(self.url, settings.MAX_ATTACHMENT_BYTES)
+        self._blob.seek(0)
+        return self._blob
+
+    def close(self) -> None:
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
 
 class TaskRequest(BaseModel):
     email: str
@@ -1,32 +1,298 @@
-import time, json, requests, os, datetime, traceback
+import asyncio, json, os, datetime, random, socket, sqlite3, threading, time, traceback
+from typing import Dict, List, Optional
+from .settings import settings
+from .jsonlog import JsonLineLog
+from .scheduler import current_job
+from . import aio
 
 DEFAULT_DELAYS = [1, 2, 4, 8, 16]
-LOG_PATH = "/tmp/notify.log"
+LOG_PATH = settings.NOTIFY_LOG_PATH
 
-def _log(line: str):
+log = JsonLineLog(LOG_PATH, max_bytes=settings.NOTIFY_LOG_MAX_MB * 1024 * 1024,
+                  backups=settings.NOTIFY_LOG_BACKUPS)
+
+def _log(event: str, nid: int, payload: Optional[dict] = None, **fields):
     ts = datetime.datetime.utcnow().isoformat() + "Z"
-    msg = f"[notify] {ts} {line}"
-    print(msg, flush=True)
+    rec = {"ts": ts, "event": event, "id": nid}
+    if payload:
+        rec.update(task=payload.get("task"), round=payload.get("round"), nonce=payload.get("nonce"))
+    rec.update(fields)
+    print(f"[notify] {ts} #{nid} {event} " + " ".join(f"{k}={v}" for k, v in fields.items()), flush=True)
     try:
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(msg + "\n")
+        log.write(rec)
     except Exception:
         # best-effort; don't crash notifier
         pass
 
-def notify_with_backoff(evaluation_url: str, payload: dict, delays=DEFAULT_DELAYS) -> bool:
-    headers = {"Content-Type": "application/json"}
-    for delay in [0] + list(delays):
-        if delay:
-            _log(f"sleep {delay}s before retry")
-            time.sleep(delay)
-        try:
-            _log(f"POST {evaluation_url} payload keys: {list(payload.keys())}")
-            r = requests.post(evaluation_url, json=payload, headers=headers, timeout=20)
-            _log(f"response: status={r.status_code} len={len(r.text)}")
-            if 200 <= r.status_code < 300:
-                return True
-        except Exception as e:
-            _log("exception: " + "".join(traceback.format_exception_only(type(e), e)).strip())
-    _log("giving up after retries")
+# ---------- durable outbox ----------
+_OPEN = ("pending", "deploying")
+_FIELDS = ("id", "url", "payload", "status", "attempts", "next_at", "last_error", "created_at", "updated_at",
+           "owner", "lease_until")
+
+def owner_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _owner_gone(owner: str) -> bool:
+    """True if `owner` is another process on this host that no longer exists."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
     return False
+
+class Outbox:
+    """
+    SQLite table of notifications; pending rows survive a restart. Every open
+    row is leased (NOTIFY_LEASE_S) by the process delivering it, which renews
+    the lease while it lives; any process may adopt rows whose owner died.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_at REAL NOT NULL,
+                last_error TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT NOT NULL DEFAULT '',
+                lease_until REAL NOT NULL DEFAULT 0)""")
+            have = {r[1] for r in db.execute("PRAGMA table_info(notifications)")}
+            for col, decl in (("owner", "TEXT NOT NULL DEFAULT ''"), ("lease_until", "REAL NOT NULL DEFAULT 0")):
+                if col not in have:  # outbox written before leases existed
+                    db.execute(f"ALTER TABLE notifications ADD COLUMN {col} {decl}")
+            db.execute("CREATE INDEX IF NOT EXISTS notifications_status ON notifications(status)")
+            self._db = db
+        return self._db
+
+    def add(self, url: str, payload: dict, status: str = "pending", next_at: Optional[float] = None) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._conn().execute(
+                "INSERT INTO notifications(url, payload, status, next_at, created_at, updated_at, owner, lease_until) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                (url, json.dumps(payload), status, now if next_at is None else next_at, now, now,
+                 owner_name(), now + settings.NOTIFY_LEASE_S))
+            return cur.lastrowid
+
+    def get(self, nid: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn().execute(
+                f"SELECT {', '.join(_FIELDS)} FROM notifications WHERE id=?", (nid,)).fetchone()
+        return self._row(row) if row else None
+
+    def update(self, nid: int, **fields) -> None:
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with self._lock:
+            self._conn().execute(f"UPDATE notifications SET {cols} WHERE id=?", (*fields.values(), nid))
+
+    def list(self, statuses: List[str], limit: int = 100) -> List[dict]:
+        marks = ",".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn().execute(
+                f"SELECT {', '.join(_FIELDS)} FROM notifications WHERE status IN ({marks}) ORDER BY id DESC LIMIT ?",
+                (*statuses, limit)).fetchall()
+        return [self._row(r) for r in rows]
+
+    def renew(self, owner: str) -> None:
+        """Extend the lease on every open row `owner` holds."""
+        with self._lock:
+            self._conn().execute(
+                "UPDATE notifications SET lease_until=? WHERE owner=? AND status IN (?,?)",
+                (time.time() + settings.NOTIFY_LEASE_S, owner, *_OPEN))
+
+    def adopt(self, owner: str) -> List[dict]:
+        """Take over open rows whose lease lapsed or whose owner process is gone."""
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [self._row(r) for r in db.execute(
+                    f"SELECT {', '.join(_FIELDS)} FROM notifications WHERE status IN (?,?) AND owner != ?",
+                    (*_OPEN, owner)).fetchall()]
+                rows = [r for r in rows if r["lease_until"] < now or _owner_gone(r["owner"])]
+                for r in rows:
+                    db.execute("UPDATE notifications SET owner=?, lease_until=? WHERE id=?",
+                               (owner, now + settings.NOTIFY_LEASE_S, r["id"]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return rows
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn().execute("SELECT status, COUNT(*) FROM notifications GROUP BY status").fetchall()
+        return {s: n for s, n in rows}
+
+    @staticmethod
+    def _row(r) -> dict:
+        d = dict(zip(_FIELDS, r))
+        d["payload"] = json.loads(d["payload"])
+        return d
+
+# ---------- delivery service ----------
+class NotificationService:
+    """
+    Delivers outbox rows from the shared aio loop: retries are scheduled with
+    asyncio.sleep (jittered exponential backoff) over one keep-alive HTTP client,
+    so no worker thread ever sleeps on a slow or unreachable evaluation_url.
+    Rows gated on a Pages deployment sit in status "deploying" (next_at is the
+    deadline) until deploy_watch releases them. A keeper task renews this
+    process's leases and adopts rows left behind by processes that died.
+    """
+    def __init__(self, outbox: Outbox, delays=DEFAULT_DELAYS):
+        self.outbox = outbox
+        self.delays = list(delays)
+        self._client = None
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._inflight = set()  # ids being delivered; only touched on the aio loop
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=20,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                headers={"Content-Type": "application/json"},
+            )
+        return self._client
+
+    async def awarm(self) -> None:
+        self._http()  # on the aio loop, like every other use of the client
+
+    def start(self, resume: bool = True) -> None:
+        """
+        Start renewing leases; unless `resume` is False, also resume rows left
+        open by a previous or dead process (now and whenever their lease lapses).
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        aio.spawn(self._keeper(resume))
+
+    async def _keeper(self, resume: bool) -> None:
+        while True:
+            try:
+                me = owner_name()
+                self.outbox.renew(me)
+                for row in self.outbox.adopt(me) if resume else []:
+                    _log("adopted", row["id"], row["payload"], status=row["status"], previous_owner=row["owner"])
+                    if row["status"] == "pending":
+                        aio.spawn(self._deliver(row["id"]))
+                    else:
+                        self._gate(row["id"], row["payload"], row["next_at"])
+            except Exception as e:
+                print("[notify] lease keeper failed:", e)
+            await asyncio.sleep(settings.NOTIFY_LEASE_S / 3)
+
+    def enqueue(self, url: str, payload: dict, wait_for_pages: bool = False) -> int:
+        self.start()
+        from .deploy_watch import watcher
+        if wait_for_pages and watcher.enabled():
+            deadline = time.time() + settings.PAGES_WAIT_S
+            job = current_job.get()
+            if job is not None:
+                deadline = min(deadline, job.deadline)  # never past the job's own deadline
+            nid = self.outbox.add(url, payload, status="deploying", next_at=deadline)
+            _log("queued", nid, payload, url=url, keys=list(payload.keys()), waiting_for="pages")
+            self._gate(nid, payload, deadline)
+        else:
+            nid = self.outbox.add(url, payload)
+            _log("queued", nid, payload, url=url, keys=list(payload.keys()))
+            aio.spawn(self._deliver(nid))
+        return nid
+
+    def _gate(self, nid: int, payload: dict, deadline: float) -> None:
+        from .deploy_watch import watcher
+        watcher.watch(payload.get("repo_url", ""), payload.get("commit_sha", ""), deadline,
+                      lambda outcome: self._release(nid, outcome))
+
+    def _release(self, nid: int, outcome: str) -> None:
+        row = self.outbox.get(nid)
+        if not row or row["status"] != "deploying" or row["owner"] != owner_name():
+            return
+        self.outbox.update(nid, status="pending", next_at=time.time())
+        _log("released", nid, row["payload"], pages=outcome,
+             waited_s=round(time.time() - row["created_at"], 1))
+        aio.spawn(self._deliver(nid))
+
+    def _backoff(self, attempt: int) -> float:
+        base = self.delays[min(attempt, len(self.delays)) - 1]
+        return base * random.uniform(0.5, 1.5)
+
+    async def _deliver(self, nid: int) -> None:
+        if nid in self._inflight:
+            return
+        self._inflight.add(nid)
+        try:
+            await self._deliver_row(nid)
+        finally:
+            self._inflight.discard(nid)
+
+    async def _deliver_row(self, nid: int) -> None:
+        row = self.outbox.get(nid)
+        if not row or row["status"] != "pending" or row["owner"] != owner_name():
+            return
+        attempts = row["attempts"]
+        wait = row["next_at"] - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        while True:
+            current = self.outbox.get(nid)
+            if not current or current["status"] != "pending" or current["owner"] != owner_name():
+                return  # adopted by another process while we slept
+            attempts += 1
+            error = ""
+            try:
+                r = await self._http().post(row["url"], content=json.dumps(row["payload"]))
+                _log("response", nid, row["payload"], attempt=attempts, status=r.status_code, len=len(r.content))
+                if 200 <= r.status_code < 300:
+                    self.outbox.update(nid, status="delivered", attempts=attempts, last_error="")
+                    return
+                error = f"HTTP {r.status_code}"
+            except Exception as e:
+                error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                _log("exception", nid, row["payload"], attempt=attempts, error=error)
+            if attempts > len(self.delays):
+                self.outbox.update(nid, status="failed", attempts=attempts, last_error=error)
+                _log("failed", nid, row["payload"], attempts=attempts, error=error)
+                return
+            delay = self._backoff(attempts)
+            self.outbox.update(nid, attempts=attempts, last_error=error, next_at=time.time() + delay)
+            _log("retry", nid, row["payload"], attempt=attempts, delay_s=round(delay, 1))
+            await asyncio.sleep(delay)
+
+outbox = Outbox(settings.NOTIFY_OUTBOX_PATH)
+service = NotificationService(outbox)
+
+def notify_with_backoff(evaluation_url: str, payload: dict, wait_for_pages: bool = False) -> bool:
+    """
+    Queue a notification in the durable outbox and return immediately; delivery and
+    retries happen on the event loop. With `wait_for_pages` it is held until the
+    payload's pages_url is live (see deploy_watch). Returns True once queued.
+    """
+    service.enqueue(str(evaluation_url), payload, wait_for_pages=wait_for_pages)
+    return True
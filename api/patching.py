@@ -0,0 +1,85 @@
+# api/patching.py
+from typing import Dict, List, NamedTuple
+
+# Search/replace edits for round 2: instead of regenerating index.html/app.js the
+# model answers with blocks like
+#
+#   app.js
+#   <<<<<<< SEARCH
+#   (lines copied from the current file)
+#   =======
+#   (their replacement)
+#   >>>>>>> REPLACE
+#
+# An empty SEARCH appends to the file. Each SEARCH must match exactly one place;
+# if it matches nowhere, a match that ignores per-line indentation and trailing
+# whitespace is tried before giving up with PatchError.
+
+_SEARCH, _DIVIDER, _REPLACE = "<<<<<<< SEARCH", "=======", ">>>>>>> REPLACE"
+
+class PatchError(RuntimeError):
+    pass
+
+class Edit(NamedTuple):
+    path: str
+    search: str
+    replace: str
+
+def parse_edits(text: str, paths: List[str]) -> List[Edit]:
+    """Edit blocks in `text`, in order; each must name one of `paths` on the line before it."""
+    edits: List[Edit] = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() != _SEARCH:
+            i += 1
+            continue
+        path = _block_path(lines, i, paths)
+        j = i + 1
+        while j < len(lines) and lines[j].strip() != _DIVIDER:
+            j += 1
+        k = j + 1
+        while k < len(lines) and lines[k].strip() != _REPLACE:
+            k += 1
+        if k >= len(lines):
+            raise PatchError(f"unterminated edit block for {path}")
+        edits.append(Edit(path, "\n".join(lines[i + 1:j]), "\n".join(lines[j + 1:k])))
+        i = k + 1
+    return edits
+
+def _block_path(lines: List[str], i: int, paths: List[str]) -> str:
+    for prev in reversed(lines[max(0, i - 3):i]):
+        name = prev.strip().strip("`*:# ")
+        if name in paths:
+            return name
+        if prev.strip() and not prev.strip().startswith("```"):
+            break
+    raise PatchError(f"edit block at line {i + 1} does not name a file ({', '.join(paths)})")
+
+def apply_edits(files: Dict[str, str], edits: List[Edit]) -> Dict[str, str]:
+    """A copy of `files` with every edit applied, in order."""
+    out = dict(files)
+    for e in edits:
+        out[e.path] = _apply(out.get(e.path, ""), e)
+    return out
+
+def _apply(content: str, e: Edit) -> str:
+    if not e.search.strip():
+        return content.rstrip("\n") + "\n" + e.replace + "\n"
+    n = content.count(e.search)
+    if n == 1:
+        return content.replace(e.search, e.replace, 1)
+    if n > 1:
+        raise PatchError(f"{e.path}: SEARCH text matches {n} places")
+    return _apply_loose(content, e)
+
+def _apply_loose(content: str, e: Edit) -> str:
+    # same lines modulo indentation/trailing spaces (models often re-indent what they copy)
+    lines = content.split("\n")
+    want = [l.strip() for l in e.search.strip("\n").split("\n")]
+    have = [l.strip() for l in lines]
+    hits = [i for i in range(len(lines) - len(want) + 1) if have[i:i + len(want)] == want]
+    if len(hits) != 1:
+        raise PatchError(f"{e.path}: SEARCH text {'not found' if not hits else f'matches {len(hits)} places'}")
+    i = hits[0]
+    return "\n".join(lines[:i] + e.replace.split("\n") + lines[i + len(want):])
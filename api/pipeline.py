@@ -0,0 +1,93 @@
+import traceback
+from typing import Any, Dict, Optional, Tuple
+from .models import TaskRequest, BuildResult
+from .settings import settings
+from .notifier import notify_with_backoff
+from .metrics import span
+from .idempotency import idempotency, task_key
+from .scheduler import scheduler, Job, PRIORITY_ROUND1, PRIORITY_ROUND2
+
+def build(req: TaskRequest) -> BuildResult:
+    if req.round == 1:
+        from .generator import generate_app_repo
+        return generate_app_repo(req)
+    elif req.round == 2:
+        from .generator_round2 import update_existing_repo_with_llm
+        return update_existing_repo_with_llm(req)
+    raise ValueError(f"Unsupported round {req.round}")
+
+def release_attachments(req: TaskRequest) -> None:
+    for a in req.attachments:
+        a.close()
+
+def process_task(req: TaskRequest) -> BuildResult:
+    """
+    Build (round 1) or update (round 2) the repo, then notify the evaluator.
+    Raises on build failure so the caller can record it.
+    """
+    try:
+        result = build(req)
+    except Exception as e:
+        print("[ERROR] Task processing failed:", e)
+        traceback.print_exc()
+        raise
+    finally:
+        release_attachments(req)
+
+    if req.evaluation_url:
+        payload = {
+            "email": req.email,
+            "task": req.task,
+            "round": req.round,
+            "nonce": req.nonce,
+            "repo_url": result.repo_url,
+            "commit_sha": result.commit_sha,
+            "pages_url": result.pages_url,
+        }
+        with span("notify"):
+            notify_with_backoff(str(req.evaluation_url), payload, wait_for_pages=True)
+    return result
+
+def start_workspaces() -> None:
+    """Pre-clone and GC local workspaces, in whichever process runs the builds (gh driver only)."""
+    if settings.PREFERRED_DRIVER.lower() == "gh":
+        from .gh_api import scaffold_files
+        from .workspace import workspace_pool
+        workspace_pool.start(scaffold_files(settings.GITHUB_USERNAME))
+
+def durable() -> bool:
+    """TASK_QUEUE=sqlite: tasks go to the durable queue and run in `python -m api.worker` processes."""
+    return settings.TASK_QUEUE.lower() == "sqlite"
+
+def submit_task(req: TaskRequest) -> Tuple[str, str, Optional[Any]]:
+    """
+    Queue process_task(req) on the scheduler (or the durable queue); repeats of a
+    running or finished task are coalesced (see IdempotencyStore.admit for the
+    returned tuple). Raises QueueFull when the queue is at capacity.
+    """
+    priority = PRIORITY_ROUND2 if req.round == 2 else PRIORITY_ROUND1
+    meta = {"task": req.task, "round": req.round, "nonce": req.nonce}
+    if durable():
+        from .taskqueue import task_queue
+        return task_queue.enqueue(req, priority, meta)
+    key = task_key(req)
+
+    def on_done(job: Job):
+        idempotency.finish(key, job.id, ok=job.status == "done",
+                           result=job.result.model_dump() if job.result is not None else None)
+
+    return idempotency.admit(
+        key, lambda: scheduler.submit(lambda: process_task(req), priority=priority, meta=meta, on_done=on_done))
+
+def job_info(job_id: str) -> Optional[Dict[str, Any]]:
+    if durable():
+        from .taskqueue import task_queue
+        return task_queue.get(job_id)
+    job = scheduler.get(job_id)
+    return job.to_dict() if job else None
+
+def jobs_stats() -> Dict[str, Any]:
+    if durable():
+        from .taskqueue import task_queue
+        return task_queue.stats()
+    return dict(scheduler.stats(), idempotency=idempotency.stats())
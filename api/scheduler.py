@@ -0,0 +1,182 @@
+import itertools, queue, threading, time, traceback, uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+from .settings import settings
+from . import metrics
+
+# Lower value runs first: round 2 updates jump ahead of fresh round 1 builds.
+PRIORITY_ROUND2 = 0
+PRIORITY_ROUND1 = 1
+
+# The job currently executing on this worker thread (None outside a worker).
+current_job: ContextVar[Optional["Job"]] = ContextVar("current_job", default=None)
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, fn: Callable[[], Any], priority: int, deadline_s: float, meta: Optional[dict] = None,
+                 on_done: Optional[Callable[["Job"], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.on_done = on_done
+        self.priority = priority
+        self.meta = meta or {}
+        self.status = "queued"
+        self.error = ""
+        self.result: Any = None
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.deadline = self.enqueued_at + deadline_s
+        self.done = threading.Event()
+        self._waiters: List[Callable[["Job"], None]] = []
+        self._waiters_lock = threading.Lock()
+        self.trace: list = []  # finished metrics.span() records of this job
+
+    def add_done_callback(self, cb: Callable[["Job"], None]) -> None:
+        """Run `cb(job)` once the job has finished (right away if it already has)."""
+        with self._waiters_lock:
+            if not self.done.is_set():
+                self._waiters.append(cb)
+                return
+        cb(self)
+
+    def remaining(self) -> float:
+        return self.deadline - time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        wait_end = self.started_at or self.finished_at or now
+        out = {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "meta": self.meta,
+            "enqueued_at": self.enqueued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "deadline": self.deadline,
+            "queue_wait_s": round(wait_end - self.enqueued_at, 3),
+            "run_time_s": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+        }
+        if self.trace:
+            out["stages"] = list(self.trace)
+        if self.error:
+            out["error"] = self.error
+        if self.result is not None and hasattr(self.result, "model_dump"):
+            out["result"] = self.result.model_dump()
+        return out
+
+class Scheduler:
+    """
+    Fixed pool of worker threads draining a bounded priority queue.
+    Jobs whose deadline passes while still queued are expired instead of run.
+    """
+    def __init__(self, workers: int, max_queue: int, history: int = 500):
+        self.workers = max(1, workers)
+        self._q: "queue.PriorityQueue" = queue.PriorityQueue(maxsize=max_queue)
+        self._seq = itertools.count()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0):
+        for _ in self._threads:
+            self._q.put((-1, next(self._seq), None))
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, fn: Callable[[], Any], priority: int = PRIORITY_ROUND1,
+               deadline_s: Optional[float] = None, meta: Optional[dict] = None,
+               on_done: Optional[Callable[[Job], None]] = None) -> Job:
+        """`on_done(job)` runs on the worker thread once the job is done, failed or expired."""
+        job = Job(fn, priority, deadline_s or settings.JOB_DEADLINE_S, meta, on_done)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._q.put_nowait((priority, next(self._seq), job))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFull(f"job queue full ({self._q.maxsize} pending)")
+        with self._lock:
+            while len(self._jobs) > self._history:
+                old_id, old = next(iter(self._jobs.items()))
+                if old.status in ("queued", "running"):
+                    break
+                self._jobs.pop(old_id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "queued": self._q.qsize(),
+                "running": self._running, "max_queue": self._q.maxsize}
+
+    def _worker(self):
+        while True:
+            _, _, job = self._q.get()
+            if job is None:
+                return
+            if job.remaining() <= 0:
+                job.status = "expired"
+                job.error = "deadline passed while queued"
+                job.finished_at = time.time()
+                self._finish(job)
+                print(f"[scheduler] job {job.id} expired before start {job.meta}")
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            metrics.observe("queue_wait_seconds", job.started_at - job.enqueued_at,
+                            "Time jobs spend queued before a worker picks them up", priority=job.priority)
+            with self._lock:
+                self._running += 1
+            token = current_job.set(job)
+            trace_token = metrics.current_trace.set(job.trace)
+            try:
+                job.result = job.fn()
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            finally:
+                metrics.current_trace.reset(trace_token)
+                current_job.reset(token)
+                with self._lock:
+                    self._running -= 1
+                job.finished_at = time.time()
+                metrics.observe("job_seconds", job.finished_at - job.started_at, "Job run time in seconds",
+                                status=job.status)
+                self._finish(job)
+
+    def _finish(self, job: Job):
+        if job.on_done:
+            try:
+                job.on_done(job)
+            except Exception:
+                traceback.print_exc()
+        with job._waiters_lock:
+            job.done.set()
+            waiters, job._waiters = job._waiters, []
+        for cb in waiters:
+            try:
+                cb(job)
+            except Exception:
+                traceback.print_exc()
+
+scheduler = Scheduler(settings.WORKER_COUNT, settings.QUEUE_MAX, settings.JOB_HISTORY)
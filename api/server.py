@@ -1,12 +1,27 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse
-from .models import TaskRequest
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from .ingest import ingest_http
+from .batch import run_batch, ndjson
 from .security import verify_secret
-from .generator import generate_app_repo
-from .notifier import notify_with_backoff
-import pathlib, traceback
+from . import notifier, warmup
+from .pipeline import submit_task, release_attachments, durable, job_info, jobs_stats, start_workspaces
+from .scheduler import scheduler, QueueFull
+import json, traceback
 
-app = FastAPI(title="LLM Code Deployment API (Synthesizing)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not durable():  # with TASK_QUEUE=sqlite the builds (and notifications) run in api.worker
+        scheduler.start()
+        notifier.service.start()  # resume deliveries left pending by a previous run
+        start_workspaces()
+    warmup.start()  # background: heavy imports, connection pools, tool checks (see /ready)
+    yield
+    scheduler.stop()
+
+app = FastAPI(title="LLM Code Deployment API (Synthesizing)", lifespan=lifespan)
 
 # Landing + debug endpoints
 @app.get("/", include_in_schema=False)
@@ -21,52 +36,122 @@ async def debug_routes():
     except Exception:
         return JSONResponse({"error": "listing routes failed", "trace": traceback.format_exc()})
 
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    body = dict(warmup.state, checks=dict(warmup.state["checks"]))
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    from .metrics import registry
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/_llm_cache", include_in_schema=False)
+async def debug_llm_cache():
+    from .llm_cache import response_cache
+    return JSONResponse(response_cache.stats())
+
+@app.get("/_workspaces", include_in_schema=False)
+def debug_workspaces():
+    from .workspace import workspace_pool
+    return JSONResponse(workspace_pool.stats())
+
+@app.get("/_deployments", include_in_schema=False)
+def debug_deployments():
+    from .deploy_watch import watcher
+    return JSONResponse(watcher.stats())
+
+@app.get("/_llm_limits", include_in_schema=False)
+async def debug_llm_limits():
+    from .llm_limits import admission
+    return JSONResponse(admission.stats())
+
 # ---- MAIN ENDPOINT ----
 @app.post("/task", response_model=None)
-async def receive_task(req: TaskRequest, background_tasks: BackgroundTasks):
-    # 1️⃣ Verify secret first
-    if not verify_secret(req.secret):
+async def receive_task(request: Request):
+    # 1️⃣ Stream-parse the body: the secret is verified as soon as it is read and
+    #    attachments are decoded into spooled temp files (see api/ingest.py)
+    req = await ingest_http(request)
+
+    # 2️⃣ Queue repo build + notify on the job scheduler (bounded, prioritized);
+    #    retries of a running or finished task are coalesced instead of rebuilt
+    try:
+        # off the event loop: the durable queue copies attachment spools and waits on the SQLite write lock
+        outcome, job_id, result = await run_in_threadpool(submit_task, req)
+    except QueueFull as e:
+        release_attachments(req)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    if outcome != "new":
+        release_attachments(req)
+
+    # 3️⃣ Immediately acknowledge with a handle for /jobs/{id}
+    content = {"status": "ok", "job_id": job_id}
+    if outcome != "new":
+        content["duplicate"] = outcome
+    if result is not None:
+        content["result"] = result
+    return JSONResponse(status_code=200, content=content)
+
+# ---- BULK SUBMISSION ----
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    Streams results while the request body is still being read. The stock
+    StreamingResponse listens for disconnects with receive(), which would steal
+    the body chunks; a client that goes away surfaces via request.stream() instead.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/tasks/batch", response_model=None)
+async def receive_batch(request: Request, parallel: Optional[int] = None):
+    # One secret for the whole JSONL body; records are read, validated and queued
+    # as they stream in, and results stream back as NDJSON (see api/batch.py)
+    secret = request.headers.get("x-batch-secret", "")
+    if not verify_secret(secret):
         raise HTTPException(status_code=401, detail="Invalid secret")
+    return _DuplexStreamingResponse(ndjson(run_batch(request.stream(), secret, parallel)),
+                                    media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    info = job_info(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return JSONResponse(info)
+
+@app.get("/jobs")
+async def jobs_overview():
+    return JSONResponse(jobs_stats())
 
-    # 2️⃣ Immediately acknowledge (no payload needed)
-    response = JSONResponse(status_code=200, content={"status": "ok"})
-
-    # 3️⃣ Do repo build + notify in background
-    def _process():
-        try:
-            if req.round == 1:
-                result = generate_app_repo(req)
-            elif req.round == 2:
-                from .generator_round2 import update_existing_repo_with_llm
-                result = update_existing_repo_with_llm(req)
-            else:
-                raise ValueError(f"Unsupported round {req.round}")
-
-            if req.evaluation_url:
-                payload = {
-                    "email": req.email,
-                    "task": req.task,
-                    "round": req.round,
-                    "nonce": req.nonce,
-                    "repo_url": result.repo_url,
-                    "commit_sha": result.commit_sha,
-                    "pages_url": result.pages_url,
-                }
-                notify_with_backoff(req.evaluation_url, payload)
-        except Exception as e:
-            print("[ERROR] Task processing failed:", e)
-            traceback.print_exc()
-
-    background_tasks.add_task(_process)
-    return response
+# ---- NOTIFICATION OUTBOX ----
+@app.get("/_notify_outbox", include_in_schema=False)
+def _notify_outbox(status: str = "pending,failed", limit: int = 100):
+    statuses = [s for s in status.split(",") if s]
+    return JSONResponse({
+        "counts": notifier.outbox.counts(),
+        "items": notifier.outbox.list(statuses, limit=min(limit, 1000)),
+    })
 
 # ---- NOTIFY LOG VIEWER ----
 @app.get("/_notify_log", include_in_schema=False)
-async def _notify_log():
-    path = pathlib.Path("/tmp/notify.log")
-    if not path.exists():
-        return PlainTextResponse("NO LOG: /tmp/notify.log not found\n")
+def _notify_log(tail: int = 200, before: Optional[str] = None, offset: Optional[int] = None,
+                limit: int = 200, task: Optional[str] = None, nonce: Optional[str] = None,
+                format: str = "json"):
+    """
+    Newest `tail` entries (page back with `before=<cursor>`), or, with `offset`,
+    entries of the live file from that byte offset (poll with `next_offset`).
+    Reads seek through the file, so the cost doesn't grow with the log's size.
+    """
+    match = {k: v for k, v in (("task", task), ("nonce", nonce)) if v}
     try:
-        return PlainTextResponse(path.read_text(encoding="utf-8"))
-    except Exception as e:
-        return PlainTextResponse(f"ERROR reading log: {e}\n")
+        if offset is not None:
+            items, next_offset = notifier.log.read(offset, min(limit, 5000), match)
+            page = {"items": items, "next_offset": next_offset}
+        else:
+            items, cursor = notifier.log.tail(min(tail, 5000), before, match)
+            page = {"items": items, "before": cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "text":
+        return PlainTextResponse("".join(json.dumps(i) + "\n" for i in page["items"]))
+    return JSONResponse(page)
@@ -7,11 +7,100 @@ class Settings(BaseSettings):
     EXPECTED_SECRET: str = "change-me"
     GITHUB_USERNAME: str = ""
     GITHUB_TOKEN: str = ""
-    PREFERRED_DRIVER: str = "gh"
+    PREFERRED_DRIVER: str = "gh"  # "gh" (git/gh subprocesses) or "api" (in-process Git Data API)
+    GITHUB_API_URL: str = "https://api.github.com"
+    MIRROR_DIR: str = "/tmp/repo_mirrors"  # bare mirrors of round-1 repos for clone-free round 2
+    MIRROR_MAX_MB: int = 1024  # least recently used mirrors are evicted past this (0 = no cap)
+    MIRROR_MAX_REPOS: int = 500
+    # round-1 working trees (gh driver): clones of a pre-committed LICENSE/Pages skeleton
+    WORKSPACE_DIR: str = "/tmp/workspaces"
+    WORKSPACE_POOL_SIZE: int = 2  # clones kept ready
+    WORKSPACE_QUOTA_MB: int = 512
+    WORKSPACE_MAX_AGE_S: float = 3600  # leftovers older than this are removed by the GC
+    WORKSPACE_GC_INTERVAL_S: float = 300
     DEFAULT_BRANCH: str = "main"
     PAGES_BUILD_PATH: str = "/"
     OPENAI_API_KEY: str = ""
     OPENAI_BASE_URL: str = ""
+    LLM_TIMEOUT_S: float = 180
+    LLM_MAX_CONNECTIONS: int = 16
+    # LLM admission control: RPM/TPM token buckets (0 = unlimited) and an adaptive
+    # (AIMD) concurrency limit between MIN and MAX
+    LLM_RPM: int = 0
+    LLM_TPM: int = 0
+    LLM_EST_COMPLETION_TOKENS: int = 1500
+    LLM_CONCURRENCY_INITIAL: int = 4
+    LLM_CONCURRENCY_MIN: int = 1
+    LLM_CONCURRENCY_MAX: int = 16
+    LLM_LATENCY_INFLATION: float = 2.0
+    LLM_MAX_RETRIES: int = 4
+    # comma-separated, cheapest first: each task starts on the first model and moves
+    # up only when the output is rejected (missing blocks, guardrails, stream limits)
+    LLM_MODEL_TIERS: str = "gpt-4.1-nano,gpt-4o-mini"
+    LLM_README_TIER: int = 0  # index into LLM_MODEL_TIERS
+    SYNTHESIS_MODE: str = "single"  # "single": one two-file completion; "manifest": plan, then one call per file
+    MANIFEST_MAX_FILES: int = 6
+    # speculative synthesis: race K candidates (temperatures cycled), first valid one wins
+    LLM_SPECULATIVE_K: int = 1  # 1 = off
+    LLM_SPECULATIVE_TEMPERATURES: str = "0.15,0.5,0.8"
+    LLM_SPECULATIVE_DELAY_S: float = 0  # start candidates 2..K only after this long without a winner (hedging)
+    LLM_SPECULATIVE_MAX_TOKENS: int = 0  # completion cap per candidate (0 = none)
+    LLM_SPECULATIVE_CANCEL: bool = True  # cancel the losers once one wins (False: let them finish)
+    LLM_REPAIR_ATTEMPTS: int = 2  # targeted "fix these guardrail failures" passes per synthesis
+    ROUND2_MODE: str = "patch"  # "patch": edit the round-1 files; "full": regenerate them
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MEM_ITEMS: int = 256
+    LLM_CACHE_DIR: str = "/tmp/llm_cache"
+    LLM_CACHE_DISK_MB: int = 256
+    LLM_CACHE_TTL_S: float = 7 * 24 * 3600
+    # stream completions and abort early on malformed / oversized output
+    LLM_STREAM: bool = True
+    LLM_STREAM_MAX_TOKENS: int = 6000
+    LLM_STREAM_MAX_LINES: int = 400
+    LLM_STREAM_MAX_PROSE: int = 600
+    # abort a streamed synthesis as soon as index.html fails the guardrails; False leaves
+    # such misses to the LLM_REPAIR_ATTEMPTS fix-up passes instead
+    LLM_STREAM_EARLY_CHECK: bool = True
+    # /task ingestion limits (attachments are decoded into spooled temp files)
+    MAX_TASK_BODY_BYTES: int = 64 * 1024 * 1024
+    MAX_TASK_FIELD_CHARS: int = 1024 * 1024
+    MAX_ATTACHMENT_BYTES: int = 20 * 1024 * 1024
+    MAX_ATTACHMENTS_TOTAL_BYTES: int = 40 * 1024 * 1024
+    SPOOL_MEM_BYTES: int = 512 * 1024
+    INGEST_UNVERIFIED_BYTES: int = 1024 * 1024  # attachment data decoded before `secret` has been checked
+    INGEST_SLICE_BYTES: int = 256 * 1024  # body bytes per off-loop parse step
+    NOTIFY_OUTBOX_PATH: str = "/tmp/notify_outbox.sqlite3"
+    NOTIFY_LOG_PATH: str = "/tmp/notify.log"  # JSON lines, rotated at NOTIFY_LOG_MAX_MB
+    NOTIFY_LOG_MAX_MB: int = 10
+    NOTIFY_LOG_BACKUPS: int = 3
+    NOTIFY_LEASE_S: float = 60  # renewed while a process lives; then another process adopts its open rows
+    # hold evaluator notifications until the Pages build for the pushed commit is live
+    PAGES_WAIT_ENABLED: bool = True
+    PAGES_WAIT_S: float = 120.0  # notify anyway after this long (or at the job's deadline, if sooner)
+    PAGES_POLL_MIN_S: float = 5.0
+    PAGES_POLL_MAX_S: float = 30.0
+    PAGES_POLL_BATCH: int = 16  # concurrent status requests per poll tick
+    WARMUP_ENABLED: bool = True  # pre-import and pre-connect at start-up; GET /ready reports it
+    METRICS_ENABLED: bool = True  # /metrics, stage spans and latency histograms
+    # job scheduler (replaces BackgroundTasks for /task)
+    WORKER_COUNT: int = 2
+    QUEUE_MAX: int = 32
+    JOB_DEADLINE_S: float = 900
+    JOB_HISTORY: int = 500
+    # TASK_QUEUE=sqlite splits the deployment: /task only enqueues into a durable
+    # SQLite queue and `python -m api.worker` processes lease and run the builds
+    TASK_QUEUE: str = "local"  # "local" (in-process scheduler) or "sqlite"
+    TASK_QUEUE_PATH: str = "/tmp/task_queue.sqlite3"
+    TASK_SPOOL_DIR: str = "/tmp/task_spool"  # attachments of queued tasks
+    TASK_LEASE_S: float = 60  # renewed while a task runs; a lapsed lease requeues it
+    TASK_MAX_ATTEMPTS: int = 3
+    TASK_POLL_S: float = 0.5  # idle worker poll interval
+    # /tasks/batch: records in flight per batch (default / cap)
+    BATCH_PARALLEL: int = 4
+    BATCH_MAX_PARALLEL: int = 32
+    # duplicate /task submissions (same email, task, round, nonce)
+    IDEMPOTENCY_TTL_S: float = 6 * 3600
+    IDEMPOTENCY_MAX_RESULTS: int = 2000
 
     class Config:
         env_file = ENV_PATH  # <- always read api/.env
@@ -0,0 +1,242 @@
+import json, os, shutil, socket, sqlite3, threading, time, uuid
+from typing import Any, Dict, List, Optional, Tuple
+from .models import TaskRequest
+from .idempotency import task_key
+from .scheduler import QueueFull
+from .settings import settings
+
+# Durable task queue for TASK_QUEUE=sqlite: /task only validates and enqueues
+# here, and `python -m api.worker` processes claim and run the builds.
+#   - one SQLite file in WAL mode, shared by the API and every worker process
+#   - a claim is a lease (TASK_LEASE_S) the worker renews while the job runs;
+#     if the worker dies the lease lapses and the task is queued again, up to
+#     TASK_MAX_ATTEMPTS claims (so delivery is at-least-once)
+#   - attachments are copied to TASK_SPOOL_DIR/<id>/ and the stored request
+#     keeps only their data-URI headers; the secret is not stored at all
+#   - duplicate submissions (same email, task, round, nonce) are coalesced
+#     against the table itself, like IdempotencyStore does in memory
+
+_COLUMNS = ("id", "key", "priority", "status", "payload", "meta", "attempts", "worker", "enqueued_at",
+            "deadline", "lease_until", "started_at", "finished_at", "error", "result", "trace")
+_OPEN = ("queued", "running")
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class TaskQueue:
+    def __init__(self, path: str, spool_dir: str):
+        self.path = path
+        self.spool_dir = spool_dir
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread; SQLite serialises writers across processes
+        db = getattr(self._local, "db", None)
+        if db is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                key TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                payload TEXT NOT NULL,
+                meta TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT NOT NULL DEFAULT '',
+                enqueued_at REAL NOT NULL,
+                deadline REAL NOT NULL,
+                lease_until REAL,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT NOT NULL DEFAULT '',
+                result TEXT,
+                trace TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_claim ON tasks(status, priority, enqueued_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_key ON tasks(key, enqueued_at)")
+            self._local.db = db
+        return db
+
+    def _tx(self):
+        """BEGIN IMMEDIATE: take the write lock up front so read-then-write steps can't interleave."""
+        return _Tx(self._conn())
+
+    # ---------- API side ----------
+    def enqueue(self, req: TaskRequest, priority: int, meta: dict) -> Tuple[str, str, Optional[Any]]:
+        """
+        Same contract as pipeline.submit_task: (outcome, task id, result) with outcome
+        "new", "attached" or "completed"; raises QueueFull at QUEUE_MAX queued tasks.
+        The request's in-memory attachments are released either way.
+        """
+        task_id = uuid.uuid4().hex
+        key = task_key(req)
+        try:
+            payload = self._spool(task_id, req)
+        finally:
+            for a in req.attachments:
+                a.close()
+        now = time.time()
+        try:
+            with self._tx() as db:
+                row = db.execute(
+                    "SELECT id, status, finished_at, result FROM tasks WHERE key=? AND status IN ('queued','running','done') "
+                    "ORDER BY enqueued_at DESC LIMIT 1", (key,)).fetchone()
+                if row and row[1] in _OPEN:
+                    self._drop_spool(task_id)
+                    return "attached", row[0], None
+                if row and row[1] == "done" and now - row[2] <= settings.IDEMPOTENCY_TTL_S:
+                    self._drop_spool(task_id)
+                    return "completed", row[0], json.loads(row[3]) if row[3] else None
+                queued = db.execute("SELECT COUNT(*) FROM tasks WHERE status='queued'").fetchone()[0]
+                if queued >= settings.QUEUE_MAX:
+                    raise QueueFull(f"task queue full ({queued} pending)")
+                db.execute(
+                    "INSERT INTO tasks(id, key, priority, payload, meta, enqueued_at, deadline) VALUES (?,?,?,?,?,?,?)",
+                    (task_id, key, priority, json.dumps(payload), json.dumps(meta), now, now + settings.JOB_DEADLINE_S))
+        except BaseException:
+            self._drop_spool(task_id)
+            raise
+        return "new", task_id, None
+
+    def _spool(self, task_id: str, req: TaskRequest) -> dict:
+        from .data_uri import copy_to
+        data = req.model_dump(mode="json")
+        data["secret"] = ""  # verified at the door; not worth keeping on disk
+        for i, a in enumerate(req.attachments):
+            if a._blob is None:
+                continue  # still a plain data: URI; decoded lazily by the worker
+            d = os.path.join(self.spool_dir, task_id)
+            os.makedirs(d, exist_ok=True)
+            path = os.path.join(d, str(i))
+            with open(path, "wb") as f:
+                copy_to(a.open(), f)
+            data["attachments"][i]["spool"] = path
+        return data
+
+    def _drop_spool(self, task_id: str) -> None:
+        shutil.rmtree(os.path.join(self.spool_dir, task_id), ignore_errors=True)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """The task in the shape of scheduler.Job.to_dict()."""
+        row = self._conn().execute(f"SELECT {', '.join(_COLUMNS)} FROM tasks WHERE id=?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        t = dict(zip(_COLUMNS, row))
+        now = time.time()
+        wait_end = t["started_at"] or t["finished_at"] or now
+        out = {
+            "id": t["id"],
+            "status": t["status"],
+            "priority": t["priority"],
+            "meta": json.loads(t["meta"]),
+            "enqueued_at": t["enqueued_at"],
+            "started_at": t["started_at"],
+            "finished_at": t["finished_at"],
+            "deadline": t["deadline"],
+            "queue_wait_s": round(wait_end - t["enqueued_at"], 3),
+            "run_time_s": round((t["finished_at"] or now) - t["started_at"], 3) if t["started_at"] else None,
+            "attempts": t["attempts"],
+            "worker": t["worker"],
+        }
+        if t["trace"]:
+            out["stages"] = json.loads(t["trace"])
+        if t["error"]:
+            out["error"] = t["error"]
+        if t["result"]:
+            out["result"] = json.loads(t["result"])
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        counts = {s: n for s, n in rows}
+        workers = self._conn().execute(
+            "SELECT COUNT(DISTINCT worker) FROM tasks WHERE status='running'").fetchone()[0]
+        return {"backend": "sqlite", "queued": counts.get("queued", 0), "running": counts.get("running", 0),
+                "max_queue": settings.QUEUE_MAX, "busy_workers": workers, "counts": counts}
+
+    # ---------- worker side ----------
+    def claim(self, worker: str) -> Optional[Tuple[Dict[str, Any], TaskRequest]]:
+        """Lease the next task (round 2 first, then oldest); None when nothing is runnable."""
+        now = time.time()
+        with self._tx() as db:
+            self._sweep(db, now)
+            row = db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM tasks WHERE status='queued' "
+                "ORDER BY priority, enqueued_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            t = dict(zip(_COLUMNS, row))
+            t["attempts"] += 1
+            db.execute("UPDATE tasks SET status='running', attempts=?, worker=?, lease_until=?, started_at=? "
+                       "WHERE id=?", (t["attempts"], worker, now + settings.TASK_LEASE_S, now, t["id"]))
+        t["meta"] = json.loads(t["meta"])
+        return t, self._load(json.loads(t["payload"]))
+
+    def _sweep(self, db: sqlite3.Connection, now: float) -> None:
+        dead = db.execute("SELECT id FROM tasks WHERE status='queued' AND deadline < ?", (now,)).fetchall()
+        db.execute("UPDATE tasks SET status='expired', error='deadline passed while queued', finished_at=? "
+                   "WHERE status='queued' AND deadline < ?", (now, now))
+        lapsed = db.execute("SELECT id, attempts, worker FROM tasks WHERE status='running' AND lease_until < ?",
+                            (now,)).fetchall()
+        for task_id, attempts, worker in lapsed:
+            if attempts >= settings.TASK_MAX_ATTEMPTS or now >= self._deadline(db, task_id):
+                db.execute("UPDATE tasks SET status='failed', finished_at=?, error=? WHERE id=?",
+                           (now, f"lease lost {attempts} time(s); last worker {worker}", task_id))
+                dead.append((task_id,))
+            else:
+                print(f"[taskqueue] lease of {task_id} held by {worker} lapsed; requeued")
+                db.execute("UPDATE tasks SET status='queued', lease_until=NULL, started_at=NULL WHERE id=?",
+                           (task_id,))
+        for (task_id,) in dead:
+            self._drop_spool(task_id)
+
+    @staticmethod
+    def _deadline(db: sqlite3.Connection, task_id: str) -> float:
+        return db.execute("SELECT deadline FROM tasks WHERE id=?", (task_id,)).fetchone()[0]
+
+    def _load(self, data: dict) -> TaskRequest:
+        spools = [a.pop("spool", None) for a in data.get("attachments", [])]
+        req = TaskRequest.model_validate(data)
+        for a, path in zip(req.attachments, spools):
+            if path:
+                a._blob = open(path, "rb")
+        return req
+
+    def heartbeat(self, task_ids: List[str], worker: str) -> None:
+        if not task_ids:
+            return
+        marks = ",".join("?" for _ in task_ids)
+        with self._tx() as db:
+            db.execute(f"UPDATE tasks SET lease_until=? WHERE worker=? AND status='running' AND id IN ({marks})",
+                       (time.time() + settings.TASK_LEASE_S, worker, *task_ids))
+
+    def finish(self, task_id: str, worker: str, status: str, result: Optional[dict] = None,
+               error: str = "", trace: Optional[list] = None) -> bool:
+        """Record the outcome; False if the lease had already been lost to another worker."""
+        with self._tx() as db:
+            cur = db.execute(
+                "UPDATE tasks SET status=?, finished_at=?, error=?, result=?, trace=?, lease_until=NULL "
+                "WHERE id=? AND worker=? AND status='running'",
+                (status, time.time(), error, json.dumps(result) if result is not None else None,
+                 json.dumps(trace) if trace else None, task_id, worker))
+        if cur.rowcount != 1:
+            return False  # someone else holds it now; their run still needs the spool
+        self._drop_spool(task_id)
+        return True
+
+class _Tx:
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+task_queue = TaskQueue(settings.TASK_QUEUE_PATH, settings.TASK_SPOOL_DIR)
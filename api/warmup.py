@@ -0,0 +1,89 @@
+import shutil, subprocess, threading, time, traceback
+from typing import Any, Callable, Dict
+from .settings import settings
+from . import aio
+
+# Start-up warm-up, run on a background thread once the server is accepting
+# connections: pull in the modules the first /task would otherwise import
+# (openai alone is ~0.3s), open the pooled connections to the LLM provider and
+# GitHub, and check the CLI tools the gh driver shells out to. GET /ready
+# reports the result; it returns 503 until every required check has passed.
+# Required checks run first, so a slow optional one (the LLM warm-up can take
+# up to LLM_TIMEOUT_S) never holds readiness back.
+
+state: Dict[str, Any] = {"ready": False, "done": False, "started_at": None, "seconds": None, "checks": {}}
+_lock = threading.Lock()
+_thread = None
+
+def _imports() -> None:
+    from . import generator, generator_round2  # noqa: F401  (llm, openai, guardrails, gh_api)
+
+def _tool(name: str) -> Callable[[], str]:
+    def check() -> str:
+        if shutil.which(name) is None:
+            raise RuntimeError(f"{name} not found on PATH")
+        out = subprocess.run([name, "--version"], capture_output=True, text=True, timeout=15, check=True)
+        return out.stdout.splitlines()[0] if out.stdout else ""
+    return check
+
+def _llm() -> None:
+    from .llm import awarm
+    aio.run(awarm(), timeout=settings.LLM_TIMEOUT_S)
+
+def _github() -> None:
+    from .gh_rest import warm
+    warm()
+
+def _notifier() -> None:
+    from .notifier import service
+    aio.run(service.awarm())
+
+def _plan():
+    """(name, check, required) in the order they run."""
+    gh = settings.PREFERRED_DRIVER.lower() == "gh"
+    plan = [("imports", _imports, True), ("git", _tool("git"), gh), ("gh", _tool("gh"), gh)]
+    if settings.OPENAI_API_KEY and settings.OPENAI_BASE_URL:
+        plan.append(("llm", _llm, False))
+    if settings.GITHUB_TOKEN and not gh:
+        plan.append(("github", _github, False))
+    plan.append(("notifier", _notifier, False))
+    return plan
+
+def run() -> Dict[str, Any]:
+    start = time.perf_counter()
+    state["started_at"] = time.time()
+    ready = True
+    plan = sorted(_plan(), key=lambda c: not c[2])  # required first, order otherwise kept
+    for name, check, required in plan:
+        if not required and not state["ready"] and ready:
+            state["ready"] = True
+            print(f"[warmup] required checks passed in {time.perf_counter() - start:.3f}s; ready")
+        t = time.perf_counter()
+        try:
+            detail = check()
+            result = {"ok": True}
+            if detail:
+                result["detail"] = detail
+        except Exception as e:
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            if required:
+                ready = False
+                print(f"[warmup] {name} failed:", traceback.format_exc())
+            else:
+                print(f"[warmup] {name} failed (not required): {e}")
+        result.update(required=required, ms=round((time.perf_counter() - t) * 1000, 1))
+        state["checks"][name] = result
+    state.update(ready=ready, done=True, seconds=round(time.perf_counter() - start, 3))
+    print(f"[warmup] done in {state['seconds']}s; ready={ready}")
+    return state
+
+def start() -> None:
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return
+        if not settings.WARMUP_ENABLED:
+            state.update(ready=True, done=True)
+            return
+        _thread = threading.Thread(target=run, name="warmup", daemon=True)
+        _thread.start()
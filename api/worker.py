@@ -0,0 +1,157 @@
+"""
+Build workers for TASK_QUEUE=sqlite. Each process leases tasks from the durable
+queue (api/taskqueue.py) and runs them on its own job scheduler, WORKER_COUNT
+at a time, renewing the leases while they run. Notifications go through the
+shared outbox as before.
+
+    python -m api.worker                   # one process
+    python -m api.worker --processes 4     # supervise 4 processes (restarted if they die)
+
+Outbox rows are leased by the process that queued them; every process adopts
+the open rows of processes that died, so a restart delivers each one once.
+"""
+import argparse, signal, subprocess, sys, threading, time
+from typing import Dict, List, Optional
+from .settings import settings
+from .scheduler import scheduler, Job
+from .pipeline import process_task, start_workspaces
+from .taskqueue import task_queue, worker_name
+
+class Worker:
+    def __init__(self, name: str, resume_notifications: bool = True):
+        self.name = name
+        self.resume_notifications = resume_notifications
+        self._slots = threading.Semaphore(scheduler.workers)  # claim only what can start now
+        self._held: Dict[str, float] = {}  # task id -> claimed at
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        from . import notifier, warmup
+        if settings.WARMUP_ENABLED:
+            warmup.run()  # the first claimed task shouldn't pay for imports and connections
+        scheduler.start()
+        notifier.service.start(resume=self.resume_notifications)
+        start_workspaces()
+        threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True).start()
+        print(f"[worker] {self.name} polling {settings.TASK_QUEUE_PATH} with {scheduler.workers} slots")
+        while not self._stop.is_set():
+            if not self._slots.acquire(timeout=settings.TASK_POLL_S):
+                continue
+            try:
+                claimed = task_queue.claim(self.name)
+            except Exception as e:
+                print("[worker] claim failed:", e)
+                claimed = None
+            if claimed is None:
+                self._slots.release()
+                self._stop.wait(settings.TASK_POLL_S)
+                continue
+            self._start(*claimed)
+        self._drain()
+
+    def _start(self, task: dict, req) -> None:
+        task_id = task["id"]
+        with self._lock:
+            self._held[task_id] = time.time()
+
+        def on_done(job: Job):
+            try:
+                result = job.result.model_dump() if job.result is not None else None
+                if not task_queue.finish(task_id, self.name, job.status, result, job.error, job.trace):
+                    print(f"[worker] lease on {task_id} was lost before it finished")
+            finally:
+                with self._lock:
+                    self._held.pop(task_id, None)
+                self._slots.release()
+
+        print(f"[worker] {self.name} claimed {task_id} {task['meta']} (attempt {task['attempts']})")
+        try:
+            scheduler.submit(lambda: process_task(req), priority=task["priority"],
+                             deadline_s=max(0.001, task["deadline"] - time.time()),
+                             meta=dict(task["meta"], task_id=task_id), on_done=on_done)
+        except Exception as e:
+            task_queue.finish(task_id, self.name, "failed", error=f"could not schedule: {e}")
+            with self._lock:
+                self._held.pop(task_id, None)
+            self._slots.release()
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(settings.TASK_LEASE_S / 3):
+            with self._lock:
+                ids = list(self._held)
+            try:
+                task_queue.heartbeat(ids, self.name)
+            except Exception as e:
+                print("[worker] heartbeat failed:", e)
+        # keep renewing until the running jobs have drained
+        while True:
+            with self._lock:
+                ids = list(self._held)
+            if not ids:
+                return
+            try:
+                task_queue.heartbeat(ids, self.name)
+            except Exception as e:
+                print("[worker] heartbeat failed:", e)
+            time.sleep(min(5.0, settings.TASK_LEASE_S / 3))
+
+    def stop(self, *_) -> None:
+        self._stop.set()
+
+    def _drain(self) -> None:
+        deadline = time.time() + settings.JOB_DEADLINE_S
+        while time.time() < deadline:
+            with self._lock:
+                if not self._held:
+                    break
+            time.sleep(0.2)
+        scheduler.stop()
+        print(f"[worker] {self.name} stopped")
+
+def supervise(n: int) -> int:
+    """Run `n` worker processes, restarting any that exit until we are told to stop."""
+    procs: List[Optional[subprocess.Popen]] = [None] * n
+    stopping = threading.Event()
+
+    def spawn() -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, "-m", "api.worker", "--processes", "1"])
+
+    def stop(*_):
+        stopping.set()
+        for p in procs:
+            if p and p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for i in range(n):
+        procs[i] = spawn()
+    while not stopping.is_set():
+        for i, p in enumerate(procs):
+            if p.poll() is not None:
+                print(f"[worker] process {p.pid} exited with {p.returncode}; restarting")
+                procs[i] = spawn()
+        stopping.wait(1.0)
+    for p in procs:
+        p.wait()
+    return 0
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Run build workers for TASK_QUEUE=sqlite.")
+    ap.add_argument("--processes", type=int, default=1, help="worker processes (each runs WORKER_COUNT jobs)")
+    ap.add_argument("--no-resume", action="store_true", help="don't adopt notifications left open by other processes")
+    args = ap.parse_args(argv)
+    if settings.TASK_QUEUE.lower() != "sqlite":
+        print("[worker] TASK_QUEUE is not 'sqlite'; the API runs tasks in-process", file=sys.stderr)
+        return 2
+    if args.processes > 1:
+        return supervise(args.processes)
+    worker = Worker(worker_name(), resume_notifications=not args.no_resume)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
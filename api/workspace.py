@@ -0,0 +1,279 @@
+import hashlib, json, os, pathlib, shutil, subprocess, threading, time, uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from .settings import settings
+from .metrics import observe, gauge
+
+# Local working trees for round-1 publishing (gh driver). Every generated repo
+# starts from the same scaffold (LICENSE + Pages workflow), so it is committed
+# once into a skeleton repo and each task gets a `git clone --local` of it
+# (objects hardlinked, not copied). A background thread keeps a few clones
+# ready, and a periodic GC removes checkouts leaked by crashes and enforces
+# WORKSPACE_QUOTA_MB. Layout under WORKSPACE_DIR:
+#   skeletons/<key>/   one per scaffold content (the LICENSE year/author change it)
+#   work/<pid>-<id>/   checkouts, pre-cloned or in use, by the process that made them
+# Several worker processes can share WORKSPACE_DIR: a GC only ever deletes its
+# own checkouts, ones whose process has exited, and ones past WORKSPACE_MAX_AGE_S.
+
+_IDENTITY = {
+    "GIT_AUTHOR_NAME": settings.GITHUB_USERNAME or "llm-deploy-bot",
+    "GIT_AUTHOR_EMAIL": "bot@llm-deploy.local",
+    "GIT_COMMITTER_NAME": settings.GITHUB_USERNAME or "llm-deploy-bot",
+    "GIT_COMMITTER_EMAIL": "bot@llm-deploy.local",
+}
+
+def _git(args: list, cwd: Optional[pathlib.Path] = None) -> None:
+    start = time.perf_counter()
+    try:
+        subprocess.run(["git"] + args, cwd=cwd, env=dict(os.environ, **_IDENTITY), check=True,
+                       stdout=subprocess.DEVNULL)
+    finally:
+        observe("subprocess_seconds", time.perf_counter() - start, "git/gh subprocess wall time",
+                cmd=f"git {args[0]}")
+
+def _key(scaffold: Dict[str, str]) -> str:
+    return _items_key(settings.DEFAULT_BRANCH, tuple(sorted(scaffold.items())))
+
+@lru_cache(maxsize=32)
+def _items_key(branch: str, items: Tuple[Tuple[str, str], ...]) -> str:
+    blob = json.dumps([branch, items]).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+def _owner_gone(p: pathlib.Path) -> bool:
+    """True if `p` was made by another process that no longer exists."""
+    pid, sep, _ = p.name.partition("-")
+    if not sep or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # exists, owned by someone else
+    return False
+
+def _du(path: pathlib.Path) -> int:
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for n in names:
+            try:
+                total += os.lstat(os.path.join(dirpath, n)).st_size
+            except OSError:
+                pass
+    return total
+
+class WorkspacePool:
+    def __init__(self, root: str, size: int, quota_bytes: int, max_age_s: float, gc_interval_s: float):
+        self.root = pathlib.Path(root)
+        self.size = size
+        self.quota_bytes = quota_bytes
+        self.max_age_s = max_age_s
+        self.gc_interval_s = gc_interval_s
+        self._lock = threading.Lock()
+        self._ready: List[Tuple[str, pathlib.Path]] = []  # (skeleton key, clone)
+        self._active: Set[pathlib.Path] = set()
+        self._cloning: Set[pathlib.Path] = set()
+        self._scaffold: Optional[Dict[str, str]] = None
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {"checkouts": 0, "pooled": 0, "cold": 0, "gc_removed": 0}
+
+    # ---------- skeletons ----------
+    def skeleton(self, scaffold: Dict[str, str]) -> pathlib.Path:
+        """The skeleton repo for `scaffold`, built on first use."""
+        key = _key(scaffold)
+        dest = self.root / "skeletons" / key
+        if (dest / ".git" / "HEAD").exists():
+            return dest
+        tmp = self.root / "skeletons" / f".{key}-{uuid.uuid4().hex[:8]}"
+        tmp.mkdir(parents=True)
+        try:
+            _git(["init", "-q", "-b", settings.DEFAULT_BRANCH], cwd=tmp)
+            for path, content in scaffold.items():
+                p = tmp / path
+                p.parent.mkdir(parents=True, exist_ok=True)
+                p.write_text(content, encoding="utf-8")
+            _git(["add", "."], cwd=tmp)
+            _git(["commit", "-q", "-m", "chore: license and Pages workflow"], cwd=tmp)
+            os.rename(tmp, dest)
+        except OSError:
+            if not (dest / ".git" / "HEAD").exists():
+                raise
+            # another thread/process won the race; use theirs
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        return dest
+
+    def _clone(self, scaffold: Dict[str, str]) -> pathlib.Path:
+        skel = self.skeleton(scaffold)
+        dest = self.root / "work" / f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._cloning.add(dest)  # not a leak, whatever the GC sees meanwhile
+        try:
+            _git(["clone", "-q", "--local", str(skel), str(dest)])
+            _git(["remote", "remove", "origin"], cwd=dest)  # gh repo create adds the real one
+            _git(["config", "user.email", _IDENTITY["GIT_AUTHOR_EMAIL"]], cwd=dest)
+            _git(["config", "user.name", _IDENTITY["GIT_AUTHOR_NAME"]], cwd=dest)
+        except BaseException:
+            shutil.rmtree(dest, ignore_errors=True)
+            with self._lock:
+                self._cloning.discard(dest)
+            raise
+        return dest
+
+    # ---------- checkouts ----------
+    @contextmanager
+    def checkout(self, scaffold: Dict[str, str]) -> Iterator[pathlib.Path]:
+        """
+        A private working tree whose single commit holds `scaffold`. It is deleted
+        when the block exits, whatever happens inside it.
+        """
+        key = _key(scaffold)
+        ws = None
+        with self._lock:
+            self._scaffold = scaffold
+            self.counters["checkouts"] += 1
+            for i, (k, path) in enumerate(self._ready):
+                if k == key:
+                    ws = path
+                    del self._ready[i]
+                    self._active.add(ws)
+                    self.counters["pooled"] += 1
+                    break
+            else:
+                self.counters["cold"] += 1
+        if ws is None:
+            ws = self._clone(scaffold)
+            with self._lock:
+                self._cloning.discard(ws)
+                self._active.add(ws)
+        self._wake.set()  # refill in the background
+        try:
+            yield ws
+        finally:
+            with self._lock:
+                self._active.discard(ws)
+            shutil.rmtree(ws, ignore_errors=True)
+            self._gauges()
+
+    # ---------- background refill + GC ----------
+    def start(self, scaffold: Dict[str, str]) -> None:
+        with self._lock:
+            self._scaffold = scaffold
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="workspace-pool", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        last_gc = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_gc >= self.gc_interval_s:
+                    last_gc = time.monotonic()
+                    self.gc()
+                self._refill()
+            except Exception as e:
+                print("[workspace] background refill/gc failed:", e)
+            self._wake.wait(self.gc_interval_s)
+            self._wake.clear()
+
+    def _refill(self) -> None:
+        while True:
+            with self._lock:
+                scaffold = self._scaffold
+                key = _key(scaffold) if scaffold else None
+                if key is None or sum(1 for k, _ in self._ready if k == key) >= self.size:
+                    break
+            if self.quota_bytes and _du(self.root / "work") >= self.quota_bytes:
+                break
+            ws = self._clone(scaffold)
+            with self._lock:
+                self._cloning.discard(ws)
+                self._ready.append((key, ws))
+        self._gauges()
+
+    def gc(self) -> Dict[str, int]:
+        """
+        Drop pre-clones of outdated skeletons, checkouts leaked by this process or
+        left by one that exited, checkouts no process has touched for
+        WORKSPACE_MAX_AGE_S, and then our own spare pre-clones as far as needed to
+        get under the quota. Recent checkouts of other live processes are kept.
+        """
+        removed = 0
+        with self._lock:
+            key = _key(self._scaffold) if self._scaffold else None
+            stale = [p for k, p in self._ready if k != key]
+            self._ready = [(k, p) for k, p in self._ready if k == key]
+            keep = set(self._active) | set(self._cloning) | {p for _, p in self._ready}
+        for p in stale:
+            shutil.rmtree(p, ignore_errors=True)
+            removed += 1
+
+        work = self.root / "work"
+        now = time.time()
+        mine = f"{os.getpid()}-"
+        for p in (work.iterdir() if work.exists() else []):
+            if p in keep:
+                continue
+            try:
+                mtime = p.stat().st_mtime
+            except OSError:
+                continue
+            if p.name.startswith(mine) or _owner_gone(p) or now - mtime > self.max_age_s:
+                shutil.rmtree(p, ignore_errors=True)
+                removed += 1
+            # anything else belongs to another live worker process
+
+        if self.quota_bytes and work.exists():
+            used = _du(work)
+            with self._lock:
+                spare = [p for _, p in self._ready]
+            for p in spare:
+                if used <= self.quota_bytes:
+                    break
+                with self._lock:
+                    if p in self._active:
+                        continue
+                    self._ready = [(k, q) for k, q in self._ready if q != p]
+                size = _du(p)
+                shutil.rmtree(p, ignore_errors=True)
+                used -= size
+                removed += 1
+
+        skeletons = self.root / "skeletons"
+        for p in (skeletons.iterdir() if skeletons.exists() else []):
+            try:
+                old = now - p.stat().st_mtime > self.max_age_s
+            except OSError:
+                continue
+            if p.name != key and old:
+                shutil.rmtree(p, ignore_errors=True)
+
+        with self._lock:
+            self.counters["gc_removed"] += removed
+        self._gauges()
+        return {"removed": removed}
+
+    def _gauges(self) -> None:
+        with self._lock:
+            ready, active = len(self._ready), len(self._active)
+        gauge("workspaces", ready, "Local workspaces by state", state="ready")
+        gauge("workspaces", active, "Local workspaces by state", state="active")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            out = dict(self.counters, ready=len(self._ready), active=len(self._active))
+        work = self.root / "work"
+        out["disk_mb"] = round(_du(work) / 1e6, 2) if work.exists() else 0.0
+        return out
+
+workspace_pool = WorkspacePool(
+    settings.WORKSPACE_DIR,
+    settings.WORKSPACE_POOL_SIZE,
+    settings.WORKSPACE_QUOTA_MB * 1024 * 1024,
+    settings.WORKSPACE_MAX_AGE_S,
+    settings.WORKSPACE_GC_INTERVAL_S,
+)
@@ -0,0 +1,374 @@
+# Local stand-ins for the services the pipeline talks to, so /task can be
+# load-tested without OpenAI tokens or real GitHub repos:
+#   FakeLLM        OpenAI-compatible /v1/chat/completions with canned output
+#   FakeGitHub     the subset of the GitHub REST / Git Data API used by api/gh_rest.py
+#   FakeEvaluator  records evaluation_url notifications and their arrival times
+import asyncio, base64, hashlib, json, random, re, socket, threading, time
+from typing import Dict, Optional, Tuple
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(app: FastAPI, port: int) -> uvicorn.Server:
+    """Run `app` on 127.0.0.1:port in a daemon thread; returns once it accepts requests."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError(f"fake server on port {port} did not start")
+        time.sleep(0.02)
+    return server
+
+# ---------- LLM ----------
+_SEED_RE = re.compile(r"^- seed: (\S+)$", re.M)
+_CHECK_ID_RE = re.compile(r"#([-\w]+)")  # same selector syntax as api/guardrails.py
+
+def canned_app(prompt: str) -> str:
+    """Two-block answer that passes the guardrails for whatever checks the prompt lists."""
+    m = _SEED_RE.search(prompt)
+    seed = m.group(1) if m else ""
+    checks = prompt.split("Checks to satisfy:", 1)[-1].split("Output FORMAT", 1)[0]
+    ids = sorted(set(_CHECK_ID_RE.findall(checks.replace("${seed}", seed))))
+    body = "\n".join(f'  <div id="{i}"></div>' for i in ids)
+    return (
+        "<<INDEX_HTML>>\n"
+        "<!doctype html>\n<html><head><title>Bench</title>\n"
+        '<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5/dist/css/bootstrap.min.css">\n'
+        '<script src="https://cdn.jsdelivr.net/npm/highlight.js/lib/highlight.js"></script>\n'
+        f"</head><body>\n{body}\n"
+        '<script src="app.js"></script>\n</body></html>\n'
+        "<</INDEX_HTML>>\n\n"
+        "<<APP_JS>>\n"
+        "document.title = 'Bench';\n"
+        + "".join(f"document.querySelector('#{i}').textContent = '{seed}';\n" for i in ids)
+        + "<</APP_JS>>"
+    )
+
+_FILE_RE = re.compile(r"^Write (\S+) in full", re.M)
+
+def canned_manifest(prompt: str) -> str:
+    """Answer to a manifest-mode planning prompt."""
+    return json.dumps({"files": [
+        {"path": "index.html", "purpose": "markup", "interface": "loads style.css and app.js"},
+        {"path": "app.js", "purpose": "behaviour", "interface": "fills the checked ids"},
+        {"path": "style.css", "purpose": "styles", "interface": "none"},
+    ]})
+
+def canned_file(prompt: str) -> str:
+    """Answer to a manifest-mode file prompt, cut from the two-block answer."""
+    m = _FILE_RE.search(prompt)
+    path = m.group(1) if m else "index.html"
+    blocks = canned_app(prompt)
+    if path == "index.html":
+        body = _HTML_BLOCK_RE.search(blocks).group(1).replace(
+            "</head>", '<link rel="stylesheet" href="style.css">\n</head>', 1)
+    elif path.endswith(".js"):
+        body = _JS_BLOCK_RE.search(blocks).group(1)
+    else:
+        body = "body { margin: 2rem; }"
+    return f"<<FILE {path}>>\n{body}\n<</FILE>>"
+
+_MISSING_RE = re.compile(r"selector #([-\w]+) missing")
+_HTML_BLOCK_RE = re.compile(r"<<INDEX_HTML>>\n(.*?)\n<</INDEX_HTML>>", re.S)
+
+def repaired_html(prompt: str) -> str:
+    """Answer to a guardrail repair prompt: the current index.html plus the missing ids."""
+    m = _HTML_BLOCK_RE.search(prompt)
+    html = m.group(1) if m else "<html><body></body></html>"
+    divs = "".join(f'  <div id="{i}"></div>\n' for i in _MISSING_RE.findall(prompt))
+    return "<<INDEX_HTML>>\n" + html.replace("</body>", divs + "</body>", 1) + "\n<</INDEX_HTML>>"
+
+_JS_BLOCK_RE = re.compile(r"<<APP_JS>>\n(.*?)\n<</APP_JS>>", re.S)
+
+def canned_patch(prompt: str) -> str:
+    """Answer to a round-2 patch prompt: SEARCH/REPLACE edits adding the ids the new checks need."""
+    m = _SEED_RE.search(prompt)
+    seed = m.group(1) if m else ""
+    checks = prompt.split("Checks to satisfy:", 1)[-1].split("Current files:", 1)[0]
+    m = _HTML_BLOCK_RE.search(prompt)
+    html = m.group(1) if m else ""
+    m = _JS_BLOCK_RE.search(prompt)
+    js = m.group(1) if m else ""
+    ids = [i for i in sorted(set(_CHECK_ID_RE.findall(checks.replace("${seed}", seed)))) if f'id="{i}"' not in html]
+    if not ids:
+        return "app.js\n<<<<<<< SEARCH\n=======\n// round 2: no changes needed\n>>>>>>> REPLACE\n"
+    divs = "".join(f'  <div id="{i}"></div>\n' for i in ids)
+    last_js = js.rstrip("\n").split("\n")[-1]
+    sets = "".join(f"document.querySelector('#{i}').textContent = '{seed}';\n" for i in ids)
+    return (
+        "index.html\n<<<<<<< SEARCH\n</body></html>\n=======\n" + divs + "</body></html>\n>>>>>>> REPLACE\n\n"
+        f"app.js\n<<<<<<< SEARCH\n{last_js}\n=======\n{last_js}\n{sets}>>>>>>> REPLACE\n"
+    )
+
+def _drop_first_id(text: str) -> str:
+    return re.sub(r'  <div id="[-\w]+"></div>\n', "", text, count=1)
+
+class FakeLLM:
+    """
+    `capacity` > 0 makes it behave like a provider with that many concurrent
+    slots: extra requests get 429 with a Retry-After header. `defect_rate` is
+    the share of app answers that leave out a required element (guardrail miss).
+    """
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, chunk_chars: int = 40,
+                 capacity: int = 0, retry_after: float = 1.0, defect_rate: float = 0.0):
+        self.defect_rate = defect_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_chars = chunk_chars
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.calls = 0
+        self.throttled = 0
+        self.active = 0
+        self.peak = 0
+        self.app = FastAPI()
+        self.app.post("/v1/chat/completions")(self._completions)
+
+    async def _completions(self, request: Request):
+        body = await request.json()
+        self.calls += 1
+        if self.capacity and self.active >= self.capacity:
+            self.throttled += 1
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                status_code=429, headers={"Retry-After": str(self.retry_after)})
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            return await self._answer(body)
+        finally:
+            self.active -= 1
+
+    async def _answer(self, body: dict):
+        system, user = body["messages"][0]["content"], body["messages"][-1]["content"]
+        if "README" in system:
+            text = "# Bench App\n\nGenerated for benchmarking.\n"
+        elif "fix small defects" in system:
+            text = repaired_html(user)
+        elif system.startswith("You plan"):
+            text = canned_manifest(user)
+        elif system.startswith("You write one file"):
+            text = canned_file(user)
+            if self.defect_rate and random.random() < self.defect_rate:
+                text = _drop_first_id(text)
+        elif "SEARCH/REPLACE" in system:
+            text = canned_patch(user)
+            if self.defect_rate and random.random() < self.defect_rate:
+                text = _drop_first_id(text)
+        else:
+            text = canned_app(user)
+            if self.defect_rate and random.random() < self.defect_rate:
+                text = _drop_first_id(text)
+        usage = {"prompt_tokens": len(system + user) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        base = {"id": f"bench-{self.calls}", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            return JSONResponse(dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]))
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+        async def events():
+            for i in range(0, len(text), self.chunk_chars):
+                delta = {"index": 0, "delta": {"content": text[i:i + self.chunk_chars]}, "finish_reason": None}
+                yield f"data: {json.dumps(dict(base, object='chat.completion.chunk', choices=[delta]))}\n\n"
+            if include_usage:
+                yield f"data: {json.dumps(dict(base, object='chat.completion.chunk', choices=[], usage=usage))}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+# ---------- GitHub ----------
+def _sha(obj: dict) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+def _not_found():
+    return JSONResponse({"message": "Not Found"}, status_code=404)
+
+class FakeGitHub:
+    """
+    In-memory repos with blob/tree/commit objects and refs. Pages builds report
+    "built" `pages_delay` seconds after Pages is enabled or the branch moves.
+    """
+    def __init__(self, latency: float = 0.0, pages_delay: float = 1.0):
+        self.latency = latency
+        self.pages_delay = pages_delay
+        self.repos: Dict[str, dict] = {}
+        self.calls = 0
+        app = self.app = FastAPI()
+
+        @app.middleware("http")
+        async def _delay(request, call_next):
+            self.calls += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return await call_next(request)
+
+        app.post("/user/repos")(self._create_repo)
+        app.get("/repos/{owner}/{repo}")(self._get_repo)
+        app.get("/repos/{owner}/{repo}/git/ref/heads/{branch:path}")(self._get_ref)
+        app.patch("/repos/{owner}/{repo}/git/refs/heads/{branch:path}")(self._patch_ref)
+        app.post("/repos/{owner}/{repo}/git/refs")(self._create_ref)
+        app.post("/repos/{owner}/{repo}/git/blobs")(self._create_blob)
+        app.post("/repos/{owner}/{repo}/git/trees")(self._create_tree)
+        app.post("/repos/{owner}/{repo}/git/commits")(self._create_commit)
+        app.get("/repos/{owner}/{repo}/git/commits/{sha}")(self._get_commit)
+        app.get("/repos/{owner}/{repo}/contents/{path:path}")(self._contents)
+        app.post("/repos/{owner}/{repo}/pages")(self._enable_pages)
+        app.get("/repos/{owner}/{repo}/pages/builds/latest")(self._pages_latest)
+
+    def _put(self, repo: dict, obj: dict) -> str:
+        sha = _sha(obj)
+        repo["objects"][sha] = obj
+        return sha
+
+    def _move(self, repo: dict, branch: str, sha: str) -> None:
+        repo["refs"][branch] = sha
+        repo["pushed_at"] = time.time()
+
+    async def _create_repo(self, request: Request):
+        body = await request.json()
+        name = body["name"]
+        if name in self.repos:
+            return JSONResponse({"message": "name already exists on this account"}, status_code=422)
+        repo = self.repos[name] = {"objects": {}, "refs": {}, "default_branch": "main",
+                                   "pages": None, "pushed_at": time.time()}
+        if body.get("auto_init"):
+            blob = self._put(repo, {"type": "blob", "data": base64.b64encode(f"# {name}\n".encode()).decode()})
+            tree = self._put(repo, {"type": "tree", "entries": {"README.md": blob}})
+            commit = self._put(repo, {"type": "commit", "tree": tree, "parents": [], "message": "Initial commit"})
+            self._move(repo, "main", commit)
+        return JSONResponse({"name": name, "default_branch": "main"}, status_code=201)
+
+    async def _get_repo(self, owner: str, repo: str):
+        if repo not in self.repos:
+            return _not_found()
+        return {"name": repo, "default_branch": self.repos[repo]["default_branch"]}
+
+    async def _get_ref(self, owner: str, repo: str, branch: str):
+        r = self.repos.get(repo)
+        if not r or branch not in r["refs"]:
+            return _not_found()
+        return {"ref": f"refs/heads/{branch}", "object": {"sha": r["refs"][branch], "type": "commit"}}
+
+    async def _patch_ref(self, owner: str, repo: str, branch: str, request: Request):
+        body = await request.json()
+        self._move(self.repos[repo], branch, body["sha"])
+        return {"ref": f"refs/heads/{branch}", "object": {"sha": body["sha"]}}
+
+    async def _create_ref(self, owner: str, repo: str, request: Request):
+        body = await request.json()
+        self._move(self.repos[repo], body["ref"].split("/", 2)[2], body["sha"])
+        return JSONResponse({"ref": body["ref"], "object": {"sha": body["sha"]}}, status_code=201)
+
+    async def _create_blob(self, owner: str, repo: str, request: Request):
+        body = await request.json()
+        data = body["content"]
+        if body.get("encoding") != "base64":
+            data = base64.b64encode(data.encode()).decode()
+        return JSONResponse({"sha": self._put(self.repos[repo], {"type": "blob", "data": data})}, status_code=201)
+
+    async def _create_tree(self, owner: str, repo: str, request: Request):
+        body = await request.json()
+        r = self.repos[repo]
+        entries = dict(r["objects"][body["base_tree"]]["entries"]) if body.get("base_tree") else {}
+        for e in body["tree"]:
+            if "content" in e:
+                entries[e["path"]] = self._put(r, {"type": "blob", "data": base64.b64encode(e["content"].encode()).decode()})
+            else:
+                entries[e["path"]] = e["sha"]
+        return JSONResponse({"sha": self._put(r, {"type": "tree", "entries": entries})}, status_code=201)
+
+    async def _create_commit(self, owner: str, repo: str, request: Request):
+        body = await request.json()
+        sha = self._put(self.repos[repo], {"type": "commit", "tree": body["tree"], "parents": body["parents"],
+                                           "message": body["message"], "t": time.time()})
+        return JSONResponse({"sha": sha, "tree": {"sha": body["tree"]}}, status_code=201)
+
+    async def _get_commit(self, owner: str, repo: str, sha: str):
+        c = self.repos.get(repo, {}).get("objects", {}).get(sha)
+        if not c:
+            return _not_found()
+        return {"sha": sha, "tree": {"sha": c["tree"]}, "parents": [{"sha": p} for p in c["parents"]],
+                "message": c["message"]}
+
+    async def _contents(self, owner: str, repo: str, path: str, request: Request):
+        r = self.repos.get(repo)
+        if not r:
+            return _not_found()
+        head = r["refs"].get(request.query_params.get("ref", r["default_branch"]))
+        entries = r["objects"][r["objects"][head]["tree"]]["entries"] if head else {}
+        if path not in entries:
+            return _not_found()
+        sha = entries[path]
+        etag = f'"{sha}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return JSONResponse({"path": path, "sha": sha, "encoding": "base64", "content": r["objects"][sha]["data"]},
+                            headers={"ETag": etag})
+
+    async def _enable_pages(self, owner: str, repo: str):
+        r = self.repos.get(repo)
+        if not r:
+            return _not_found()
+        if r["pages"]:
+            return JSONResponse({"message": "GitHub Pages is already enabled."}, status_code=409)
+        r["pages"] = {"enabled_at": time.time()}
+        return JSONResponse({"status": None, "build_type": "workflow"}, status_code=201)
+
+    async def _pages_latest(self, owner: str, repo: str):
+        r = self.repos.get(repo)
+        if not r or not r["pages"]:
+            return _not_found()
+        since = max(r["pages"]["enabled_at"], r["pushed_at"])
+        status = "built" if time.time() - since >= self.pages_delay else "building"
+        return {"status": status, "commit": r["refs"].get(r["default_branch"])}
+
+    def site_live(self, repo: str, sha: str) -> bool:
+        """Whether Pages would serve `sha` of `repo` right now."""
+        r = self.repos.get(repo)
+        if not r or not r["pages"] or r["refs"].get(r["default_branch"]) != sha:
+            return False
+        return time.time() - max(r["pages"]["enabled_at"], r["pushed_at"]) >= self.pages_delay
+
+# ---------- evaluator ----------
+class FakeEvaluator:
+    """
+    Receives POST /notify. `fail_rate` of deliveries get a 503 so the notifier's
+    retries are exercised. Arrival times are keyed by (task, round, nonce).
+    With `gh`, notifications whose pages_url isn't live yet are counted as premature.
+    """
+    def __init__(self, fail_rate: float = 0.0, gh: Optional[FakeGitHub] = None):
+        self.fail_rate = fail_rate
+        self.gh = gh
+        self.premature = 0
+        self.attempts = 0
+        self.received: Dict[Tuple[str, int, str], Tuple[float, dict]] = {}
+        self._cond = threading.Condition()
+        self.app = FastAPI()
+        self.app.post("/notify")(self._notify)
+
+    async def _notify(self, request: Request):
+        payload = await request.json()
+        self.attempts += 1
+        if self.fail_rate and random.random() < self.fail_rate:
+            return JSONResponse({"error": "try again"}, status_code=503)
+        key = (payload.get("task"), payload.get("round"), payload.get("nonce"))
+        if self.gh is not None:
+            repo = str(payload.get("repo_url", "")).rstrip("/").rsplit("/", 1)[-1]
+            if not self.gh.site_live(repo, payload.get("commit_sha", "")):
+                self.premature += 1
+        with self._cond:
+            self.received.setdefault(key, (time.time(), payload))
+            self._cond.notify_all()
+        return {"ok": True}
+
+    def wait(self, key: Tuple[str, int, str], timeout: float) -> Optional[Tuple[float, dict]]:
+        """Blocks until the notification for `key` has arrived; (arrival time, payload) or None."""
+        with self._cond:
+            self._cond.wait_for(lambda: key in self.received, timeout)
+            return self.received.get(key)
@@ -0,0 +1,304 @@
+"""
+Offline end-to-end benchmark of the /task pipeline.
+
+Starts api.server:app in a subprocess wired to local fakes (bench/fakes.py):
+an OpenAI-compatible LLM, the GitHub REST API (PREFERRED_DRIVER=api) and an
+evaluation endpoint. Then it replays TaskRequests from a JSONL file with N
+tasks in flight. Each task runs round 1, then round 2 once the round-1
+notification has arrived, so both rounds overlap across tasks. Reports
+p50/p95/p99 for end-to-end latency (submit -> evaluator notified), queue
+wait, run time and every pipeline stage, plus tasks/s.
+
+    python -m bench.run --tasks 40 --concurrency 8 --llm-latency 0.8 --out bench/results/run.json
+    python -m bench.run --compare bench/results/a.json bench/results/b.json
+"""
+import argparse, asyncio, itertools, json, os, pathlib, platform, subprocess, sys, tempfile, time, uuid
+from typing import Dict, List, Optional
+import httpx
+from .fakes import FakeEvaluator, FakeGitHub, FakeLLM, free_port, serve
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+DEFAULT_TASKS = pathlib.Path(__file__).with_name("tasks.jsonl")
+SECRET = "bench-secret"
+QUANTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+
+# ---------- stats ----------
+def quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    s = sorted(values)
+    out = {"count": len(s), "mean": round(sum(s) / len(s), 4) if s else 0.0}
+    out.update({name: round(quantile(s, q), 4) for name, q in QUANTILES.items()})
+    out["max"] = round(s[-1], 4) if s else 0.0
+    return out
+
+# ---------- workload ----------
+def load_tasks(path: pathlib.Path) -> List[List[dict]]:
+    """TaskRequest lines grouped by task, each group ordered by round."""
+    groups: Dict[str, List[dict]] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            t = json.loads(line)
+            groups.setdefault(t["task"], []).append(t)
+    return [sorted(g, key=lambda t: t["round"]) for g in groups.values()]
+
+def expand(groups: List[List[dict]], n: int, run_id: str, eval_url: str, rounds: int) -> List[List[dict]]:
+    """`n` task sequences cycling over the templates; names/nonces are made unique per run."""
+    out = []
+    for i, group in zip(range(n), itertools.cycle(groups)):
+        seq = []
+        for t in group:
+            if t["round"] > rounds:
+                continue
+            seq.append(dict(t, task=f"{t['task']}-{run_id}-{i}", nonce=f"{t['nonce']}-{run_id}-{i}",
+                            secret=SECRET, evaluation_url=eval_url))
+        out.append(seq)
+    return out
+
+# ---------- harness ----------
+def start_server(port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=str(ROOT), env=dict(os.environ, **env), stdout=log, stderr=subprocess.STDOUT)
+
+def start_workers(n: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen([sys.executable, "-m", "api.worker", "--processes", str(n)],
+                            cwd=str(ROOT), env=dict(os.environ, **env), stdout=log, stderr=subprocess.STDOUT)
+
+async def wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"api server exited with {proc.returncode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:  # warm-up finished
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("api server did not become ready")
+
+async def run_round(client: httpx.AsyncClient, evaluator: FakeEvaluator, task: dict,
+                    timeout: float, stats: dict) -> dict:
+    rec = {"task": task["task"], "round": task["round"]}
+    t0 = time.time()
+    while True:
+        r = await client.post("/task", json=task)
+        if r.status_code != 503:
+            break
+        stats["rejected"] += 1
+        await asyncio.sleep(0.25)
+    rec["submit_s"] = time.time() - t0
+    if r.status_code != 200:
+        rec.update(status="http_error", error=f"HTTP {r.status_code}: {r.text[:200]}")
+        return rec
+    job_id = r.json()["job_id"]
+
+    job = {}
+    while time.time() - t0 < timeout:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job.get("status") not in ("queued", "running"):
+            break
+        await asyncio.sleep(0.05)
+    rec.update(status=job.get("status", "timeout"), queue_wait_s=job.get("queue_wait_s"),
+               run_time_s=job.get("run_time_s"), stages=job.get("stages", []))
+    if job.get("status") != "done":
+        rec["error"] = job.get("error", "job did not finish in time")
+        return rec
+
+    key = (task["task"], task["round"], task["nonce"])
+    got = await asyncio.to_thread(evaluator.wait, key, max(0.0, timeout - (time.time() - t0)))
+    if got is None:
+        rec.update(status="not_notified", error="evaluator never received the notification")
+        return rec
+    rec["end_to_end_s"] = got[0] - t0
+    return rec
+
+async def drive(base_url: str, evaluator: FakeEvaluator, sequences: List[List[dict]],
+                concurrency: int, timeout: float, proc: subprocess.Popen) -> dict:
+    stats = {"rejected": 0}
+    records: List[dict] = []
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency * 2 + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        await wait_ready(client, proc)
+
+        async def one(seq: List[dict]):
+            async with sem:
+                for task in seq:
+                    rec = await run_round(client, evaluator, task, timeout, stats)
+                    records.append(rec)
+                    if rec["status"] != "done":
+                        break  # round 2 needs the round-1 repo
+
+        t0 = time.time()
+        await asyncio.gather(*(one(s) for s in sequences))
+        wall = time.time() - t0
+        server_jobs = (await client.get("/jobs")).json()
+    return {"records": records, "wall_s": wall, "rejected": stats["rejected"], "server_jobs": server_jobs}
+
+def report(result: dict, config: dict, llm: FakeLLM, gh: FakeGitHub, evaluator: FakeEvaluator) -> dict:
+    records = result["records"]
+    ok = [r for r in records if "end_to_end_s" in r]
+    latency = {
+        "end_to_end": summarize([r["end_to_end_s"] for r in ok]),
+        "submit": summarize([r["submit_s"] for r in records]),
+        "queue_wait": summarize([r["queue_wait_s"] for r in ok if r.get("queue_wait_s") is not None]),
+        "run": summarize([r["run_time_s"] for r in ok if r.get("run_time_s") is not None]),
+    }
+    by_round = {str(n): summarize([r["end_to_end_s"] for r in ok if r["round"] == n])
+                for n in sorted({r["round"] for r in records})}
+    # a stage can run more than once per job (e.g. guardrails); sum per job first
+    per_stage: Dict[str, List[float]] = {}
+    for r in ok:
+        totals: Dict[str, float] = {}
+        for s in r["stages"]:
+            totals[s["stage"]] = totals.get(s["stage"], 0.0) + s["seconds"]
+        for name, v in totals.items():
+            per_stage.setdefault(name, []).append(v)
+    errors: Dict[str, int] = {}
+    for r in records:
+        if r["status"] != "done" or "end_to_end_s" not in r:
+            errors[r.get("error", r["status"])[:200]] = errors.get(r.get("error", r["status"])[:200], 0) + 1
+    return {
+        "config": config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "wall_s": round(result["wall_s"], 3),
+        "submitted": len(records),
+        "completed": len(ok),
+        "failed": len(records) - len(ok),
+        "rejected_503": result["rejected"],
+        "tasks_per_s": round(len(ok) / result["wall_s"], 3) if result["wall_s"] else 0.0,
+        "latency_s": latency,
+        "end_to_end_by_round_s": by_round,
+        "stages_s": {k: summarize(v) for k, v in sorted(per_stage.items())},
+        "fakes": {"llm_calls": llm.calls, "llm_throttled": llm.throttled, "llm_peak_concurrency": llm.peak,
+                  "github_calls": gh.calls, "evaluator_attempts": evaluator.attempts,
+                  "evaluator_premature": evaluator.premature},
+        "server_jobs": result["server_jobs"],
+        "errors": errors,
+    }
+
+def compare(paths: List[str]) -> None:
+    runs = [json.loads(pathlib.Path(p).read_text()) for p in paths]
+    rows = [("tasks/s", lambda r: r["tasks_per_s"])]
+    for key in ("end_to_end", "queue_wait", "run"):
+        for q in QUANTILES:
+            rows.append((f"{key} {q}", lambda r, k=key, q=q: r["latency_s"][k][q]))
+    stages = sorted(set().union(*(r["stages_s"] for r in runs)))
+    for s in stages:
+        rows.append((f"{s} p95", lambda r, s=s: r["stages_s"].get(s, {}).get("p95", float("nan"))))
+    width = max(len(name) for name, _ in rows)
+    print(" " * width, *(f"{pathlib.Path(p).stem[:14]:>14}" for p in paths))
+    for name, get in rows:
+        print(f"{name:<{width}}", *(f"{get(r):>14.4f}" for r in runs))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", default=str(DEFAULT_TASKS), help="JSONL of TaskRequest templates")
+    ap.add_argument("--tasks", type=int, default=20, help="task sequences to run (templates are cycled)")
+    ap.add_argument("--rounds", type=int, default=2, choices=(1, 2))
+    ap.add_argument("--concurrency", type=int, default=8, help="task sequences in flight")
+    ap.add_argument("--workers", type=int, default=4, help="WORKER_COUNT of the server")
+    ap.add_argument("--queue-max", type=int, default=64, help="QUEUE_MAX of the server")
+    ap.add_argument("--worker-processes", type=int, default=0,
+                    help="run builds in this many `api.worker` processes (TASK_QUEUE=sqlite)")
+    ap.add_argument("--llm-latency", type=float, default=0.5)
+    ap.add_argument("--llm-jitter", type=float, default=0.1)
+    ap.add_argument("--llm-capacity", type=int, default=0, help="concurrent LLM calls before the fake answers 429")
+    ap.add_argument("--llm-defect-rate", type=float, default=0.0, help="share of app answers missing an element")
+    ap.add_argument("--llm-cache", action="store_true", help="leave the LLM response cache on")
+    ap.add_argument("--no-stream", action="store_true", help="LLM_STREAM=false")
+    ap.add_argument("--gh-latency", type=float, default=0.02, help="seconds added to each fake GitHub call")
+    ap.add_argument("--pages-delay", type=float, default=1.0, help="seconds before a push is live on fake Pages")
+    ap.add_argument("--eval-fail-rate", type=float, default=0.0, help="share of notifications answered 503")
+    ap.add_argument("--timeout", type=float, default=300, help="per-round timeout in seconds")
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra server settings")
+    ap.add_argument("--out", default="", help="write the JSON report here (default: stdout only)")
+    ap.add_argument("--compare", nargs="+", metavar="REPORT", help="print a side-by-side of saved reports")
+    args = ap.parse_args(argv)
+    if args.compare:
+        compare(args.compare)
+        return 0
+
+    llm = FakeLLM(latency=args.llm_latency, jitter=args.llm_jitter, capacity=args.llm_capacity,
+                  defect_rate=args.llm_defect_rate)
+    gh = FakeGitHub(latency=args.gh_latency, pages_delay=args.pages_delay)
+    evaluator = FakeEvaluator(fail_rate=args.eval_fail_rate, gh=gh)
+    ports = {name: free_port() for name in ("llm", "gh", "eval", "api")}
+    serve(llm.app, ports["llm"])
+    serve(gh.app, ports["gh"])
+    serve(evaluator.app, ports["eval"])
+
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    env = {
+        "EXPECTED_SECRET": SECRET,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['llm']}/v1",
+        "GITHUB_USERNAME": "bench",
+        "GITHUB_TOKEN": "bench",
+        "GITHUB_API_URL": f"http://127.0.0.1:{ports['gh']}",
+        "PREFERRED_DRIVER": "api",
+        "WORKER_COUNT": str(args.workers),
+        "QUEUE_MAX": str(args.queue_max),
+        "LLM_CACHE_ENABLED": "true" if args.llm_cache else "false",
+        "LLM_CACHE_DIR": os.path.join(scratch, "llm_cache"),
+        "LLM_STREAM": "false" if args.no_stream else "true",
+        "NOTIFY_OUTBOX_PATH": os.path.join(scratch, "outbox.sqlite3"),
+        "MIRROR_DIR": os.path.join(scratch, "mirrors"),
+        "TASK_QUEUE_PATH": os.path.join(scratch, "tasks.sqlite3"),
+        "TASK_SPOOL_DIR": os.path.join(scratch, "spool"),
+        "PAGES_POLL_MIN_S": "0.2",
+        "PAGES_POLL_MAX_S": "1",
+    }
+    if args.worker_processes:
+        env["TASK_QUEUE"] = "sqlite"
+        env["TASK_POLL_S"] = "0.05"
+    env.update(kv.split("=", 1) for kv in args.env)
+
+    run_id = uuid.uuid4().hex[:6]
+    sequences = expand(load_tasks(pathlib.Path(args.requests)), args.tasks, run_id,
+                       f"http://127.0.0.1:{ports['eval']}/notify", args.rounds)
+    log_path = os.path.join(scratch, "server.log")
+    proc = start_server(ports["api"], env, log_path)
+    workers = start_workers(args.worker_processes, env, os.path.join(scratch, "workers.log")) \
+        if args.worker_processes else None
+    try:
+        result = asyncio.run(drive(f"http://127.0.0.1:{ports['api']}", evaluator, sequences,
+                                   args.concurrency, args.timeout, proc))
+    finally:
+        for p in filter(None, (proc, workers)):
+            p.terminate()
+            try:
+                p.wait(10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("compare", "out")}
+    config["run_id"] = run_id
+    config["server_log"] = log_path
+    out = report(result, config, llm, gh, evaluator)
+    text = json.dumps(out, indent=2)
+    if args.out:
+        pathlib.Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(args.out).write_text(text + "\n", encoding="utf-8")
+        print(f"wrote {args.out}")
+    lat = out["latency_s"]["end_to_end"]
+    print(f"{out['completed']}/{out['submitted']} rounds in {out['wall_s']}s "
+          f"({out['tasks_per_s']} tasks/s); end-to-end p50={lat['p50']}s p95={lat['p95']}s p99={lat['p99']}s")
+    if not args.out:
+        print(text)
+    return 0 if out["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Cold-start budget: how long `import api.server` takes in a fresh interpreter
+(from `python -X importtime`, with the slowest modules listed), and with
+--serve, how long uvicorn takes from launch to the first served request and
+to GET /ready returning 200. Exits 1 when a budget is exceeded.
+
+    python scripts/cold_start.py                       # import budget only
+    python scripts/cold_start.py --serve --top 15
+    python scripts/cold_start.py --budget-ms 400 --serve --ready-budget-s 10
+"""
+import argparse, os, pathlib, socket, subprocess, sys, time
+import urllib.request, urllib.error
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+def import_times(module: str):
+    """(total microseconds, [(cumulative us, self us, module)]) for importing `module`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=str(ROOT), env=dict(os.environ, PYTHONPATH=str(ROOT)),
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cum_us), int(self_us), name.rstrip()))
+    total = next(cum for cum, _, name in reversed(rows) if name.strip() == module)
+    return total, rows
+
+def _get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def serve_times(timeout: float):
+    """Seconds from launching uvicorn to the first response, and to /ready == 200."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.server:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"],
+                            cwd=str(ROOT), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise SystemExit(f"server exited with {proc.returncode}")
+            try:
+                status = _get(base + "/ready")
+            except OSError:
+                time.sleep(0.01)
+                continue
+            if first is None:
+                first = time.perf_counter() - start
+            if status == 200:
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+    return first, ready
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default="api.server")
+    ap.add_argument("--budget-ms", type=float, default=350, help="import budget for --module")
+    ap.add_argument("--top", type=int, default=10, help="slowest modules to list (by self time)")
+    ap.add_argument("--serve", action="store_true", help="also time uvicorn start-up and /ready")
+    ap.add_argument("--first-budget-s", type=float, default=2.0, help="launch -> first served request")
+    ap.add_argument("--ready-budget-s", type=float, default=15.0, help="launch -> /ready 200")
+    args = ap.parse_args(argv)
+
+    over = False
+    total, rows = import_times(args.module)
+    print(f"import {args.module}: {total / 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for cum, own, name in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"  {own / 1000:8.1f} ms self {cum / 1000:8.1f} ms cumulative  {name.strip()}")
+    over |= total / 1000 > args.budget_ms
+
+    if args.serve:
+        first, ready = serve_times(max(args.ready_budget_s, args.first_budget_s) * 2)
+        print(f"first response: {first:.2f}s (budget {args.first_budget_s}s)" if first is not None
+              else "first response: never")
+        print(f"/ready: {ready:.2f}s (budget {args.ready_budget_s}s)" if ready is not None
+              else "/ready: never returned 200")
+        over |= first is None or first > args.first_budget_s
+        over |= ready is None or ready > args.ready_budget_s
+
+    if over:
+        print("OVER BUDGET")
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Per-task CPU and allocation cost of the constant material every build
+handles: the LICENSE/Pages-workflow scaffold, the synthesis prompt, the
+fence parsing of a completion, and the data-URI decode of an attachment.
+Each step runs the way it did before the precomputed/memoised versions
+(reproduced below) and as it does now, and the table shows CPU time per call
+and bytes allocated per call (tracemalloc peak).
+
+    python scripts/task_overhead.py
+    python scripts/task_overhead.py --iterations 2000 --attachment-mb 8
+"""
+import argparse, base64, os, pathlib, re, sys, time, tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from api import gh_api, llm, data_uri  # noqa: E402
+from api.settings import settings  # noqa: E402
+
+# ---------- previous implementations ----------
+def scaffold_before(username: str) -> dict:
+    return {
+        "LICENSE": gh_api.MIT_LICENSE.replace("%YEAR%", time.strftime("%Y")).replace("%AUTHOR%", username),
+        ".github/workflows/pages.yml": gh_api.PAGES_WORKFLOW.replace("%BRANCH%", settings.DEFAULT_BRANCH),
+    }
+
+def prompt_before(seed: str, var_lines: str, brief: str, checks_text: str, attach_list: list) -> str:
+    return f"""
+You are generating a minimal static web app with exactly two files: index.html and app.js.
+
+Rules:
+- Satisfy the brief and all checks.
+- Required selectors (e.g. #total-sales, #github-created-at) must exist and be updated by JS.
+- If a title is required, set document.title.
+- If Bootstrap is required, include a <link> whose href contains 'bootstrap'.
+- If 'highlight.js' is required, include its script and call highlightElement on code blocks.
+- If attachments are referenced, use fetch('<filename>') where filename is one of: {attach_list or "[]"}.
+- Use vanilla JS and CDN links (Bootstrap 5 via jsDelivr, marked, highlight.js).
+- Keep total output < 200 lines.
+
+Seed/context variables:
+- seed: {seed}
+{var_lines}
+
+Brief:
+{brief}
+
+Checks to satisfy:
+{checks_text}
+
+Output FORMAT (strict):
+<<INDEX_HTML>>
+[the full HTML file here]
+<</INDEX_HTML>>
+
+<<APP_JS>>
+[the full JS file here]
+<</APP_JS>>
+"""
+
+_FENCE_RE = re.compile(r"<<(INDEX_HTML|APP_JS)>>\s*([\s\S]*?)\s*<</\1>>", re.IGNORECASE)
+
+def blocks_before(text: str):
+    html, js = "", ""
+    for kind, body in _FENCE_RE.findall(text):
+        if kind.upper() == "INDEX_HTML": html = body.strip()
+        elif kind.upper() == "APP_JS":   js = body.strip()
+    return html, js
+
+_DATA_URI_RE = re.compile(r"^data:([^;]+);base64,(.+)$", re.IGNORECASE)
+
+def data_uri_before(uri: str):
+    m = _DATA_URI_RE.match(uri)
+    mime, b64 = m.groups()
+    return mime, base64.b64decode(b64)
+
+# ---------- measurement ----------
+def measure(fn, iterations: int):
+    """(CPU microseconds per call, peak bytes allocated during one call)."""
+    fn()  # warm caches, as a long-running worker would have
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    cpu = (time.process_time() - start) / iterations
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu * 1e6, peak
+
+def cases(attachment_mb: float):
+    checks = [f"document.querySelector('#metric-{i}') shows the total for region {i}" for i in range(12)]
+    checks_text = "\n".join(f"- {c}" for c in checks)
+    var_lines = "- round: 1"
+    brief = "Publish a single-page site that fetches data.csv and shows per-region totals. " * 20
+    attach_list = ["data.csv"]
+    completion = ("Here you go.\n<<INDEX_HTML>>\n" + "<div class='row'>cell</div>\n" * 400 + "<</INDEX_HTML>>\n\n"
+                  "<<APP_JS>>\n" + "document.querySelector('#x').textContent = 1;\n" * 400 + "<</APP_JS>>\n")
+    uri = "data:text/csv;base64," + base64.b64encode(os.urandom(int(attachment_mb * 1024 * 1024))).decode()
+    return [
+        ("scaffold", lambda: scaffold_before("octocat"), lambda: gh_api.scaffold_files("octocat")),
+        ("synthesis prompt", lambda: prompt_before("1a2b3c4d", var_lines, brief, checks_text, attach_list),
+         lambda: llm._synth_prompt("1a2b3c4d", var_lines, brief, checks_text, attach_list)),
+        ("fence parsing", lambda: blocks_before(completion), lambda: llm._extract_blocks(completion)),
+        (f"data URI ({attachment_mb:g} MB)", lambda: data_uri_before(uri), lambda: data_uri.decode_data_uri(uri)),
+    ]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=500)
+    ap.add_argument("--attachment-mb", type=float, default=4.0)
+    args = ap.parse_args(argv)
+
+    print(f"{'step':<22}{'before us':>12}{'after us':>12}{'before KiB':>13}{'after KiB':>12}")
+    totals = [0.0, 0.0, 0, 0]
+    for name, before, after in cases(args.attachment_mb):
+        n = max(1, args.iterations // 50) if name.startswith("data URI") else args.iterations
+        cpu_b, mem_b = measure(before, n)
+        cpu_a, mem_a = measure(after, n)
+        for i, v in enumerate((cpu_b, cpu_a, mem_b, mem_a)):
+            totals[i] += v
+        print(f"{name:<22}{cpu_b:>12.1f}{cpu_a:>12.1f}{mem_b / 1024:>13.1f}{mem_a / 1024:>12.1f}")
+    print(f"{'per task':<22}{totals[0]:>12.1f}{totals[1]:>12.1f}{totals[2] / 1024:>13.1f}{totals[3] / 1024:>12.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,5 +8,10 @@ echo "OPENAI_API_KEY set?: ${OPENAI_API_KEY:+yes}"
 echo "EXPECTED_SECRET=${EXPECTED_SECRET:-<not set>}"
 echo "GITHUB_USERNAME=${GITHUB_USERNAME:-<not set>}"
 
+# TASK_QUEUE=sqlite: builds run in separate worker processes next to the API
+if [ "${TASK_QUEUE:-local}" = "sqlite" ]; then
+  python -m api.worker --processes "${WORKER_PROCESSES:-2}" &
+fi
+
 # Run uvicorn on port 7860
 exec uvicorn api.server:app --host 0.0.0.0 --port 7860 --proxy-headers